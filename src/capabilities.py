@@ -0,0 +1,236 @@
+import ftplib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+# 能力档案的有效期（秒），过期后重新协商（服务器升级或更换后能力可能变化）
+PROFILE_MAX_AGE = 30 * 86400
+# 服务器不支持UTF8时依次尝试的文件名编码
+LEGACY_ENCODINGS = ['utf-8', 'gbk', 'latin-1']
+
+
+class ServerCapabilities:
+    """
+    FTP服务器能力（基于FEAT响应），以及协商得到的文件名编码和MLSD是否可用；
+    每台主机协商一次后保存在ServerProfileStore中，之后的连接直接使用，不再靠失败重试来试探
+    """
+    def __init__(self, features: Optional[Dict[str, str]] = None, encoding: str = 'utf-8',
+                 utf8: bool = False, mlsd: Optional[bool] = None, probed_at: Optional[float] = None,
+                 list_command: str = 'LIST', clock_skew: Optional[float] = None, site_utime: Optional[bool] = None):
+        """
+        :param features: 特性名（大写）到参数的映射，例如 {'MLST': 'type*;size*;modify*;'}
+        :param encoding: 文件名编码
+        :param utf8: 服务器接受OPTS UTF8 ON（每条新连接都需发送一次）
+        :param mlsd: MLSD是否可用，None表示未知（列目录时先尝试MLSD）
+        :param probed_at: 协商时间
+        :param list_command: MLSD不可用时列目录的命令（服务器接受时为"LIST -a"，列表包含隐藏文件）
+        :param clock_skew: 测得的服务器时钟偏差（秒），None表示尚未测量（见RemoteMtime.probe_session）
+        :param site_utime: SITE UTIME是否可用，None表示未知
+        """
+        self.features = features or {}
+        self.encoding = encoding
+        self.utf8 = utf8
+        self.mlsd = mlsd
+        self.probed_at = probed_at
+        self.list_command = list_command
+        self.clock_skew = clock_skew
+        self.site_utime = site_utime
+
+    @classmethod
+    def probe(cls, ftp: ftplib.FTP) -> 'ServerCapabilities':
+        """发送FEAT获取服务器支持的扩展命令，服务器不支持FEAT时返回空能力"""
+        try:
+            resp = ftp.sendcmd('FEAT')
+        except ftplib.all_errors:
+            return cls()
+        return cls(cls.parse_feat(resp))
+
+    @classmethod
+    def negotiate(cls, ftp: ftplib.FTP) -> 'ServerCapabilities':
+        """
+        完整协商一次：FEAT、OPTS UTF8 ON，再在当前目录试列一次MLSD确认其可用（不可用时试列LIST -a）；
+        服务器不使用UTF8时按试列得到的文件名推断编码。结果已应用到ftp
+        """
+        capabilities = cls.probe(ftp)
+        capabilities.probed_at = time.time()
+        try:
+            ftp.sendcmd('OPTS UTF8 ON')
+            capabilities.utf8 = True
+        except ftplib.all_errors:
+            # 声明了UTF8特性的服务器默认即使用UTF8（RFC 2640）
+            capabilities.utf8 = False
+        # 以latin-1读取列表，得到原始字节用于推断编码
+        ftp.encoding = 'latin-1'
+        lines = []
+        try:
+            ftp.retrlines('MLSD', lines.append)
+            capabilities.mlsd = True
+        except ftplib.error_perm:
+            capabilities.mlsd = False
+        except ftplib.all_errors:
+            # 临时错误时不下结论，列目录时仍先尝试MLSD
+            capabilities.mlsd = None
+        if capabilities.mlsd is False:
+            # 与实际使用时一样带上路径试列（部分服务器只接受不带路径的"LIST -a"）
+            lines = []
+            try:
+                cwd = ftp.pwd()
+                ftp.retrlines(f'LIST -a {cwd}', lines.append)
+                capabilities.list_command = 'LIST -a'
+            except ftplib.all_errors:
+                lines = []
+                try:
+                    ftp.retrlines('LIST', lines.append)
+                except ftplib.all_errors:
+                    pass
+        if capabilities.utf8 or capabilities.supports('UTF8'):
+            capabilities.encoding = 'utf-8'
+        else:
+            capabilities.encoding = cls.detect_encoding(lines)
+        ftp.encoding = capabilities.encoding
+        return capabilities
+
+    @staticmethod
+    def detect_encoding(lines: List[str]) -> str:
+        """按以latin-1读取的列表行推断文件名编码：取第一个能解码全部行的编码"""
+        raw = '\n'.join(lines).encode('latin-1')
+        for encoding in LEGACY_ENCODINGS:
+            try:
+                raw.decode(encoding)
+                return encoding
+            except UnicodeDecodeError:
+                continue
+        return LEGACY_ENCODINGS[-1]
+
+    def apply(self, ftp: ftplib.FTP):
+        """把协商结果应用到一条新连接"""
+        if self.utf8:
+            try:
+                ftp.sendcmd('OPTS UTF8 ON')
+            except ftplib.all_errors:
+                pass
+        ftp.encoding = self.encoding
+
+    def to_dict(self) -> dict:
+        return {
+            'features': self.features,
+            'encoding': self.encoding,
+            'utf8': self.utf8,
+            'mlsd': self.mlsd,
+            'probed_at': self.probed_at,
+            'list_command': self.list_command,
+            'clock_skew': self.clock_skew,
+            'site_utime': self.site_utime,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ServerCapabilities':
+        return cls(data.get('features'), data.get('encoding', 'utf-8'), data.get('utf8', False),
+                   data.get('mlsd'), data.get('probed_at'), data.get('list_command', 'LIST'),
+                   data.get('clock_skew'), data.get('site_utime'))
+
+    @staticmethod
+    def parse_feat(resp: str) -> Dict[str, str]:
+        """解析FEAT多行响应，首尾两行为状态行，中间每行一个特性"""
+        features = {}
+        for line in resp.splitlines()[1:-1]:
+            line = line.strip()
+            if not line:
+                continue
+            name, _, params = line.partition(' ')
+            features[name.upper()] = params.strip()
+        return features
+
+    def supports(self, name: str) -> bool:
+        """是否支持指定的扩展命令"""
+        return name.upper() in self.features
+
+    @property
+    def use_mlsd(self) -> bool:
+        """列目录时是否使用MLSD（确认不可用时直接使用NLST）"""
+        return self.mlsd is not False
+
+    @property
+    def rest_stream(self) -> bool:
+        """是否支持REST续传；服务器不支持FEAT时无从得知，按支持处理"""
+        if not self.features:
+            return True
+        return self.features.get('REST', '').upper() == 'STREAM'
+
+    def hash_algorithms(self) -> List[str]:
+        """HASH命令支持的算法（大写，如 SHA-256），当前选中的算法排在最前"""
+        params = self.features.get('HASH')
+        if not params:
+            return []
+        selected, others = [], []
+        for algo in params.split(';'):
+            algo = algo.strip()
+            if not algo:
+                continue
+            if algo.endswith('*'):
+                selected.append(algo[:-1].upper())
+            else:
+                others.append(algo.upper())
+        return selected + others
+
+
+class ServerProfileStore:
+    """服务器能力档案库（SQLite）：按主机保存协商结果，有效期内的连接无需重新协商"""
+    def __init__(self, db_path: str, max_age: float = PROFILE_MAX_AGE):
+        """
+        :param db_path: 数据库文件路径
+        :param max_age: 档案有效期（秒）
+        """
+        self.db_path = db_path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS servers (
+                    host TEXT PRIMARY KEY,
+                    profile TEXT NOT NULL,
+                    probed_at REAL
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, host: str) -> Optional[ServerCapabilities]:
+        """获取主机的能力档案，不存在或已过期时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT profile, probed_at FROM servers WHERE host=?", (host,)
+            ).fetchone()
+        if row is None or row[1] is None or time.time() - row[1] > self.max_age:
+            return None
+        try:
+            return ServerCapabilities.from_dict(json.loads(row[0]))
+        except (ValueError, TypeError):
+            return None
+
+    def save(self, host: str, capabilities: ServerCapabilities):
+        """保存主机的能力档案"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO servers (host, profile, probed_at) VALUES (?, ?, ?)",
+                (host, json.dumps(capabilities.to_dict()), capabilities.probed_at)
+            )
+            self._conn.commit()
+
+    def load(self, ftp: ftplib.FTP) -> ServerCapabilities:
+        """取得连接所在主机的能力并应用到ftp：有未过期的档案时直接使用，否则协商一次并保存"""
+        host = getattr(ftp, 'host', '')
+        capabilities = self.get(host)
+        if capabilities is not None:
+            capabilities.apply(ftp)
+            return capabilities
+        capabilities = ServerCapabilities.negotiate(ftp)
+        self.save(host, capabilities)
+        return capabilities
+
+    def close(self):
+        """关闭数据库"""
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,225 @@
+import argparse
+import json
+import logging
+import os
+import signal
+import sys
+import threading
+import time
+
+import config
+from utils import schedule_interval_seconds, seconds_until
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONFIG = '~/.config/nodcat/config.json'
+
+# 退出码
+EXIT_OK = 0
+EXIT_SYNC_FAILED = 1
+EXIT_USAGE = 2
+EXIT_ERROR = 3
+EXIT_INTERRUPTED = 130
+
+
+class JsonReporter:
+    """以JSON Lines格式向标准输出写事件，便于cron/systemd及其他程序解析"""
+    def __init__(self, stream=None, quiet: bool = False):
+        self.stream = stream or sys.stdout
+        self.quiet = quiet
+
+    def emit(self, event: str, **fields):
+        """输出一条事件"""
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        self.stream.write(json.dumps(record, ensure_ascii=False) + '\n')
+        self.stream.flush()
+
+    def plan(self, plan):
+        """同步计划回调：输出计划统计"""
+        self.emit('plan', **plan.summary())
+
+    def progress(self, snapshot):
+        """同步进度回调（ProgressSnapshot，已按固定间隔合并）：输出字节和动作计数，测得速率后附带速率和剩余秒数"""
+        if self.quiet:
+            return
+        fields = {
+            'percent': snapshot.percent,
+            'message': snapshot.message,
+            'bytes': snapshot.bytes_done,
+            'total_bytes': snapshot.bytes_total,
+            'items': snapshot.items_done,
+            'total_items': snapshot.items_total,
+        }
+        if snapshot.rate is not None:
+            fields['rate'] = round(snapshot.rate)
+        if snapshot.eta is not None:
+            fields['eta'] = round(snapshot.eta, 1)
+        self.emit('progress', **fields)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """命令行参数：不带子命令时启动图形界面"""
+    parser = argparse.ArgumentParser(prog='nodcat', description='NodCat FTP 同步工具')
+    parser.add_argument('--config', default=DEFAULT_CONFIG,
+                        help=f'Path to config file (default: {DEFAULT_CONFIG})')
+    commands = parser.add_subparsers(dest='command')
+
+    sync_parser = commands.add_parser('sync', help='执行一次同步后退出')
+    _add_sync_arguments(sync_parser)
+    sync_parser.add_argument('--dry-run', action='store_true', help='只比对并输出同步计划，不修改远程和本地')
+
+    daemon_parser = commands.add_parser('daemon', help='常驻运行，按配置中的定时设置同步')
+    _add_sync_arguments(daemon_parser)
+    daemon_parser.add_argument('--run-now', action='store_true', help='启动后立即同步一次')
+    daemon_parser.add_argument('--watch', action='store_true',
+                               help='监视本地目录，变化后数秒内增量推送（也可在配置中设置watch.enabled）')
+    return parser
+
+
+def _add_sync_arguments(parser: argparse.ArgumentParser):
+    """sync与daemon共用的参数，未指定的取配置文件中的值"""
+    # 子命令后也可以指定--config，未指定时保留主命令的值
+    parser.add_argument('--config', default=argparse.SUPPRESS, help='Path to config file')
+    parser.add_argument('--local', help='本地目录（默认取配置中的local_path）')
+    parser.add_argument('--remote', help='远程目录（默认取配置中的ftp.remote_path）')
+    parser.add_argument('--direction', choices=('push', 'pull', 'both'),
+                        help='同步方向：push本地到远程，pull远程到本地，both双向（默认取配置中的sync.direction）')
+    parser.add_argument('--full-verify', action='store_true', help='重新列出全部远程目录进行完整校验')
+    parser.add_argument('--quiet', action='store_true', help='不输出进度事件')
+
+
+def run_once(args, app_config: dict, reporter: JsonReporter, paths=None) -> int:
+    """执行一次同步，返回退出码；paths不为None时只同步这些相对路径"""
+    from sync import run_sync
+
+    ftp_config = app_config.get('ftp', {})
+    local_path = args.local or app_config.get('local_path', '')
+    remote_path = args.remote or ftp_config.get('remote_path', '')
+    missing = [key for key in ('host', 'username', 'password') if not ftp_config.get(key)]
+    if missing or not local_path or not remote_path:
+        reporter.emit('error', message='配置不完整：需要ftp.host/username/password、本地目录和远程目录')
+        return EXIT_USAGE
+
+    dry_run = getattr(args, 'dry_run', False)
+    if paths is None:
+        reporter.emit('start', local=local_path, remote=remote_path, dry_run=dry_run)
+    else:
+        reporter.emit('start', local=local_path, remote=remote_path, paths=len(paths))
+    started = time.monotonic()
+    try:
+        plan = run_sync(ftp_config, app_config.get('sync', {}), local_path, remote_path,
+                        progress_callback=reporter.progress,
+                        full_verify=True if args.full_verify else None,
+                        paths=paths, dry_run=dry_run, plan_callback=reporter.plan, direction=args.direction)
+    except Exception as e:
+        reporter.emit('error', message=str(e), elapsed=round(time.monotonic() - started, 3))
+        return EXIT_SYNC_FAILED
+    if plan is not None and plan.failures:
+        reporter.emit('error', message=f"{len(plan.failures)} 个条目未能同步",
+                      failures=[{'path': path, 'error': error} for path, error in sorted(plan.failures.items())],
+                      elapsed=round(time.monotonic() - started, 3))
+        return EXIT_SYNC_FAILED
+    reporter.emit('done', elapsed=round(time.monotonic() - started, 3))
+    return EXIT_OK
+
+
+def reload_config(app_config: dict, reporter: JsonReporter) -> dict:
+    """重新读取配置文件，读取失败时报告并沿用原来的配置（守护进程不因配置改坏而退出）"""
+    try:
+        return config.load_config()
+    except (OSError, ValueError) as e:
+        reporter.emit('error', message=f"无法读取配置文件 {config.CONFIG_FILE}，沿用原配置: {str(e)}")
+        return app_config
+
+
+def run_daemon(args, app_config: dict, reporter: JsonReporter) -> int:
+    """常驻运行：按schedule配置的时间和频率触发同步，收到SIGTERM/SIGINT后在空闲时退出"""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    signal.signal(signal.SIGINT, lambda signum, frame: stop.set())
+
+    if args.watch or app_config.get('watch', {}).get('enabled'):
+        return run_watch(args, app_config, reporter, stop)
+    schedule = app_config.get('schedule', {})
+    delay = 0 if args.run_now else seconds_until(schedule.get('time', '00:00'))
+    while True:
+        reporter.emit('scheduled', next_run=round(time.time() + delay, 3))
+        if stop.wait(delay):
+            break
+        # 每次同步前重新读取配置，修改配置无需重启守护进程
+        app_config = reload_config(app_config, reporter)
+        run_once(args, app_config, reporter)
+        delay = schedule_interval_seconds(app_config.get('schedule', {}).get('frequency'))
+    reporter.emit('stopped')
+    return EXIT_OK
+
+
+def run_watch(args, app_config: dict, reporter: JsonReporter, stop: threading.Event) -> int:
+    """监视模式：启动时完整核对一次，之后只推送变化的路径，并定期完整核对作为兜底"""
+    from ignore import IgnoreMatcher
+    from sync import SYNC_PUSH
+    from watch import create_watcher, run_watch_loop
+
+    # 监视的是本地变化，只能推送到远程；拉取或双向同步会按远程删除刚在本地新建的文件
+    direction = args.direction or app_config.get('sync', {}).get('direction', SYNC_PUSH)
+    if direction != SYNC_PUSH:
+        reporter.emit('error', message=f"监视模式只支持push方向，当前为{direction}")
+        return EXIT_USAGE
+    local_path = args.local or app_config.get('local_path', '')
+    if not os.path.isdir(local_path):
+        reporter.emit('error', message=f"本地路径不是目录: {local_path}")
+        return EXIT_USAGE
+    watch_config = app_config.get('watch', {})
+    ignore = IgnoreMatcher(local_path, app_config.get('sync', {}).get('ignore', ()))
+    watcher = create_watcher(local_path, watch_config.get('poll_interval', 10), ignore)
+    reporter.emit('watching', local=local_path, watcher=type(watcher).__name__)
+
+    def full_sync():
+        return run_once(args, reload_config(app_config, reporter), reporter) == EXIT_OK
+
+    def sync_paths(paths):
+        return run_once(args, reload_config(app_config, reporter), reporter, paths=sorted(paths)) == EXIT_OK
+
+    try:
+        full_sync()
+        run_watch_loop(
+            watcher, sync_paths, full_sync, stop.is_set,
+            debounce=watch_config.get('debounce_seconds', 2),
+            full_interval=watch_config.get('full_sync_hours', 24) * 3600
+        )
+    finally:
+        watcher.close()
+    reporter.emit('stopped')
+    return EXIT_OK
+
+
+def main(argv=None) -> int:
+    """程序入口：sync/daemon在无界面环境下运行，不加载PyQt"""
+    args = build_parser().parse_args(argv)
+    config.CONFIG_FILE = args.config
+    # 诊断信息写到stderr，stdout只输出JSON Lines事件
+    logging.basicConfig(stream=sys.stderr, level=logging.INFO, format='%(message)s')
+
+    if args.command is None:
+        logger.info(f"Loading config from: {args.config}")
+        from gui import run_gui
+        return run_gui()
+
+    reporter = JsonReporter(quiet=args.quiet)
+    try:
+        app_config = config.load_config()
+    except (OSError, ValueError) as e:
+        reporter.emit('error', message=f"无法读取配置文件 {args.config}: {str(e)}")
+        return EXIT_USAGE
+    try:
+        if args.command == 'daemon':
+            return run_daemon(args, app_config, reporter)
+        return run_once(args, app_config, reporter)
+    except KeyboardInterrupt:
+        reporter.emit('interrupted')
+        return EXIT_INTERRUPTED
+    except Exception as e:
+        # 同步本身的失败已由run_once报告，这里是监视器、调度等运行时错误
+        reporter.emit('fatal', message=f"{type(e).__name__}: {str(e)}")
+        return EXIT_ERROR
@@ -1,16 +1,41 @@
 import json
+import os
 from utils import resource_path
 
 
 
 CONFIG_FILE = resource_path("config.json")
+STATE_DB_NAME = "sync_state.db"
+FINGERPRINT_CACHE_NAME = "fingerprint_cache.db"
+TRANSFER_JOURNAL_NAME = "transfer_journal.db"
+SERVER_PROFILES_NAME = "server_profiles.db"
 
 def load_config():
     """加载配置文件"""
-    with open(CONFIG_FILE, 'r') as f:
+    with open(os.path.expanduser(CONFIG_FILE), 'r') as f:
         return json.load(f)
 
 def save_config(config):
     """保存配置文件"""
-    with open(CONFIG_FILE, 'w') as f:
-        json.dump(config, f, indent=4)
\ No newline at end of file
+    with open(os.path.expanduser(CONFIG_FILE), 'w') as f:
+        json.dump(config, f, indent=4)
+
+def _config_dir():
+    """配置文件所在目录"""
+    return os.path.dirname(os.path.abspath(os.path.expanduser(CONFIG_FILE)))
+
+def state_db_path():
+    """同步状态库路径（与配置文件位于同一目录）"""
+    return os.path.join(_config_dir(), STATE_DB_NAME)
+
+def fingerprint_cache_path():
+    """文件指纹缓存路径（与配置文件位于同一目录）"""
+    return os.path.join(_config_dir(), FINGERPRINT_CACHE_NAME)
+
+def transfer_journal_path():
+    """传输日志路径（与配置文件位于同一目录）"""
+    return os.path.join(_config_dir(), TRANSFER_JOURNAL_NAME)
+
+def server_profiles_path():
+    """服务器能力档案库路径（与配置文件位于同一目录）"""
+    return os.path.join(_config_dir(), SERVER_PROFILES_NAME)
\ No newline at end of file
@@ -0,0 +1,222 @@
+import hashlib
+import mmap
+import multiprocessing
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from scanner import LocalEntry
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+MODE_FAST = 'fast'
+MODE_FULL = 'full'
+
+# 快速模式读取的头尾字节数
+FAST_SAMPLE_SIZE = 100
+# 超过该大小的文件在进程池中计算完整指纹
+POOL_THRESHOLD = 64 * 1024 * 1024
+# 非mmap读取时的分块大小
+READ_CHUNK_SIZE = 4 * 1024 * 1024
+
+
+def _full_hasher():
+    """完整内容指纹使用的哈希算法：优先xxhash，否则blake2b"""
+    if xxhash is not None:
+        factory = getattr(xxhash, 'xxh3_128', None) or xxhash.xxh64
+        return factory.__name__, factory()
+    return 'blake2b', hashlib.blake2b(digest_size=20)
+
+
+def fast_fingerprint(path: str, length: Optional[int] = None) -> str:
+    """
+    快速指纹：文件大小 + 头部和尾部各100字节的MD5
+    :param length: 只计算文件前length字节（与当初长度为length时的指纹可比较）
+    """
+    size = os.path.getsize(path) if length is None else length
+    hasher = hashlib.md5(f"{size}-".encode())
+    with open(path, 'rb') as f:
+        hasher.update(f.read(min(FAST_SAMPLE_SIZE, size)))
+        f.seek(max(0, size - FAST_SAMPLE_SIZE))
+        hasher.update(f.read(min(FAST_SAMPLE_SIZE, size)))
+    return f"{MODE_FAST}:{hasher.hexdigest()}"
+
+
+def full_fingerprint(path: str, length: Optional[int] = None) -> str:
+    """
+    完整内容指纹，通过mmap读取，避免逐块复制到Python对象
+    :param length: 只计算文件前length字节（与当初长度为length时的指纹可比较）
+    """
+    name, hasher = _full_hasher()
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if length is not None:
+            size = min(size, length)
+        if size:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    view = memoryview(mm)
+                    try:
+                        for offset in range(0, size, READ_CHUNK_SIZE):
+                            hasher.update(view[offset:min(offset + READ_CHUNK_SIZE, size)])
+                    finally:
+                        view.release()
+            except (OSError, ValueError):
+                # 部分文件系统不支持mmap，退回普通分块读取
+                f.seek(0)
+                remaining = size
+                while remaining > 0:
+                    chunk = f.read(min(READ_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    hasher.update(chunk)
+                    remaining -= len(chunk)
+    return f"{name}:{hasher.hexdigest()}"
+
+
+class FingerprintEngine:
+    """
+    文件指纹引擎：支持快速（头尾采样）和完整内容两种模式，
+    结果按 (设备号, inode, 大小, mtime_ns) 持久缓存，大文件在进程池中计算
+    """
+
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, mode: str = MODE_FAST, cache_path: Optional[str] = None,
+                 max_workers: Optional[int] = None):
+        """
+        :param mode: 'fast' 或 'full'
+        :param cache_path: 缓存数据库路径，None表示不持久缓存
+        :param max_workers: 进程池大小，默认为CPU核数
+        """
+        if mode not in (MODE_FAST, MODE_FULL):
+            raise ValueError(f"未知的指纹模式: {mode}")
+        self.mode = mode
+        # 指纹字符串的前缀，不同算法得到的指纹不可比较
+        self.algorithm = MODE_FAST if mode == MODE_FAST else _full_hasher()[0]
+        self.max_workers = max_workers
+        self._executor = None
+        if mode == MODE_FULL:
+            # 在主线程预先创建（子进程在首次提交时才启动）；同步时由多个线程提交任务，
+            # 用spawn启动子进程，避免在持有锁的多线程进程中fork
+            from concurrent.futures import ProcessPoolExecutor
+            self._executor = ProcessPoolExecutor(max_workers=max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = None
+        if cache_path:
+            self._conn = sqlite3.connect(cache_path, check_same_thread=False)
+            with self._lock:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS fingerprints (
+                        dev INTEGER NOT NULL,
+                        ino INTEGER NOT NULL,
+                        size INTEGER NOT NULL,
+                        mtime_ns INTEGER NOT NULL,
+                        algorithm TEXT NOT NULL,
+                        digest TEXT NOT NULL,
+                        PRIMARY KEY (dev, ino, size, mtime_ns, algorithm)
+                    )
+                ''')
+                self._conn.commit()
+
+    def is_comparable(self, digest: Optional[str]) -> bool:
+        """已保存的指纹是否由当前算法生成"""
+        return bool(digest) and digest.split(':', 1)[0] == self.algorithm
+
+    def known_fingerprint(self, entry: LocalEntry) -> Optional[str]:
+        """
+        无需读取完整内容即可得到的指纹（传输完成后记录用）：缓存中已有的，或快速模式下直接计算；
+        完整模式下未缓存时返回None，留到下次扫描时补算
+        """
+        cached = self._cached(entry)
+        if cached or self.mode == MODE_FULL:
+            return cached
+        digest = fast_fingerprint(entry.path, entry.size)
+        self._store(entry, digest)
+        return digest
+
+    def fingerprint_many(self, entries: Iterable[LocalEntry]) -> Dict[str, str]:
+        """批量计算指纹，返回 {本地路径: 指纹}；完整模式下的大文件并行交给进程池"""
+        results = {}
+        futures = {}
+        for entry in entries:
+            cached = self._cached(entry)
+            if cached:
+                results[entry.path] = cached
+            elif self.mode == MODE_FULL and entry.size >= POOL_THRESHOLD:
+                futures[entry.path] = (entry, self._executor.submit(full_fingerprint, entry.path, entry.size))
+            else:
+                digest = self._compute(entry.path, entry.size)
+                self._store(entry, digest)
+                results[entry.path] = digest
+
+        for path, (entry, future) in futures.items():
+            digest = future.result()
+            self._store(entry, digest)
+            results[path] = digest
+        return results
+
+    def fingerprint_prefixes(self, prefixes: Iterable[Tuple[LocalEntry, int]]) -> Dict[str, str]:
+        """
+        计算文件前若干字节的指纹（用于判断文件是否只在末尾追加），返回 {本地路径: 指纹}；
+        结果不缓存，完整模式下的大前缀并行交给进程池
+        """
+        compute = full_fingerprint if self.mode == MODE_FULL else fast_fingerprint
+        results = {}
+        futures = {}
+        for entry, length in prefixes:
+            if self.mode == MODE_FULL and length >= POOL_THRESHOLD:
+                futures[entry.path] = self._executor.submit(compute, entry.path, length)
+            else:
+                results[entry.path] = compute(entry.path, length)
+        for path, future in futures.items():
+            results[path] = future.result()
+        return results
+
+    def close(self):
+        """关闭进程池并提交缓存"""
+        if self._executor:
+            self._executor.shutdown()
+            self._executor = None
+        if self._conn:
+            with self._lock:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def _compute(self, path: str, length: Optional[int] = None) -> str:
+        """在当前进程计算指纹（只计算扫描时长度内的内容，文件此后继续增长也不影响）"""
+        if self.mode == MODE_FULL:
+            return full_fingerprint(path, length)
+        return fast_fingerprint(path, length)
+
+    def _cached(self, entry: LocalEntry) -> Optional[str]:
+        """查询缓存"""
+        if not self._conn:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT digest FROM fingerprints WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithm=?",
+                (entry.dev, entry.ino, entry.size, entry.mtime_ns, self.algorithm)
+            ).fetchone()
+        return row[0] if row else None
+
+    def _store(self, entry: LocalEntry, digest: str):
+        """写入缓存，定期提交"""
+        if not self._conn or not entry.ino:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?, ?)",
+                (entry.dev, entry.ino, entry.size, entry.mtime_ns, self.algorithm, digest)
+            )
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending = 0
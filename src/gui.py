@@ -0,0 +1,504 @@
+import os
+import sys
+import ftplib
+import threading
+from PyQt5.QtWidgets import (QApplication, QWidget, QVBoxLayout, QPushButton,
+                            QFileDialog, QLineEdit, QLabel, QProgressBar,
+                            QMessageBox, QSystemTrayIcon, QMenu, QAction,
+                            QDialog)
+from PyQt5.QtCore import QTimer, QTime, Qt, QThread, pyqtSignal
+from PyQt5.QtGui import QIcon
+import config
+from ftp import FTPConfigDialog
+from progress import format_duration, format_rate
+from schedule import ScheduleConfigDialog
+from sync import connect_negotiated, run_sync
+from utils import get_icon_path, schedule_interval_seconds
+
+# 手动/定时同步与监视模式的增量推送不能同时进行
+_sync_lock = threading.Lock()
+
+
+class SyncWorker(QThread):
+    """FTP同步工作线程"""
+    progress_updated = pyqtSignal(object)
+    sync_finished = pyqtSignal()
+    error_occurred = pyqtSignal(str)
+    
+    def __init__(self, ftp_config, local_path, remote_path, sync_config=None, parent=None):
+        super().__init__(parent)
+        self.ftp_config = ftp_config
+        self.sync_config = sync_config or {}
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self._stopped = False
+        
+    def run(self):
+        """执行同步操作"""
+        try:
+            with _sync_lock:
+                plan = run_sync(self.ftp_config, self.sync_config, self.local_path, self.remote_path,
+                                progress_callback=self._on_progress_update)
+            if self._stopped:
+                return
+            if plan is not None and plan.failures:
+                paths = sorted(plan.failures)
+                more = f" 等{len(paths)}项" if len(paths) > 3 else ""
+                self.error_occurred.emit(f"以下条目未能同步: {', '.join(paths[:3])}{more}")
+            else:
+                self.sync_finished.emit()
+        except Exception as e:
+            if not self._stopped:
+                self.error_occurred.emit(str(e))
+    
+    def _on_progress_update(self, snapshot):
+        """处理进度更新（同步器已按固定间隔合并）"""
+        if not self._stopped:
+            self.progress_updated.emit(snapshot)
+    
+    def stop(self):
+        """停止同步"""
+        self._stopped = True
+
+
+class WatchWorker(QThread):
+    """监视模式工作线程：本地文件变化后数秒内增量推送"""
+    progress_updated = pyqtSignal(object)
+    error_occurred = pyqtSignal(str)
+
+    def __init__(self, ftp_config, local_path, remote_path, sync_config=None, watch_config=None, parent=None):
+        super().__init__(parent)
+        self.ftp_config = ftp_config
+        self.sync_config = sync_config or {}
+        self.watch_config = watch_config or {}
+        self.local_path = local_path
+        self.remote_path = remote_path
+        self._stopped = False
+
+    def run(self):
+        """监视本地目录直到stop被调用"""
+        from ignore import IgnoreMatcher
+        from sync import SYNC_PUSH
+        from watch import create_watcher, run_watch_loop
+        # 监视的是本地变化，只能推送到远程；拉取或双向同步会按远程删除刚在本地新建的文件
+        direction = self.sync_config.get('direction', SYNC_PUSH)
+        if direction != SYNC_PUSH:
+            self.error_occurred.emit(f"监视模式只支持push方向，当前为{direction}")
+            return
+        try:
+            ignore = IgnoreMatcher(self.local_path, self.sync_config.get('ignore', ()))
+            watcher = create_watcher(self.local_path, self.watch_config.get('poll_interval', 10), ignore)
+        except OSError as e:
+            self.error_occurred.emit(str(e))
+            return
+        try:
+            run_watch_loop(
+                watcher, self._sync_paths, self._full_sync, lambda: self._stopped,
+                debounce=self.watch_config.get('debounce_seconds', 2),
+                full_interval=self.watch_config.get('full_sync_hours', 24) * 3600
+            )
+        finally:
+            watcher.close()
+
+    def _sync_paths(self, paths):
+        return self._run(paths=sorted(paths))
+
+    def _full_sync(self):
+        return self._run()
+
+    def _run(self, paths=None):
+        """执行一次同步，失败时返回False以便监视循环稍后重试"""
+        try:
+            with _sync_lock:
+                run_sync(self.ftp_config, self.sync_config, self.local_path, self.remote_path,
+                         progress_callback=self._on_progress_update, paths=paths)
+            return True
+        except Exception as e:
+            if not self._stopped:
+                self.error_occurred.emit(str(e))
+            return False
+
+    def _on_progress_update(self, snapshot):
+        """处理进度更新（同步器已按固定间隔合并）"""
+        if not self._stopped:
+            self.progress_updated.emit(snapshot)
+
+    def stop(self):
+        """停止监视（当前同步完成后退出）"""
+        self._stopped = True
+
+
+class FTPSyncApp(QWidget):
+    def __init__(self):
+        super().__init__()
+        self.config = config.load_config()
+        self.timer = None
+        self.tray_icon = None
+        self.sync_worker = None
+        self.watch_worker = None
+        # 锁定窗口大小，禁用最大化
+        self.setFixedSize(400, 300)
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowMaximizeButtonHint)
+        self._setup_ui()
+        self._setup_tray_icon()
+        self._setup_schedule_sync()
+        self._setup_watch()
+        
+    def closeEvent(self, event):
+        """Override close event to minimize to tray instead of quitting"""
+        self.hide()
+        self._show_tray_notification(
+            "FTP同步工具",
+            "程序已最小化到系统托盘"
+        )
+        event.ignore()  # 再阻止默认关闭行为
+    def showEvent(self, event):
+        print("当前窗口图标:", self.windowIcon().availableSizes())
+        print("窗口管理器类名:", self.window().windowHandle().metaObject().className())
+    def _show_about_dialog(self):
+        """Show about dialog"""
+        about_text = """
+        <b>FTP文件夹同步</b><br><br>
+        版本: 1.0<br>
+        作者: 盹猫<br>
+        联系方式: 1461361074@qq.com<br><br>
+        功能说明:<br>
+        - 本地与FTP服务器文件夹双向同步<br>
+        - 支持定时自动同步<br>
+        - 支持中文路径<br>
+        - 系统托盘运行<br><br>
+        项目地址: <br>
+        CSDN博客: https://blog.csdn.net/2202_75618418<br>
+        ©2025 版权所有
+        """
+        msg = QMessageBox(self)  # 设置父窗口为self
+        msg.setWindowTitle("关于NodCat")
+        msg.setText(about_text)
+        msg.setIcon(QMessageBox.Information)
+        msg.setWindowModality(Qt.ApplicationModal)  # 设置为应用程序模态
+        msg.setAttribute(Qt.WA_DeleteOnClose, False)  # 防止关闭时删除对象
+        msg.exec_()  # 使用exec_()确保模态行为
+
+    def _setup_tray_icon(self):
+        """Initialize system tray icon"""
+        self.tray_icon = QSystemTrayIcon(self)
+        icon_path=get_icon_path()
+        print(icon_path,QIcon(icon_path).isNull())
+        self.tray_icon.setIcon(QIcon(icon_path))
+        
+        tray_menu = QMenu()
+        actions = [
+            ("显示窗口", self.show),
+            ("FTP配置", self.show_ftp_config),
+            ("同步一下", self.sync_folders),
+            ("关于", self._show_about_dialog),
+            ("退出", QApplication.quit)
+        ]
+        
+        # 添加分隔线
+        tray_menu.addSeparator()
+        
+        for text, slot in actions:
+            action = QAction(text, self)
+            action.triggered.connect(slot)
+            tray_menu.addAction(action)
+        
+        self.tray_icon.setContextMenu(tray_menu)
+        self.tray_icon.show()
+
+    def _setup_ui(self):
+        """Initialize user interface"""
+        self.setWindowTitle('NodCat FTP同步')
+        self.setWindowIcon(QIcon(get_icon_path()))
+        self.setGeometry(300, 300, 400, 300)  # 增加高度以适应进度条
+
+        layout = QVBoxLayout()
+
+        # Local path selection
+        self.local_path_edit = QLineEdit(self.config.get('local_path', ''))
+        self._add_path_selection_widgets(layout, "选择本地路径:", self.local_path_edit)
+
+        # Progress bar
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("准备同步")
+        layout.addWidget(self.progress_bar)
+
+        # Control buttons
+        buttons = [
+            ('FTP服务器配置', self.show_ftp_config),
+            ('同步一下', self.sync_folders),
+            ('定时同步配置', self.show_schedule_config)
+        ]
+        
+        for text, slot in buttons:
+            button = QPushButton(text)
+            button.clicked.connect(slot)
+            layout.addWidget(button)
+
+        self.setLayout(layout)
+
+    def _add_path_selection_widgets(self, layout, label_text, line_edit):
+        """Helper method to add path selection widgets"""
+        layout.addWidget(QLabel(label_text))
+        layout.addWidget(line_edit)
+        browse_button = QPushButton('浏览')
+        browse_button.clicked.connect(lambda: self._select_directory(line_edit))
+        layout.addWidget(browse_button)
+
+    def _select_directory(self, line_edit):
+        """Select directory and update the given line edit"""
+        folder_path = QFileDialog.getExistingDirectory(self, "选择本地文件夹")
+        if folder_path:
+            line_edit.setText(folder_path)
+            self._update_config('local_path', folder_path)
+
+    def _update_config(self, key, value):
+        """Update config value and save"""
+        self.config[key] = value
+        config.save_config(self.config)
+
+
+    def _show_tray_notification(self, title, message):
+        """Show tray notification with blinking icon"""
+        icon_path = get_icon_path()
+        
+        if sys.platform == 'darwin':  # macOS
+            try:
+                from Foundation import NSUserNotification
+                from Foundation import NSUserNotificationCenter
+                
+                notification = NSUserNotification.alloc().init()
+                notification.setTitle_(title)
+                notification.setInformativeText_(message)
+                
+                center = NSUserNotificationCenter.defaultUserNotificationCenter()
+                center.deliverNotification_(notification)
+                return
+            except Exception as e:
+                print(f"macOS原生通知失败: {e}")
+                
+        # 获取当前平台对应的图标路径
+        icon_path = get_icon_path()
+        notification_icon = QIcon(icon_path)
+        
+        print(icon_path,notification_icon.isNull())
+            
+        # 默认使用Qt通知
+        if not hasattr(self, 'tray_icon') or self.tray_icon is None:
+            self.tray_icon = QSystemTrayIcon()
+            self.tray_icon.setIcon(notification_icon)  # 设置托盘图标
+            self.tray_icon.show()  # 必须显示托盘图标
+        
+        self.tray_icon.showMessage(
+                title,
+                message,
+                QSystemTrayIcon.NoIcon,  # 无图标
+                2000
+        )
+
+    def _setup_schedule_sync(self):
+        """根据配置设置定时同步"""
+        if self.timer:
+            self.timer.stop()
+        
+        self.timer = QTimer()
+        self.timer.timeout.connect(self.sync_folders)
+        
+        # 从配置获取参数
+        schedule_time = QTime.fromString(self.config['schedule']['time'], 'HH:mm')
+        frequency = self.config['schedule']['frequency']
+        
+        # 计算首次触发延迟
+        current_time = QTime.currentTime()
+        msecs_to_trigger = current_time.msecsTo(schedule_time)
+        
+        # 处理已过时间的情况
+        if msecs_to_trigger <= 0:
+            msecs_to_trigger += 24 * 60 * 60 * 1000  # 加到明天同一时间
+        
+        # 根据频率设置不同间隔（与命令行守护模式共用）
+        interval = schedule_interval_seconds(frequency) * 1000
+        
+        # 设置定时器（分阶段确保首次触发时间准确）
+        QTimer.singleShot(msecs_to_trigger, lambda: [
+            self.sync_folders(),  # 立即执行一次
+            self.timer.start(interval)  # 启动定期执行
+        ])
+        
+        print(f"定时同步已设置: 频率={frequency}, "
+            f"首次触发={schedule_time.toString('HH:mm')}, "
+            f"间隔={interval/(60 * 60 * 1000)}小时")
+        
+    def _setup_watch(self):
+        """配置中开启watch.enabled时监视本地目录，定时同步仍作为完整核对"""
+        if self.watch_worker:
+            self.watch_worker.stop()
+            self.watch_worker.wait()
+            self.watch_worker = None
+        if not self.config.get('watch', {}).get('enabled'):
+            return
+        local_path = self.config.get('local_path', '')
+        ftp_config = self.config.get('ftp', {})
+        if not os.path.isdir(local_path) or not ftp_config.get('remote_path'):
+            return
+        self.watch_worker = WatchWorker(ftp_config, local_path, ftp_config['remote_path'],
+                                        self.config.get('sync', {}), self.config.get('watch', {}), self)
+        self.watch_worker.progress_updated.connect(self._on_sync_progress)
+        self.watch_worker.error_occurred.connect(lambda error: print(f"监视同步失败: {error}"))
+        self.watch_worker.start()
+        print(f"监视模式已开启: {local_path}")
+
+    def show_ftp_config(self):
+        """Show FTP configuration dialog"""
+        dialog = FTPConfigDialog(self)
+        ftp_config = self.config.setdefault('ftp', {})
+        
+        dialog.ftp_host_edit.setText(ftp_config.get('host', ''))
+        dialog.ftp_user_edit.setText(ftp_config.get('username', ''))
+        dialog.ftp_pass_edit.setText(ftp_config.get('password', ''))
+        dialog.remote_path_edit.setText(ftp_config.get('remote_path', ''))
+        
+        if dialog.exec_() == QDialog.Accepted:
+            ftp_config.update({
+                'host': dialog.ftp_host_edit.text(),
+                'username': dialog.ftp_user_edit.text(),
+                'password': dialog.ftp_pass_edit.text(),
+                'remote_path': dialog.remote_path_edit.text()
+            })
+            config.save_config(self.config)
+
+    def _on_sync_progress(self, snapshot):
+        """更新同步进度：进度条显示当前条目、速率和剩余时间，提示中显示字节和条目计数"""
+        self.progress_bar.setValue(snapshot.percent)
+        """设置进度条文本，确保不超过10个字符"""
+        message = snapshot.message
+        max_len = 20
+        if len(message) > max_len:
+            message = message[:max_len-3] + "..."  # 保留前7个字符 + "..."
+        rate = format_rate(snapshot.rate)
+        if rate and snapshot.percent < 100:
+            message += f"  {rate}"
+            if snapshot.eta is not None:
+                message += f"  剩余{format_duration(snapshot.eta)}"
+        self.progress_bar.setFormat(message)
+        self.progress_bar.setToolTip(
+            f"{snapshot.message}\n"
+            f"已传输 {snapshot.bytes_done}/{snapshot.bytes_total} 字节，"
+            f"完成 {snapshot.items_done}/{snapshot.items_total} 项"
+        )
+
+    def _on_sync_finished(self):
+        """同步完成处理"""
+        self.progress_bar.setFormat("同步完成")
+        self._show_tray_notification("同步成功", "文件夹同步完成")
+        self.sync_worker = None
+
+    def _on_sync_error(self, error):
+        """同步错误处理"""
+        self.progress_bar.setFormat("同步失败")
+        self._show_tray_notification("同步失败", f"同步失败: {error}")
+        self.sync_worker = None
+
+    def sync_folders(self):
+        """Synchronize folders between local and FTP"""
+        if self.sync_worker and self.sync_worker.isRunning():
+            QMessageBox.warning(self, "警告", "同步正在进行中，请等待完成")
+            return
+
+        local_path = self.local_path_edit.text()
+        ftp_config = self.config.get('ftp', {})
+
+        if not self._validate_sync_parameters(local_path, ftp_config):
+            return
+
+        # 重置进度条
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("正在同步...")
+
+        # 创建并启动工作线程
+        self.sync_worker = SyncWorker(ftp_config, local_path, ftp_config['remote_path'],
+                                      self.config.get('sync', {}), self)
+        self.sync_worker.progress_updated.connect(self._on_sync_progress)
+        self.sync_worker.sync_finished.connect(self._on_sync_finished)
+        self.sync_worker.error_occurred.connect(self._on_sync_error)
+        self.sync_worker.start()
+
+    def _validate_sync_parameters(self, local_path, ftp_config):
+        """Validate sync parameters"""
+        required_fields = [
+            local_path,
+            ftp_config.get('remote_path', ''),
+            ftp_config.get('host', ''),
+            ftp_config.get('username', ''),
+            ftp_config.get('password', '')
+        ]
+        
+        if not all(required_fields):
+            QMessageBox.warning(self, "警告", "请确保已填写并保存所有FTP信息和路径设置。")
+            return False
+            
+        # 验证本地路径
+        if not os.path.exists(local_path):
+            QMessageBox.warning(self, "警告", f"本地路径不存在: {local_path}\n请选择有效的本地路径。")
+            return False
+            
+        if not os.path.isdir(local_path):
+            QMessageBox.warning(self, "警告", f"本地路径不是目录: {local_path}\n请选择有效的目录路径。")
+            return False
+            
+        # 验证远程路径
+        try:
+            with self._create_ftp_connection(ftp_config) as ftp:
+                try:
+                    ftp.cwd(ftp_config['remote_path'])
+                except ftplib.error_perm as e:
+                    if '550' in str(e):  # 路径不存在错误码
+                        QMessageBox.warning(self, "警告", 
+                            f"远程路径不存在: {ftp_config['remote_path']}\n"
+                            "请在FTP配置中设置正确的远程路径。")
+                        return False
+                    raise
+        except Exception as e:
+            QMessageBox.warning(self, "警告", f"验证远程路径时出错: {str(e)}")
+            return False
+            
+        return True
+
+    def _create_ftp_connection(self, ftp_config):
+        """Create and return FTP connection"""
+        ftp, _ = connect_negotiated(ftp_config)
+        ftp.cwd(ftp_config['remote_path'])
+        return ftp
+
+    def show_schedule_config(self):
+        """Show schedule configuration dialog"""
+        dialog = ScheduleConfigDialog(self)
+        schedule_config = self.config.setdefault('schedule', {
+            'frequency': '每天',
+            'time': '00:00'
+        })
+        
+        dialog.freq_combo.setCurrentText(schedule_config.get('frequency', '每天'))
+        dialog.time_edit.setTime(QTime.fromString(schedule_config.get('time', '00:00'), 'hh:mm'))
+        
+        if dialog.exec_() == QDialog.Accepted:
+            schedule_config.update({
+                'frequency': dialog.freq_combo.currentText(),
+                'time': dialog.time_edit.time().toString('hh:mm')
+            })
+            config.save_config(self.config)
+            self._setup_schedule_sync()
+            QMessageBox.information(self, "成功", "定时同步设置已保存")
+
+
+def run_gui():
+    """启动图形界面（PyQt只在此路径中加载）"""
+    app = QApplication([])
+    app.setQuitOnLastWindowClosed(False)
+    
+    ex = FTPSyncApp()    
+    ex.show()
+    
+    return app.exec_()
@@ -0,0 +1,203 @@
+import logging
+import os
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Pattern, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 各目录中的忽略规则文件（语法同.gitignore，规则相对该文件所在目录）
+IGNORE_FILE = '.nodcatignore'
+
+
+def _translate(pattern: str) -> str:
+    """把一条通配模式（已去掉取反、开头和结尾的'/'）转换为正则，'**'可跨目录，'*'和'?'不匹配'/'"""
+    parts = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern.startswith('**', i):
+                before = i == 0 or pattern[i - 1] == '/'
+                after = i + 2 == n or pattern[i + 2] == '/'
+                if before and after:
+                    if i + 2 == n:
+                        # 结尾的"/**"匹配其下的一切
+                        parts.append('.*')
+                    else:
+                        # "**/"匹配零级或多级目录
+                        parts.append('(?:.*/)?')
+                        i += 1
+                    i += 2
+                    continue
+            parts.append('[^/]*')
+        elif c == '?':
+            parts.append('[^/]')
+        elif c == '[':
+            # 紧跟在"["（或取反符号）之后的"]"是字符本身
+            start = i + 2 if pattern[i + 1:i + 2] in ('!', '^') else i + 1
+            end = pattern.find(']', start + 1 if pattern[start:start + 1] == ']' else start)
+            if end < 0:
+                parts.append(re.escape(c))
+            else:
+                body = pattern[i + 1:end]
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            parts.append(re.escape(pattern[i]))
+        else:
+            parts.append(re.escape(c))
+        i += 1
+    return ''.join(parts)
+
+
+class IgnoreRules:
+    """
+    一组忽略规则（配置中的规则或一个.nodcatignore文件），语法同.gitignore：
+    "#"开头为注释，"!"开头表示重新包含，以"/"结尾只匹配目录，含"/"的模式相对规则所在目录，否则匹配任意层级的名称。
+    连续的同向规则合并为一个正则，匹配时从后往前按组查找，最后一条匹配的规则生效
+    """
+    def __init__(self, patterns: Iterable[str]):
+        # [(是否取反, 匹配目录的正则, 匹配文件的正则)]，没有对应规则的正则为None
+        self._groups: List[Tuple[bool, Optional[Pattern], Optional[Pattern]]] = []
+        current = None
+        dir_parts: List[str] = []
+        file_parts: List[str] = []
+        for line in patterns:
+            rule = self._parse(line)
+            if rule is None:
+                continue
+            negate, regex, dir_only = rule
+            if negate != current:
+                self._flush(current, dir_parts, file_parts)
+                current, dir_parts, file_parts = negate, [], []
+            dir_parts.append(regex)
+            if not dir_only:
+                file_parts.append(regex)
+        self._flush(current, dir_parts, file_parts)
+
+    def __bool__(self) -> bool:
+        return bool(self._groups)
+
+    @staticmethod
+    def _parse(line: str) -> Optional[Tuple[bool, str, bool]]:
+        """解析一行规则，返回 (是否取反, 正则, 是否只匹配目录)，空行和注释返回None"""
+        line = line.rstrip('\n\r')
+        # 末尾未转义的空格忽略
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+        if not line or line.startswith('#'):
+            return None
+        negate = line.startswith('!')
+        if negate or line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            return None
+        anchored = '/' in line
+        line = line.lstrip('/')
+        regex = _translate(line)
+        if not anchored and not line.startswith('**/'):
+            regex = '(?:.*/)?' + regex
+        return negate, regex, dir_only
+
+    def _flush(self, negate: Optional[bool], dir_parts: List[str], file_parts: List[str]):
+        if negate is None or not dir_parts:
+            return
+        compile_ = lambda parts: re.compile('(?:' + '|'.join(parts) + r')\Z', re.DOTALL) if parts else None
+        self._groups.append((negate, compile_(dir_parts), compile_(file_parts)))
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """按最后一条匹配的规则返回是否忽略（相对规则所在目录的路径），没有规则匹配时返回None"""
+        for negate, dir_regex, file_regex in reversed(self._groups):
+            regex = dir_regex if is_dir else file_regex
+            if regex is not None and regex.match(rel_path):
+                return not negate
+        return None
+
+
+class IgnoreMatcher:
+    """
+    同步任务的忽略规则：配置中的规则作用于整个目录树，各目录的.nodcatignore作用于该目录之下并优先于上级的规则。
+    被忽略的目录整个剪除（与.gitignore相同，其中的条目不能再被重新包含），扫描本地和列出远程时都不再进入。
+    各目录适用的规则在首次用到时读取并缓存
+    """
+    def __init__(self, root: Optional[str] = None, patterns: Iterable[str] = ()):
+        """
+        :param root: 本地同步目录，None表示不读取.nodcatignore
+        :param patterns: 配置中的规则（sync.ignore）
+        """
+        self.root = root
+        self._base = IgnoreRules(patterns)
+        # {相对目录: 作用于该目录下条目的规则链 [(规则所在目录, 规则)]，由近到远}
+        self._chains: Dict[str, tuple] = {}
+
+    def invalidate(self):
+        """.nodcatignore变化后清除缓存的规则"""
+        self._chains = {}
+
+    def ignored(self, rel_path: str, is_dir: bool) -> bool:
+        """路径本身是否被忽略（调用方已确认各级上级目录未被忽略，如逐层遍历时）"""
+        parent, _, name = rel_path.rpartition('/')
+        skip = self.for_dir(parent)
+        return skip is not None and skip(name, is_dir)
+
+    def ignores_path(self, rel_path: str, is_dir: bool) -> bool:
+        """路径本身或某一级上级目录是否被忽略（用于单独给出的路径，如监视到的变化）"""
+        parts = rel_path.split('/')
+        for i in range(1, len(parts)):
+            if self.ignored('/'.join(parts[:i]), True):
+                return True
+        return self.ignored(rel_path, is_dir)
+
+    def for_dir(self, rel_dir: str) -> Optional[Callable[[str, bool], bool]]:
+        """
+        返回判断目录下某一名称是否被忽略的函数 skip(名称, 是否目录)，
+        没有任何规则作用于该目录时返回None（调用方无需逐项判断）
+        """
+        chain = self._chain(rel_dir)
+        if not chain and not self._base:
+            return None
+        base = self._base
+        prefix = rel_dir + '/' if rel_dir else ''
+
+        def skip(name: str, is_dir: bool) -> bool:
+            rel = prefix + name
+            for rules_dir, rules in chain:
+                result = rules.match(rel[len(rules_dir) + 1:] if rules_dir else rel, is_dir)
+                if result is not None:
+                    return result
+            return bool(base.match(rel, is_dir))
+        return skip
+
+    def _chain(self, rel_dir: str) -> tuple:
+        """目录适用的.nodcatignore规则链（自身的在前），逐级向上复用缓存"""
+        chain = self._chains.get(rel_dir)
+        if chain is None:
+            parent = self._chain(rel_dir.rpartition('/')[0]) if rel_dir else ()
+            rules = self._load(rel_dir)
+            chain = ((rel_dir, rules),) + parent if rules else parent
+            self._chains[rel_dir] = chain
+        return chain
+
+    def _load(self, rel_dir: str) -> Optional[IgnoreRules]:
+        """读取目录中的.nodcatignore，不存在或没有有效规则时返回None"""
+        if self.root is None:
+            return None
+        path = os.path.join(self.root, *rel_dir.split('/'), IGNORE_FILE) if rel_dir \
+            else os.path.join(self.root, IGNORE_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                rules = IgnoreRules(f)
+        except (FileNotFoundError, NotADirectoryError):
+            # 只在远程存在的目录，或本地为同名文件
+            return None
+        except OSError as e:
+            logger.warning(f"无法读取忽略规则 {path}: {str(e)}")
+            return None
+        return rules or None
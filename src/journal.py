@@ -0,0 +1,85 @@
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+# 传输方向
+DIRECTION_UPLOAD = 'upload'
+DIRECTION_DOWNLOAD = 'download'
+
+
+class TransferJournal:
+    """
+    传输日志（SQLite）：记录进行中的上传已发送到的位置及这部分字节的摘要，
+    中断后再次同步时据此校验远程已有部分并从断点续传；下载记录已写入本地临时文件的位置
+    """
+    def __init__(self, db_path: str):
+        """
+        :param db_path: 数据库文件路径
+        """
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock:
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(transfers)")}
+            if columns and 'direction' not in columns:
+                # 旧版本只记录上传且主键不含方向；记录只用于续传，丢弃后最多重新传输一次
+                self._conn.execute("DROP TABLE transfers")
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS transfers (
+                    direction TEXT NOT NULL,
+                    host TEXT NOT NULL,
+                    remote_path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    offset INTEGER NOT NULL,
+                    algorithm TEXT,
+                    digest TEXT,
+                    updated_at REAL,
+                    PRIMARY KEY (direction, host, remote_path)
+                )
+            ''')
+            self._conn.commit()
+
+    def get(self, host: str, remote_path: str, size: int, mtime_ns: int,
+            direction: str = DIRECTION_UPLOAD) -> Optional[dict]:
+        """
+        获取传输记录；源文件（上传为本地文件，下载为远程文件）在中断后已变化（大小或修改时间不同）时
+        丢弃记录并返回None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT size, mtime_ns, offset, algorithm, digest FROM transfers "
+                "WHERE direction=? AND host=? AND remote_path=?",
+                (direction, host, remote_path)
+            ).fetchone()
+        if row is None:
+            return None
+        if row[0] != size or row[1] != mtime_ns:
+            self.finish(host, remote_path, direction)
+            return None
+        return {'offset': row[2], 'algorithm': row[3], 'digest': row[4]}
+
+    def checkpoint(self, host: str, remote_path: str, size: int, mtime_ns: int, offset: int,
+                   algorithm: Optional[str] = None, digest: Optional[str] = None,
+                   direction: str = DIRECTION_UPLOAD):
+        """记录已传输到offset（立即提交，进程被终止后仍然有效）"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (direction, host, remote_path, size, mtime_ns, offset, algorithm, digest, time.time())
+            )
+            self._conn.commit()
+
+    def finish(self, host: str, remote_path: str, direction: str = DIRECTION_UPLOAD):
+        """传输完成（或记录失效）后删除记录"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM transfers WHERE direction=? AND host=? AND remote_path=?",
+                (direction, host, remote_path)
+            )
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库"""
+        self._conn.close()
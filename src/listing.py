@@ -0,0 +1,358 @@
+import bisect
+import calendar
+import ftplib
+import re
+import time
+from array import array
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from mtime import parse_ftp_time
+
+# 条目类型；符号链接无法从LIST得知指向目录还是文件，由调用方按需确认
+TYPE_DIR = 'dir'
+TYPE_FILE = 'file'
+TYPE_LINK = 'link'
+
+# 列表来源
+SOURCE_MLSD = 'MLSD'
+SOURCE_LIST = 'LIST'
+SOURCE_NLST = 'NLST'
+
+# DirListing中的类型字节（0表示列出后已被删除）
+_KIND_DIR = ord('d')
+_KIND_FILE = ord('f')
+_KIND_REMOVED = 0
+
+_MONTHS = {name: i for i, name in enumerate(
+    ('jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'), 1)}
+
+# Unix ls -l：权限 链接数 [属主 [属组]] 大小 月 日 时间或年份 名称（名称原样保留，可含空格）
+_UNIX_LINE = re.compile(
+    r'^([-dlbcps])\S{9}\S*\s+\d+\s+(?:\S+\s+){0,2}?(\d+)\s+'
+    r'([A-Za-z]{3})\s+(\d{1,2})\s+(\d{1,2}:\d{2}|\d{4})\s(.+)$'
+)
+# DOS/IIS：MM-DD-YY hh:mmAM <DIR>或大小 名称（也接受四位年份和24小时制）
+_DOS_LINE = re.compile(
+    r'^(\d{2})-(\d{2})-(\d{2,4})\s+(\d{1,2}):(\d{2})\s*([AaPp][Mm])?\s+(<DIR>|\d+)\s+(.+)$'
+)
+
+
+class ListingEntry(NamedTuple):
+    """目录列表中的一项（mtime为UTC时间戳，未知时为0）"""
+    name: str
+    type: Optional[str]
+    size: Optional[int]
+    mtime: float
+
+
+class DirListing:
+    """
+    单个远程目录的紧凑列表：按名称排序的名称列表和等长的类型字节、大小、修改时间数组，
+    每个条目只占名称字符串和十余字节，不为条目建立字典；按名称二分查找，按名称顺序遍历（供归并比对）。
+    列出之后本程序建的目录记在少量附加条目中，删除的条目只在类型字节上做标记。
+    items()/get()返回的 {'type', 'size', 'mtime'} 字典是临时生成的
+    """
+    __slots__ = ('names', 'kinds', 'sizes', 'mtimes', 'extra', 'removed')
+
+    def __init__(self):
+        self.names: List[str] = []
+        self.kinds = bytearray()
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        # 列出后新增的条目 {名称: (类型, 大小, 修改时间)}
+        self.extra: Dict[str, tuple] = {}
+        self.removed = 0
+
+    def append(self, name: str, entry_type: str, size: Optional[int], mtime: Optional[float]):
+        """列出时逐项加入（无需有序），全部加入后调用seal"""
+        self.names.append(name)
+        if entry_type == TYPE_DIR:
+            self.kinds.append(_KIND_DIR)
+            self.sizes.append(0)
+        else:
+            self.kinds.append(_KIND_FILE)
+            self.sizes.append(size or 0)
+        self.mtimes.append(mtime or 0)
+
+    def seal(self) -> 'DirListing':
+        """按名称排序（服务器返回的顺序不可靠），返回自身"""
+        names = self.names
+        order = sorted(range(len(names)), key=names.__getitem__)
+        if any(i != position for position, i in enumerate(order)):
+            self.names = [names[i] for i in order]
+            self.kinds = bytearray(self.kinds[i] for i in order)
+            self.sizes = array('q', (self.sizes[i] for i in order))
+            self.mtimes = array('d', (self.mtimes[i] for i in order))
+        return self
+
+    def copy(self) -> 'DirListing':
+        """副本：名称、大小和修改时间数组不再改变，直接共享；类型字节（删除标记）和附加条目各自保存"""
+        listing = DirListing.__new__(DirListing)
+        listing.names, listing.sizes, listing.mtimes = self.names, self.sizes, self.mtimes
+        listing.kinds = bytearray(self.kinds)
+        listing.extra = dict(self.extra)
+        listing.removed = self.removed
+        return listing
+
+    def type_of(self, name: str) -> Optional[str]:
+        """条目类型（dir/file），不存在时返回None"""
+        extra = self.extra.get(name)
+        if extra is not None:
+            return extra[0]
+        i = self._find(name)
+        if i < 0:
+            return None
+        return TYPE_DIR if self.kinds[i] == _KIND_DIR else TYPE_FILE
+
+    def get(self, name: str, default=None) -> Optional[dict]:
+        """条目的元数据 {'type', 'size', 'mtime'}（修改时间未知时为None）"""
+        extra = self.extra.get(name)
+        if extra is not None:
+            return self._meta(*extra)
+        i = self._find(name)
+        if i < 0:
+            return default
+        return self._meta(TYPE_DIR if self.kinds[i] == _KIND_DIR else TYPE_FILE, self.sizes[i], self.mtimes[i])
+
+    def __contains__(self, name: str) -> bool:
+        return self.type_of(name) is not None
+
+    def __len__(self) -> int:
+        return len(self.names) - self.removed + len(self.extra)
+
+    def __iter__(self) -> Iterator[str]:
+        for name, _ in self.types():
+            yield name
+
+    def types(self) -> Iterator[Tuple[str, str]]:
+        """按名称顺序产出 (名称, 类型)"""
+        for name, kind, _, _ in self._records():
+            yield name, kind
+
+    def items(self) -> Iterator[Tuple[str, dict]]:
+        """按名称顺序产出 (名称, 元数据)"""
+        for name, kind, size, mtime in self._records():
+            yield name, self._meta(kind, size, mtime)
+
+    def add(self, name: str, entry_type: str, size: int = 0, mtime: Optional[float] = None):
+        """记录列出后新增（或替换）的条目"""
+        self._mark_removed(name)
+        self.extra[name] = (entry_type, size, mtime)
+
+    def remove(self, name: str) -> Optional[str]:
+        """删除条目，返回其原类型（不存在时为None）"""
+        extra = self.extra.pop(name, None)
+        if extra is not None:
+            return extra[0]
+        item_type = self.type_of(name)
+        self._mark_removed(name)
+        return item_type
+
+    def _mark_removed(self, name: str):
+        i = self._find(name)
+        if i >= 0:
+            self.kinds[i] = _KIND_REMOVED
+            self.removed += 1
+
+    def _find(self, name: str) -> int:
+        """已排序数组中未被删除的条目位置，不存在时为-1"""
+        i = bisect.bisect_left(self.names, name)
+        if i < len(self.names) and self.names[i] == name and self.kinds[i] != _KIND_REMOVED:
+            return i
+        return -1
+
+    def _records(self) -> Iterator[tuple]:
+        """按名称顺序产出 (名称, 类型, 大小, 修改时间)，附加条目按序插入"""
+        extra = sorted(self.extra.items()) if self.extra else []
+        pending = 0
+        names, kinds, sizes, mtimes = self.names, self.kinds, self.sizes, self.mtimes
+        for i in range(len(names)):
+            kind = kinds[i]
+            if kind == _KIND_REMOVED:
+                continue
+            name = names[i]
+            while pending < len(extra) and extra[pending][0] < name:
+                yield (extra[pending][0],) + extra[pending][1]
+                pending += 1
+            yield name, TYPE_DIR if kind == _KIND_DIR else TYPE_FILE, sizes[i], mtimes[i]
+        for name, record in extra[pending:]:
+            yield (name,) + record
+
+    @staticmethod
+    def _meta(entry_type: str, size: int, mtime: Optional[float]) -> dict:
+        return {'type': entry_type, 'size': size, 'mtime': mtime or None}
+
+
+def merge_by_name(local_entries: Iterable, remote_items: Iterable[tuple]) -> Iterator[tuple]:
+    """
+    归并两个按名称排序的序列：本地条目（有name属性）和远程的 (名称, 元数据)，
+    按名称顺序产出 (名称, 本地条目或None, 远程元数据或None)，只需保存两边各自的当前项
+    """
+    local_iter = iter(local_entries)
+    remote_iter = iter(remote_items)
+    local = next(local_iter, None)
+    remote = next(remote_iter, None)
+    while local is not None or remote is not None:
+        if remote is None or (local is not None and local.name < remote[0]):
+            yield local.name, local, None
+            local = next(local_iter, None)
+        elif local is None or remote[0] < local.name:
+            yield remote[0], None, remote[1]
+            remote = next(remote_iter, None)
+        else:
+            yield local.name, local, remote[1]
+            local = next(local_iter, None)
+            remote = next(remote_iter, None)
+
+
+def parse_mlsd_line(line: str) -> Optional[ListingEntry]:
+    """
+    解析一行MLSD列表："事实;事实; 名称"，名称在第一个空格之后、大小写和空格原样保留；
+    当前目录、上级目录及无法识别的行返回None
+    """
+    facts, sep, name = line.partition(' ')
+    if not sep or not name or name in ('.', '..'):
+        return None
+    entry_type = TYPE_FILE
+    size = 0
+    mtime = 0
+    for fact in facts.split(';'):
+        key, _, value = fact.partition('=')
+        key = key.lower()
+        if key == 'type':
+            value = value.lower()
+            if value == 'dir':
+                entry_type = TYPE_DIR
+            elif value in ('cdir', 'pdir'):
+                return None
+            elif value.startswith('os.unix=slink') or value.startswith('os.unix=symlink'):
+                entry_type = TYPE_LINK
+        elif key == 'size' and value.isdigit():
+            size = int(value)
+        elif key == 'modify':
+            mtime = parse_ftp_time(value)
+    return ListingEntry(name, entry_type, size, mtime)
+
+
+def parse_list_line(line: str, current: time.struct_time) -> Optional[ListingEntry]:
+    """
+    解析一行LIST列表（Unix ls -l格式和DOS/IIS格式），当前目录、上级目录及无法识别的行（如"total"行）返回None。
+    LIST的时间为服务器本地时间且只精确到分钟（较早的文件只有日期），这里按UTC换算，只能作为参考
+    :param current: 当前UTC时间，用于推断Unix列表中省略的年份
+    """
+    match = _UNIX_LINE.match(line)
+    if match:
+        kind, size, month, day, clock, name = match.groups()
+        entry_type = TYPE_DIR if kind == 'd' else TYPE_LINK if kind == 'l' else TYPE_FILE
+        if entry_type == TYPE_LINK:
+            name = name.split(' -> ', 1)[0]
+        if name in ('.', '..'):
+            return None
+        return ListingEntry(name, entry_type, int(size), _unix_time(month, int(day), clock, current))
+    match = _DOS_LINE.match(line)
+    if match:
+        month, day, year, hour, minute, ampm, size, name = match.groups()
+        if name in ('.', '..'):
+            return None
+        entry_type = TYPE_DIR if size == '<DIR>' else TYPE_FILE
+        return ListingEntry(name, entry_type, 0 if entry_type == TYPE_DIR else int(size),
+                            _dos_time(int(month), int(day), year, int(hour), int(minute), ampm))
+    return None
+
+
+def _unix_time(month: str, day: int, clock: str, current: time.struct_time) -> float:
+    """Unix列表时间：半年内的文件为"时:分"（年份取使其不晚于当前的年份），更早的为年份"""
+    month_number = _MONTHS.get(month.lower())
+    if not month_number:
+        return 0
+    try:
+        if ':' in clock:
+            hour, minute = (int(part) for part in clock.split(':'))
+            year = current.tm_year
+            if (month_number, day) > (current.tm_mon, current.tm_mday + 1):
+                year -= 1
+            return calendar.timegm((year, month_number, day, hour, minute, 0))
+        return calendar.timegm((int(clock), month_number, day, 0, 0, 0))
+    except (ValueError, OverflowError):
+        return 0
+
+
+def _dos_time(month: int, day: int, year: str, hour: int, minute: int, ampm: Optional[str]) -> float:
+    """DOS/IIS列表时间（两位年份按70年为界）"""
+    year_number = int(year)
+    if len(year) == 2:
+        year_number += 1900 if year_number >= 70 else 2000
+    if ampm:
+        hour = hour % 12 + (12 if ampm.lower() == 'pm' else 0)
+    try:
+        return calendar.timegm((year_number, month, day, hour, minute, 0))
+    except (ValueError, OverflowError):
+        return 0
+
+
+def parse_nlst_line(line: str) -> Optional[ListingEntry]:
+    """解析一行NLST列表：只有名称（部分服务器返回完整路径），类型和大小未知；当前目录和上级目录返回None"""
+    name = line.rsplit('/', 1)[-1]
+    if not name or name in ('.', '..'):
+        return None
+    return ListingEntry(name, None, None, 0)
+
+
+def retrieve_listing(ftp: ftplib.FTP, path: str, use_mlsd: bool = True,
+                     list_command: str = 'LIST') -> Tuple[List[ListingEntry], str]:
+    """
+    用一次数据传输列出目录，参数见stream_listing
+    :return: (条目列表, 来源)
+    """
+    entries = []
+    source = stream_listing(ftp, path, entries.append, use_mlsd, list_command)
+    return entries, source
+
+
+def stream_listing(ftp: ftplib.FTP, path: str, callback: Callable[[ListingEntry], None],
+                   use_mlsd: bool = True, list_command: str = 'LIST') -> str:
+    """
+    用一次数据传输列出目录，边接收边解析，每个条目调用一次callback，不保留原始行：
+    优先MLSD，不可用时用LIST并解析Unix/DOS格式，LIST的内容无法识别时才退回NLST（只有名称）
+    :param use_mlsd: 服务器能力档案确认MLSD不可用时为False
+    :param list_command: LIST命令（服务器支持时为"LIST -a"，以包含隐藏文件）
+    :return: 列表来源
+    """
+    if use_mlsd:
+        try:
+            ftp.retrlines(f'MLSD {path}', lambda line: _deliver(parse_mlsd_line(line), callback))
+            return SOURCE_MLSD
+        except ftplib.error_perm as e:
+            _raise_if_missing(e)
+    current = time.gmtime()
+    # 识别出的条目数和无法识别的行数（"total"行除外）
+    counts = [0, 0]
+
+    def on_line(line):
+        entry = parse_list_line(line, current)
+        if entry is not None:
+            counts[0] += 1
+            callback(entry)
+        elif line.strip() and not line.lower().startswith('total'):
+            counts[1] += 1
+    try:
+        ftp.retrlines(f'{list_command} {path}', on_line)
+        # 空目录，或至少识别出一行（无法识别的只有附加说明之类的行）
+        if counts[0] or not counts[1]:
+            return SOURCE_LIST
+    except ftplib.error_perm as e:
+        _raise_if_missing(e)
+    ftp.retrlines(f'NLST {path}', lambda line: _deliver(parse_nlst_line(line), callback))
+    return SOURCE_NLST
+
+
+def _deliver(entry: Optional[ListingEntry], callback: Callable[[ListingEntry], None]):
+    """解析出条目时交给回调"""
+    if entry is not None:
+        callback(entry)
+
+
+def _raise_if_missing(error: ftplib.error_perm):
+    """550表示目录不存在或无权访问（而不是命令不受支持），换用其他列表命令也无济于事"""
+    if str(error).startswith('550'):
+        raise error
@@ -0,0 +1,239 @@
+import ftplib
+import logging
+import threading
+from array import array
+from typing import Dict, Optional
+
+from ignore import IgnoreMatcher
+from session import DEFAULT_RETRIES, ResilientSession, is_connection_error
+from listing import SOURCE_MLSD, TYPE_DIR, TYPE_FILE, DirListing, stream_listing
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_remote_path(path: str) -> str:
+    """统一远程路径写法（去掉末尾的'/'，根目录为'/'）"""
+    return path.rstrip('/') or '/'
+
+
+def remote_is_dir(ftp: ftplib.FTP, path: str) -> bool:
+    """通过CWD判断远程路径是否为目录（连接错误照常抛出，由调用方重新连接后重试）"""
+    try:
+        old_pwd = ftp.pwd()
+        ftp.cwd(path)
+        ftp.cwd(old_pwd)
+        return True
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        return False
+
+
+def list_remote_dir(ftp: ftplib.FTP, path: str, use_mlsd: bool = True, list_command: str = 'LIST') -> DirListing:
+    """
+    列出单个远程目录，返回按名称排序的紧凑列表；
+    一次传输列出（MLSD，不可用时LIST），边接收边解析，只有NLST列表中的条目和符号链接才逐项判断类型和大小。
+    列出失败（连接中断、无权访问等）时照常抛出：不能当作空目录，否则拉取和双向同步会删除本地对应的文件
+    :param use_mlsd: 服务器能力档案确认MLSD不可用时为False，直接使用LIST
+    :param list_command: LIST命令（见ServerCapabilities.list_command）
+    """
+    listing = DirListing()
+    unknown = []
+
+    def on_entry(entry):
+        if entry.type in (TYPE_DIR, TYPE_FILE):
+            listing.append(entry.name, entry.type, entry.size, entry.mtime)
+        else:
+            unknown.append(entry)
+    source = stream_listing(ftp, path, on_entry, use_mlsd, list_command)
+    # 类型未知的条目在数据传输结束后才能逐项试探
+    for entry in unknown:
+        remote_file = f"{path.rstrip('/')}/{entry.name}"
+        entry_type = TYPE_DIR if remote_is_dir(ftp, remote_file) else TYPE_FILE
+        size = entry.size
+        if entry_type == TYPE_FILE and size is None:
+            size = remote_file_size(ftp, remote_file)
+        listing.append(entry.name, entry_type, size, entry.mtime)
+    if source != SOURCE_MLSD:
+        # LIST的时间为服务器本地时间且精度不足，不能与本地修改时间比较
+        listing.mtimes = array('d', bytes(8 * len(listing.names)))
+    return listing.seal()
+
+
+def remote_file_size(ftp: ftplib.FTP, path: str) -> int:
+    """查询远程文件大小，不存在或无法查询时返回0（连接错误照常抛出，由调用方重新连接后重试）"""
+    try:
+        ftp.voidcmd('TYPE I')
+        return ftp.size(path) or 0
+    except Exception as e:
+        if is_connection_error(e):
+            raise
+        return 0
+
+
+class RemoteManifest:
+    """
+    远程目录树清单：后台用多条连接并行预取各目录列表，
+    比对、建目录和删除都从清单读取，不再逐个目录往返列出
+    """
+    def __init__(self, connection_factory, size: int, use_mlsd: bool = True, list_command: str = 'LIST',
+                 ignore: Optional[IgnoreMatcher] = None, retries: int = DEFAULT_RETRIES):
+        """
+        :param connection_factory: 无参函数，返回已登录的ftplib.FTP
+        :param size: 并行列目录的连接数
+        :param use_mlsd: 是否使用MLSD列目录（见list_remote_dir）
+        :param list_command: MLSD不可用时的LIST命令
+        :param ignore: 忽略规则（相对路径从预取的根目录算起），被忽略的目录不再列出
+        :param retries: 连接中断时重新连接并重新列出当前目录的次数
+        """
+        self.connection_factory = connection_factory
+        self.size = max(1, int(size))
+        self.use_mlsd = use_mlsd
+        self.list_command = list_command
+        self.ignore = ignore
+        self.retries = retries
+        self._root = '/'
+        self._listings: Dict[str, DirListing] = {}
+        # 待列出的目录（栈，接近深度优先的比对顺序）及比对方正在等待的目录
+        self._stack = []
+        self._urgent = []
+        self._queued = set()
+        self._taken = set()
+        self._active = 0
+        self._cond = threading.Condition()
+        self._threads = []
+        self._closed = False
+
+    def start(self, root: str):
+        """从root开始预取整个远程目录树"""
+        root = normalize_remote_path(root)
+        self._root = root
+        with self._cond:
+            self._queued.add(root)
+            self._stack.append(root)
+        for _ in range(self.size):
+            thread = threading.Thread(target=self._worker_loop, daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def listing(self, path: str) -> Optional[DirListing]:
+        """
+        返回目录的列表（尚未列出时优先列出并等待）；
+        清单中没有该目录（不存在、列出失败或预取已停止）时返回None，由调用方自行列出
+        """
+        path = normalize_remote_path(path)
+        with self._cond:
+            if path not in self._listings:
+                if path not in self._queued:
+                    return None
+                self._urgent.append(path)
+                self._cond.notify_all()
+                while path not in self._listings and path in self._queued and not self._closed:
+                    self._cond.wait()
+            items = self._listings.get(path)
+            # 返回副本（共享排序数组），调用方遍历时其他线程可能正在更新清单
+            return items.copy() if items is not None else None
+
+    def is_dir(self, path: str) -> Optional[bool]:
+        """按父目录的列表判断路径是否为已存在的目录，父目录未列出时返回None"""
+        path = normalize_remote_path(path)
+        if path == '/':
+            return True
+        parent, name = path.rsplit('/', 1)
+        siblings = self.listing(parent or '/')
+        if siblings is None:
+            return None
+        return siblings.type_of(name) == TYPE_DIR
+
+    def add_dir(self, path: str):
+        """记录本次新建的空目录，之后比对时无需列出"""
+        path = normalize_remote_path(path)
+        parent, name = path.rsplit('/', 1)
+        with self._cond:
+            self._listings.setdefault(path, DirListing())
+            siblings = self._listings.get(parent or '/')
+            if siblings is not None:
+                siblings.add(name, TYPE_DIR)
+
+    def remove(self, path: str):
+        """远程条目删除后从清单中移除（目录连同其子树）"""
+        path = normalize_remote_path(path)
+        parent, name = path.rsplit('/', 1)
+        prefix = path + '/'
+        with self._cond:
+            siblings = self._listings.get(parent or '/')
+            item_type = siblings.remove(name) if siblings is not None else None
+            if item_type == TYPE_FILE:
+                return
+            listing = self._listings.get(path)
+            if listing is not None and not listing:
+                # 空目录（自底向上删除时子项都已先移除）无需扫描子树
+                del self._listings[path]
+                self._queued.discard(path)
+                self._cond.notify_all()
+                return
+            for key in [k for k in self._listings if k == path or k.startswith(prefix)]:
+                del self._listings[key]
+            self._queued = {k for k in self._queued if k != path and not k.startswith(prefix)}
+            self._cond.notify_all()
+
+    def close(self):
+        """停止预取并关闭所有连接"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _relative(self, path: str) -> str:
+        """远程目录相对预取根目录的路径"""
+        return path[len(self._root):].strip('/')
+
+    def _next_path(self) -> Optional[str]:
+        """取出下一个要列出的目录（优先处理正在等待的），全部完成时返回None"""
+        with self._cond:
+            while not self._closed:
+                # 栈中已被提前取走或已移除的目录惰性跳过
+                for pending in (self._urgent, self._stack):
+                    while pending:
+                        path = pending.pop()
+                        if path in self._queued and path not in self._taken:
+                            self._taken.add(path)
+                            self._active += 1
+                            return path
+                if self._active == 0:
+                    # 其他线程也没有正在列出的目录，不会再有新目录加入
+                    self._cond.notify_all()
+                    return None
+                self._cond.wait()
+            return None
+
+    def _worker_loop(self):
+        """工作线程：在自己的自愈连接上不断列出目录，并把子目录加入待列队列；连接中断时重新连接后重新列出"""
+        session = ResilientSession(self.connection_factory, retries=self.retries, keepalive=0)
+        try:
+            while True:
+                path = self._next_path()
+                if path is None:
+                    break
+                items = None
+                try:
+                    items = session.run(list_remote_dir, path, self.use_mlsd, self.list_command)
+                except Exception as e:
+                    logger.warning(f"预取远程列表失败 {path}: {str(e)}")
+                with self._cond:
+                    self._active -= 1
+                    if items is None:
+                        self._queued.discard(path)
+                    elif path in self._queued:
+                        self._listings[path] = items
+                        skip = self.ignore.for_dir(self._relative(path)) if self.ignore else None
+                        for name, item_type in items.types():
+                            if item_type == TYPE_DIR and (skip is None or not skip(name, True)):
+                                child = f"{path.rstrip('/')}/{name}"
+                                self._queued.add(child)
+                                self._stack.append(child)
+                    self._cond.notify_all()
+        finally:
+            session.close()
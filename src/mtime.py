@@ -0,0 +1,132 @@
+import calendar
+import ftplib
+import io
+import logging
+import time
+from typing import Optional
+
+from capabilities import ServerCapabilities
+from session import is_connection_error
+
+logger = logging.getLogger(__name__)
+
+# 远程时间戳只精确到秒，本地mtime为浮点数，比较时允许的误差（秒）
+MTIME_TOLERANCE = 1.0
+
+CLOCK_PROBE_NAME = '.nodcat-clock-probe'
+
+
+def parse_ftp_time(time_str: Optional[str]) -> float:
+    """解析FTP时间戳（MLSD modify / MDTM，均为UTC，可能带小数秒），失败返回0"""
+    if not time_str:
+        return 0
+    try:
+        base, _, fraction = time_str.strip().partition('.')
+        timestamp = calendar.timegm(time.strptime(base[:14], "%Y%m%d%H%M%S"))
+        if fraction.isdigit():
+            timestamp += float('0.' + fraction)
+        return timestamp
+    except ValueError:
+        return 0
+
+
+def format_ftp_time(timestamp: float) -> str:
+    """将本地时间戳格式化为FTP使用的UTC时间（整秒）"""
+    return time.strftime("%Y%m%d%H%M%S", time.gmtime(int(timestamp)))
+
+
+class RemoteMtime:
+    """远程修改时间的设置与比较（处理时区、精度和服务器时钟偏差）"""
+    def __init__(self, capabilities: ServerCapabilities):
+        self.capabilities = capabilities
+        self.can_mfmt = capabilities.supports('MFMT')
+        # SITE UTIME不出现在FEAT中，首次尝试后才知道是否可用（结果保存在服务器能力档案中）
+        self.can_site_utime = capabilities.site_utime
+        # 服务器时钟 - 本地时钟（秒），档案中有测量结果时直接使用
+        self.skew = capabilities.clock_skew or 0.0
+
+    @property
+    def preserves_mtime(self) -> bool:
+        """上传后能否把远程mtime设为本地mtime"""
+        return self.can_mfmt or bool(self.can_site_utime)
+
+    def set_remote_mtime(self, ftp: ftplib.FTP, remote_path: str, mtime: float) -> bool:
+        """上传后设置远程文件修改时间，返回是否成功"""
+        stamp = format_ftp_time(mtime)
+        if self.can_mfmt:
+            try:
+                ftp.sendcmd(f"MFMT {stamp} {remote_path}")
+                return True
+            except ftplib.error_perm:
+                return False
+        if self.can_site_utime is not False:
+            try:
+                ftp.sendcmd(f"SITE UTIME {stamp} {remote_path}")
+                self.can_site_utime = True
+                return True
+            except ftplib.error_perm:
+                self.can_site_utime = False
+        return False
+
+    def query_remote_mtime(self, ftp: ftplib.FTP, remote_path: str) -> float:
+        """用MDTM查询远程文件的修改时间（UTC），服务器不支持或查询失败时返回0"""
+        if not self.capabilities.supports('MDTM'):
+            return 0
+        try:
+            resp = ftp.sendcmd(f"MDTM {remote_path}")
+        except ftplib.error_perm:
+            return 0
+        return parse_ftp_time(resp[4:])
+
+    @property
+    def needs_probe(self) -> bool:
+        """
+        是否需要测量时钟偏差：只有服务器不能设置修改时间时才按偏差比较（见is_current），
+        已测量过（结果在能力档案中）或服务器不支持MDTM时无需测量
+        """
+        return not self.preserves_mtime and self.capabilities.clock_skew is None \
+            and self.capabilities.supports('MDTM')
+
+    def probe_session(self, ftp: ftplib.FTP, remote_dir: str):
+        """
+        服务器不能设置修改时间时测量一次：上传空的探测文件，读取其MDTM测量服务器时钟偏差，
+        并试探SITE UTIME。结果记入能力档案（由调用方保存），之后的会话不再上传探测文件；
+        无写权限时偏差按0记录
+        """
+        if not self.needs_probe:
+            return
+        probe = f"{remote_dir.rstrip('/')}/{CLOCK_PROBE_NAME}"
+        try:
+            before = time.time()
+            ftp.storbinary(f"STOR {probe}", io.BytesIO(b''))
+            after = time.time()
+            resp = ftp.sendcmd(f"MDTM {probe}")
+            remote = parse_ftp_time(resp.split()[-1])
+            if remote:
+                self.skew = round(remote - (before + after) / 2)
+            self.set_remote_mtime(ftp, probe, after)
+        except ftplib.all_errors as e:
+            # 连接中断时由调用方重新连接后重新测量
+            if is_connection_error(e):
+                raise
+        finally:
+            try:
+                ftp.delete(probe)
+            except ftplib.all_errors as e:
+                if not is_connection_error(e):
+                    logger.warning(f"无法删除时钟探测文件 {probe}: {str(e)}")
+        self.capabilities.clock_skew = self.skew
+        self.capabilities.site_utime = self.can_site_utime
+
+    def is_current(self, local_mtime: float, remote_mtime: Optional[float]) -> bool:
+        """
+        远程文件的修改时间是否表明它与本地一致：
+        能设置远程mtime时要求两者相等（整秒精度），否则远程时间（扣除时钟偏差后）不早于本地修改时间即可
+        """
+        if not remote_mtime:
+            return False
+        if abs(int(local_mtime) - remote_mtime) <= MTIME_TOLERANCE:
+            return True
+        if not self.preserves_mtime:
+            return remote_mtime - self.skew >= local_mtime - MTIME_TOLERANCE
+        return False
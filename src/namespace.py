@@ -0,0 +1,107 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from listing import DirListing
+from manifest import normalize_remote_path
+
+# lookup的结果：确定不存在（父目录已完整列出且其中没有该名称）
+MISSING = 'missing'
+
+
+def _split(path: str):
+    """拆分为 (父目录, 名称)，根目录的父目录为None"""
+    path = path.rstrip('/') or '/'
+    if path == '/':
+        return None, ''
+    parent, name = path.rsplit('/', 1)
+    return parent or '/', name
+
+
+class RemoteNamespace:
+    """
+    一次会话内已知的远程路径及其类型：由目录列表和本程序自己的MKD/STOR/DELE/RMD维护，
+    存在性和类型判断先查这里，已知路径无需CWD试探或再次列出。
+    已列出目录的子项直接保存其紧凑列表，不再逐项记录完整路径
+    """
+    def __init__(self):
+        # 本程序创建的路径及已列出的目录本身（已列出目录的子项以列表为准）
+        self._types: Dict[str, str] = {}
+        # 已完整列出的目录及其子项 {目录: 列表}
+        self._children: Dict[str, DirListing] = {}
+        self._lock = threading.Lock()
+
+    def add_listing(self, path: str, items: DirListing):
+        """记录一次目录列表（保存items本身，调用方不应再修改），之后其中不存在的名称视为确定不存在"""
+        path = normalize_remote_path(path)
+        with self._lock:
+            self._set(path, 'dir')
+            self._children[path] = items
+
+    def add(self, path: str, item_type: str):
+        """记录本程序创建的目录（MKD）或上传的文件（STOR）"""
+        path = normalize_remote_path(path)
+        with self._lock:
+            self._set(path, item_type)
+            if item_type == 'dir':
+                # 新建的目录为空，等同于已列出
+                self._children.setdefault(path, DirListing())
+
+    def remove(self, path: str):
+        """记录本程序删除的文件（DELE）或目录（RMD，连同其子树）"""
+        path = normalize_remote_path(path)
+        parent, name = _split(path)
+        with self._lock:
+            item_type = self._types.pop(path, None)
+            siblings = self._children.get(parent)
+            if siblings is not None:
+                item_type = siblings.remove(name) or item_type
+            children = self._children.get(path)
+            if children is not None and not children:
+                # 自底向上删除时子项都已先移除，无需扫描子树
+                del self._children[path]
+            elif item_type != 'file':
+                prefix = path + '/'
+                for key in [k for k in self._types if k.startswith(prefix)]:
+                    del self._types[key]
+                for key in [k for k in self._children if k == path or k.startswith(prefix)]:
+                    del self._children[key]
+
+    def lookup(self, path: str) -> Optional[str]:
+        """返回 'dir'、'file'、MISSING（确定不存在），未知时返回None"""
+        path = normalize_remote_path(path)
+        parent, name = _split(path)
+        with self._lock:
+            item_type = self._types.get(path)
+            if item_type is not None:
+                return item_type
+            siblings = self._children.get(parent) if parent is not None else None
+            if siblings is not None:
+                return siblings.type_of(name) or MISSING
+            if self._types.get(parent) == 'file':
+                return MISSING
+        return None
+
+    def is_dir(self, path: str) -> Optional[bool]:
+        """路径是否为已存在的目录，未知时返回None"""
+        item_type = self.lookup(path)
+        if item_type is None:
+            return None
+        return item_type == 'dir'
+
+    def children(self, path: str) -> Optional[List[Tuple[str, str]]]:
+        """已完整列出的目录的子项 [(名称, 类型)]，未列出时返回None"""
+        with self._lock:
+            children = self._children.get(normalize_remote_path(path))
+            return list(children.types()) if children is not None else None
+
+    def _set(self, path: str, item_type: str):
+        """记录路径类型并更新已列出的父目录（调用方持有锁）"""
+        self._types[path] = item_type
+        parent, name = _split(path)
+        siblings = self._children.get(parent)
+        if siblings is not None:
+            siblings.add(name, item_type)
+        # 路径存在说明各级上级目录都存在
+        while parent is not None and self._types.get(parent) != 'dir':
+            self._types[parent] = 'dir'
+            parent, name = _split(parent)
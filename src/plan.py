@@ -0,0 +1,158 @@
+from typing import Dict, List, Optional, Tuple
+
+from scanner import LocalEntry
+
+# 动作类型
+ACTION_MKDIR = 'mkdir'
+ACTION_UPLOAD = 'upload'
+ACTION_DELETE = 'delete'
+ACTION_SKIP = 'skip'
+# 下载方向（从远程同步到本地）及双向同步使用的动作
+ACTION_DOWNLOAD = 'download'
+ACTION_LOCAL_MKDIR = 'local_mkdir'
+ACTION_LOCAL_DELETE = 'local_delete'
+ACTION_CONFLICT = 'conflict'
+# 本地改名或移动的条目：在服务器上RNFR/RNTO，不再删除后重新上传
+ACTION_RENAME = 'rename'
+
+
+class SyncAction:
+    """同步计划中的一个动作"""
+    __slots__ = ('kind', 'rel_path', 'remote_path', 'local_entry', 'item_type', 'verify_first', 'fingerprint',
+                 'remote_size', 'append_from', 'remote_mtime', 'target_path', 'source_rel', 'source_path')
+
+    def __init__(self, kind: str, rel_path: str, remote_path: str, local_entry: Optional[LocalEntry] = None,
+                 item_type: str = 'file', verify_first: bool = False, fingerprint: Optional[str] = None,
+                 remote_size: Optional[int] = None, append_from: Optional[int] = None,
+                 remote_mtime: Optional[float] = None, target_path: Optional[str] = None,
+                 source_rel: Optional[str] = None, source_path: Optional[str] = None):
+        """
+        :param local_entry: 上传的本地文件；下载动作为要写入的本地文件（大小即远程大小）
+        :param item_type: 删除动作的条目类型（file/dir）
+        :param verify_first: 上传前先用服务器端摘要校验，一致时不再上传
+        :param fingerprint: 跳过动作需要更新状态库时记录的指纹
+        :param remote_size: 上传动作在比对时得到的远程文件大小（0表示不存在），None表示未知
+        :param append_from: 本地文件只在该长度之后追加了内容，只需上传新增部分
+        :param remote_mtime: 下载动作的远程修改时间（写入本地文件，未知时为None）
+        :param target_path: 冲突动作中本地文件改名保留的路径
+        :param source_rel: 改名动作的原相对路径（状态库的键）
+        :param source_path: 改名动作执行时的远程原路径（已计入先执行的目录改名）
+        """
+        self.kind = kind
+        self.rel_path = rel_path
+        self.remote_path = remote_path
+        self.local_entry = local_entry
+        self.item_type = item_type
+        self.verify_first = verify_first
+        self.fingerprint = fingerprint
+        self.remote_size = remote_size
+        self.append_from = append_from
+        self.remote_mtime = remote_mtime
+        self.target_path = target_path
+        self.source_rel = source_rel
+        self.source_path = source_path
+
+    @property
+    def name(self) -> str:
+        return self.rel_path.rsplit('/', 1)[-1]
+
+    @property
+    def size(self) -> int:
+        """计划传输的字节数（追加写入的文件只计新增部分，其他动作为0）"""
+        if self.kind == ACTION_UPLOAD and self.local_entry:
+            return self.local_entry.size - (self.append_from or 0)
+        if self.kind == ACTION_DOWNLOAD and self.local_entry:
+            return self.local_entry.size
+        return 0
+
+
+class SyncPlan:
+    """
+    一次同步的完整计划：比对阶段只生成计划，不修改远程和本地，
+    由执行阶段按计划建目录、删除、上传和下载（也可只输出计划用于预演）
+    """
+    def __init__(self):
+        self.mkdirs: List[SyncAction] = []
+        self.deletes: List[SyncAction] = []
+        self.uploads: List[SyncAction] = []
+        # 需要在执行后更新状态库的跳过动作；完全无需处理的文件只计数，不生成动作
+        self.skips: List[SyncAction] = []
+        self.unchanged = 0
+        self.downloads: List[SyncAction] = []
+        self.local_mkdirs: List[SyncAction] = []
+        self.local_deletes: List[SyncAction] = []
+        # 两端都有修改的文件：本地版本改名保留后再同步另一端的版本
+        self.conflicts: List[SyncAction] = []
+        # 按执行顺序排列的远程改名（目录在前），及改名失败时的替代方案
+        # {改名后的相对路径: (改为执行的动作, 撤销的动作)}
+        self.renames: List[SyncAction] = []
+        self.rename_fallbacks: Dict[str, Tuple[List[SyncAction], List[SyncAction]]] = {}
+        # 两端都已不存在、需要从状态库删除的条目（相对路径）
+        self.forgotten: List[str] = []
+        # 比对过的目录（相对路径），全部执行成功后记入状态库
+        self.visited_dirs: List[str] = []
+        # 未能同步的条目 {路径: 错误信息}：远程条目为远程路径，本地条目为本地路径
+        self.failures: Dict[str, str] = {}
+        # 上次同步测得的上传速率（字节/秒），用于预估耗时
+        self.upload_rate: Optional[float] = None
+
+    def add(self, action: SyncAction):
+        """按类型加入计划"""
+        {
+            ACTION_MKDIR: self.mkdirs,
+            ACTION_DELETE: self.deletes,
+            ACTION_UPLOAD: self.uploads,
+            ACTION_SKIP: self.skips,
+            ACTION_DOWNLOAD: self.downloads,
+            ACTION_LOCAL_MKDIR: self.local_mkdirs,
+            ACTION_LOCAL_DELETE: self.local_deletes,
+            ACTION_CONFLICT: self.conflicts,
+            ACTION_RENAME: self.renames,
+        }[action.kind].append(action)
+
+    @property
+    def upload_bytes(self) -> int:
+        """计划上传的总字节数"""
+        return sum(action.size for action in self.uploads)
+
+    @property
+    def download_bytes(self) -> int:
+        """计划下载的总字节数"""
+        return sum(action.size for action in self.downloads)
+
+    @property
+    def is_empty(self) -> bool:
+        """是否没有任何需要修改远程或本地的动作"""
+        return not (self.mkdirs or self.deletes or self.uploads or self.downloads or self.renames
+                    or self.local_mkdirs or self.local_deletes or self.conflicts)
+
+    def summary(self) -> dict:
+        """计划统计（速率已知时包含预估耗时，单位秒）"""
+        stats = {
+            'mkdirs': len(self.mkdirs),
+            'uploads': len(self.uploads),
+            'upload_bytes': self.upload_bytes,
+            'deletes': len(self.deletes),
+            'skips': len(self.skips) + self.unchanged,
+        }
+        if self.renames:
+            stats['renames'] = len(self.renames)
+        if self.downloads or self.local_mkdirs or self.local_deletes or self.conflicts:
+            stats.update({
+                'local_mkdirs': len(self.local_mkdirs),
+                'downloads': len(self.downloads),
+                'download_bytes': self.download_bytes,
+                'local_deletes': len(self.local_deletes),
+                'conflicts': len(self.conflicts),
+            })
+        estimate = self.estimate_seconds()
+        if estimate is not None:
+            stats['estimated_seconds'] = round(estimate, 1)
+        return stats
+
+    def estimate_seconds(self, bytes_per_second: Optional[float] = None) -> Optional[float]:
+        """按给定带宽（默认为上次测得的上传速率）估算上传所需时间，带宽未知时返回None"""
+        rate = bytes_per_second or self.upload_rate
+        if not rate or rate <= 0:
+            return None
+        return self.upload_bytes / rate
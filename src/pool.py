@@ -0,0 +1,90 @@
+import queue
+import threading
+
+from session import DEFAULT_RETRIES, KEEPALIVE_INTERVAL, ResilientSession
+
+
+class FTPWorkerPool:
+    """FTP多连接工作池（每个工作线程独占一条已登录的自愈连接）"""
+    def __init__(self, connection_factory, size: int, retries: int = DEFAULT_RETRIES,
+                 keepalive: float = KEEPALIVE_INTERVAL):
+        """
+        :param connection_factory: 无参函数，返回已登录的ftplib.FTP
+        :param size: 连接（工作线程）数量
+        :param retries: 连接中断时重新连接并重试当前任务的次数（见ResilientSession）
+        :param keepalive: 工作线程空闲多少秒后发送NOOP，0表示不发送
+        """
+        self.connection_factory = connection_factory
+        self.size = max(1, int(size))
+        self.retries = retries
+        self.keepalive = keepalive
+        # 有界队列：遍历速度快于传输时形成背压
+        self._tasks = queue.Queue(maxsize=self.size * 4)
+        self._threads = []
+        self._errors = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def submit(self, func, *args):
+        """提交任务，任务以 func(ftp, *args) 的形式在工作连接上执行"""
+        if self._closed:
+            raise RuntimeError("连接池已关闭")
+        if len(self._threads) < self.size:
+            self._start_worker()
+        self._tasks.put((func, args))
+
+    def wait(self):
+        """等待已提交任务全部完成，有任务失败时抛出第一个异常"""
+        self._tasks.join()
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def close(self):
+        """关闭所有工作线程及其连接"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._tasks.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start_worker(self):
+        """启动一个工作线程"""
+        thread = threading.Thread(target=self._worker_loop, daemon=True)
+        self._threads.append(thread)
+        thread.start()
+
+    def _worker_loop(self):
+        """
+        工作线程主循环：在自己的连接上依次执行任务，连接中断时重新连接后重试当前任务（任务需可重复执行）；
+        等待任务期间连接空闲过久时发送NOOP
+        """
+        session = ResilientSession(self.connection_factory, retries=self.retries, keepalive=0)
+        while True:
+            try:
+                task = self._tasks.get(timeout=self.keepalive) if self.keepalive else self._tasks.get()
+            except queue.Empty:
+                session.noop()
+                continue
+            if task is None:
+                self._tasks.task_done()
+                break
+            func, args = task
+            try:
+                session.run(func, *args)
+            except Exception as e:
+                with self._lock:
+                    self._errors.append(e)
+            finally:
+                self._tasks.task_done()
+        session.close()
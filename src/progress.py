@@ -0,0 +1,142 @@
+import math
+import threading
+import time
+from typing import NamedTuple, Optional
+
+# 进度回调的最短间隔（秒），即最多每秒10次
+PROGRESS_INTERVAL = 0.1
+# 速率滑动平均的时间常数（秒）
+RATE_WINDOW = 5.0
+
+
+class ProgressSnapshot(NamedTuple):
+    """
+    某一时刻的同步进度：百分比按字节加动作数计算（每个动作计1，空文件和删除也能推进进度），
+    rate为传输速率的滑动平均（字节/秒），eta为预计剩余秒数，尚未测得速率时均为None
+    """
+    percent: int
+    message: str
+    bytes_done: int
+    bytes_total: int
+    items_done: int
+    items_total: int
+    rate: Optional[float]
+    eta: Optional[float]
+
+
+class ProgressTracker:
+    """
+    汇总各连接上报的传输字节和完成的动作，按固定间隔合并为一次回调（间隔内只保留最新的消息），
+    大量小文件时不会刷满界面事件队列，单个大文件传输时进度也随字节推进。线程安全
+    """
+    def __init__(self, callback=None, interval: float = PROGRESS_INTERVAL, window: float = RATE_WINDOW,
+                 clock=time.monotonic):
+        """
+        :param callback: 以ProgressSnapshot调用，在上报进度的线程中执行
+        """
+        self.callback = callback
+        self.interval = interval
+        self.window = window
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.start(0, 0)
+
+    def start(self, bytes_total: int, items_total: int):
+        """开始执行计划：重置计数，设置总字节数和动作数"""
+        with self._lock:
+            self._bytes_total = bytes_total
+            self._items_total = items_total
+            self._bytes_done = 0
+            self._items_done = 0
+            now = self._clock()
+            self._sample_time = now
+            self._sample_bytes = 0
+            self._sample_units = 0
+            self._byte_rate = None
+            self._unit_rate = None
+            # 第一次上报立即回调
+            self._emitted = -math.inf
+
+    def expand(self, bytes_count: int = 0, items: int = 0):
+        """执行中调整总量（删除时展开的目录子树、改名失败后恢复的动作等），可以为负"""
+        with self._lock:
+            self._bytes_total += bytes_count
+            self._items_total += items
+
+    def advance(self, message: str, bytes_count: int = 0, items: int = 0):
+        """累计完成的字节和动作，距上次回调已满间隔时回调"""
+        with self._lock:
+            self._bytes_done += bytes_count
+            self._items_done += items
+            now = self._clock()
+            if now - self._emitted >= self.interval:
+                self._emit(message, now)
+
+    def finish(self, message: str):
+        """立即以100%回调（同步完成或没有需要执行的动作）"""
+        with self._lock:
+            self._bytes_done = self._bytes_total
+            self._items_done = self._items_total
+            self._emit(message, self._clock(), percent=100)
+
+    def _emit(self, message: str, now: float, percent: Optional[int] = None):
+        self._update_rate(now)
+        self._emitted = now
+        if self.callback:
+            snapshot = self._snapshot(message)
+            self.callback(snapshot if percent is None else snapshot._replace(percent=percent))
+
+    def _update_rate(self, now: float):
+        """
+        按上次采样以来的增量更新速率的指数滑动平均（首次采样直接取瞬时速率）；
+        距上次采样不足一个间隔时不采样，开始执行后的第一次回调只有计数
+        """
+        elapsed = now - self._sample_time
+        if elapsed < self.interval or elapsed <= 0:
+            return
+        units = self._bytes_done + self._items_done
+        byte_rate = (self._bytes_done - self._sample_bytes) / elapsed
+        unit_rate = (units - self._sample_units) / elapsed
+        if self._byte_rate is None:
+            self._byte_rate, self._unit_rate = byte_rate, unit_rate
+        else:
+            weight = 1 - math.exp(-elapsed / self.window)
+            self._byte_rate += weight * (byte_rate - self._byte_rate)
+            self._unit_rate += weight * (unit_rate - self._unit_rate)
+        self._sample_time = now
+        self._sample_bytes = self._bytes_done
+        self._sample_units = units
+
+    def _snapshot(self, message: str) -> ProgressSnapshot:
+        total = self._bytes_total + self._items_total
+        done = self._bytes_done + self._items_done
+        percent = min(int(done / total * 100), 100) if total else 100
+        eta = None
+        # 剩余时间按字节与动作数合计的速率推算，大量小文件时同样适用
+        if self._unit_rate and done < total:
+            eta = (total - done) / self._unit_rate
+        return ProgressSnapshot(percent, message, self._bytes_done, self._bytes_total,
+                                self._items_done, self._items_total, self._byte_rate, eta)
+
+
+def format_rate(bytes_per_second: Optional[float]) -> str:
+    """速率的可读形式，如"3.2 MB/s"，未知时为空字符串"""
+    if bytes_per_second is None:
+        return ''
+    value = float(bytes_per_second)
+    for unit in ('B/s', 'KB/s', 'MB/s', 'GB/s'):
+        if value < 1024 or unit == 'GB/s':
+            return f"{value:.0f} {unit}" if unit == 'B/s' else f"{value:.1f} {unit}"
+        value /= 1024
+
+
+def format_duration(seconds: Optional[float]) -> str:
+    """剩余时间的可读形式，如"1时05分"、"3分20秒"，未知时为空字符串"""
+    if seconds is None:
+        return ''
+    seconds = int(round(seconds))
+    if seconds >= 3600:
+        return f"{seconds // 3600}时{seconds % 3600 // 60:02d}分"
+    if seconds >= 60:
+        return f"{seconds // 60}分{seconds % 60:02d}秒"
+    return f"{seconds}秒"
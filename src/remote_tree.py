@@ -0,0 +1,285 @@
+from typing import List, Optional, Tuple
+
+from PyQt5.QtCore import QAbstractItemModel, QModelIndex, Qt, pyqtSignal
+
+from listing import TYPE_DIR, TYPE_FILE, ListingEntry
+
+# 条目类型（紧凑存储为单字节）
+KIND_DIR = ord('d')
+KIND_FILE = ord('f')
+# NLST列表中的条目及符号链接，展开时才确认是否为目录
+KIND_UNKNOWN = ord('u')
+
+# 节点路径的数据角色
+PATH_ROLE = Qt.UserRole + 1
+# 每次向视图加入的行数
+FETCH_BATCH = 500
+
+
+def compact_records(entries: List[ListingEntry]) -> Tuple[List[str], bytearray]:
+    """
+    把列表条目转为紧凑记录：名称列表和等长的类型字节数组，目录在前、按名称排序；
+    类型未知的条目（NLST列表、符号链接）展开时才确认
+    """
+    records = []
+    for entry in entries:
+        kind = KIND_DIR if entry.type == TYPE_DIR else KIND_FILE if entry.type == TYPE_FILE else KIND_UNKNOWN
+        records.append((kind == KIND_FILE, entry.name, kind))
+    records.sort()
+    return [name for _, name, _ in records], bytearray(kind for _, _, kind in records)
+
+
+class RemoteNode:
+    """
+    远程树中的一个目录或文件节点：目录的子项以紧凑记录保存，
+    只有已交给视图的行才创建子节点对象
+    """
+    __slots__ = ('name', 'path', 'kind', 'parent', 'row', 'names', 'kinds', 'visible', 'nodes',
+                 'fetched', 'loading', 'stalled', 'filter_text')
+
+    def __init__(self, name: str, path: str, kind: int, parent: Optional['RemoteNode'] = None, row: int = 0):
+        self.name = name
+        self.path = path
+        self.kind = kind
+        self.parent = parent
+        self.row = row
+        # 子项记录（未列出时为None）及过滤后可见的记录序号
+        self.names: Optional[List[str]] = None
+        self.kinds: Optional[bytearray] = None
+        self.visible: List[int] = []
+        # 已创建的子节点 {记录序号: 节点}，过滤条件变化后仍保留
+        self.nodes = {}
+        # 已交给视图的行数
+        self.fetched = 0
+        self.loading = False
+        # 加载失败或被取消的原因，重新展开前不再自动请求
+        self.stalled: Optional[str] = None
+        self.filter_text = ''
+
+    @property
+    def listed(self) -> bool:
+        return self.names is not None
+
+    def child(self, row: int) -> 'RemoteNode':
+        """第row个可见子项的节点（按需创建）"""
+        record = self.visible[row]
+        node = self.nodes.get(record)
+        if node is None:
+            name = self.names[record]
+            # 顶层节点的子项为起始目录，路径即名称
+            path = f"{self.path.rstrip('/')}/{name}" if self.path else name
+            node = RemoteNode(name, path, self.kinds[record], self, row)
+            self.nodes[record] = node
+        node.row = row
+        return node
+
+
+class RemoteTreeModel(QAbstractItemModel):
+    """
+    远程目录树模型：目录展开时通过directory_requested请求后台列出，
+    列表以紧凑记录保存，并按FETCH_BATCH分批交给视图，内存和绘制开销与目录大小无关；
+    名称过滤直接作用于记录
+    """
+    directory_requested = pyqtSignal(str, bool)
+
+    def __init__(self, root_path: str = '/', parent=None):
+        super().__init__(parent)
+        # 不可见的顶层节点，其唯一的子项为起始目录
+        self._top = RemoteNode('', '', KIND_DIR)
+        self._top.names = [root_path]
+        self._top.kinds = bytearray([KIND_DIR])
+        self._top.visible = [0]
+        self._top.fetched = 1
+        self._pending = {}
+
+    # ---- 模型接口 ----
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self._node(parent)
+        if column != 0 or row < 0 or row >= node.fetched:
+            return QModelIndex()
+        return self.createIndex(row, 0, node.child(row))
+
+    def parent(self, index=QModelIndex()):
+        if not index.isValid():
+            return QModelIndex()
+        node = index.internalPointer().parent
+        if node is None or node is self._top:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.column() > 0:
+            return 0
+        return self._node(parent).fetched
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self._node(parent)
+        if node.kind == KIND_FILE:
+            return False
+        return not node.listed or bool(node.visible)
+
+    def canFetchMore(self, parent):
+        node = self._node(parent)
+        if node.kind == KIND_FILE:
+            return False
+        if not node.listed:
+            return not node.loading and node.stalled is None
+        return node.fetched < len(node.visible)
+
+    def fetchMore(self, parent):
+        node = self._node(parent)
+        if not node.listed:
+            if not node.loading and node.stalled is None:
+                node.loading = True
+                self._pending[node.path] = node
+                self.directory_requested.emit(node.path, node.kind == KIND_UNKNOWN)
+            return
+        remaining = len(node.visible) - node.fetched
+        if remaining <= 0:
+            return
+        count = min(FETCH_BATCH, remaining)
+        self.beginInsertRows(parent, node.fetched, node.fetched + count - 1)
+        node.fetched += count
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role == Qt.DisplayRole:
+            label = node.name + ('/' if node.kind == KIND_DIR and node.parent is not self._top else '')
+            if node.loading:
+                label += '  (加载中...)'
+            elif node.stalled:
+                label += f'  ({node.stalled})'
+            return label
+        if role == PATH_ROLE:
+            return node.path
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole and section == 0:
+            return 'FTP目录结构'
+        return None
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable
+
+    # ---- 后台列表结果 ----
+
+    def set_listing(self, path: str, entries: List[ListingEntry]):
+        """目录列表完成：保存紧凑记录并交给视图第一批行"""
+        node = self._pending.pop(path, None)
+        if node is None:
+            return
+        node.loading = False
+        node.kind = KIND_DIR
+        node.names, node.kinds = compact_records(entries)
+        node.nodes = {}
+        node.visible = self._matching(node, range(len(node.names)), node.filter_text)
+        index = self._index_of(node)
+        self.dataChanged.emit(index, index)
+        self.fetchMore(index)
+
+    def set_not_directory(self, path: str):
+        """类型未知的条目经确认是文件"""
+        node = self._pending.pop(path, None)
+        if node is None:
+            return
+        node.loading = False
+        node.kind = KIND_FILE
+        index = self._index_of(node)
+        self.dataChanged.emit(index, index)
+
+    def set_failed(self, path: str, error: str):
+        """列表失败：在节点上显示原因，重新展开时重试"""
+        self._stall(self._pending.pop(path, None), f"加载失败: {error}")
+
+    def cancel_pending(self) -> int:
+        """取消所有等待中的列表请求，返回取消的数量"""
+        nodes = list(self._pending.values())
+        self._pending.clear()
+        for node in nodes:
+            self._stall(node, "已取消")
+        return len(nodes)
+
+    def retry(self, index: QModelIndex):
+        """重新请求加载失败或被取消的目录"""
+        node = self._node(index)
+        if node.stalled is not None:
+            node.stalled = None
+            self.dataChanged.emit(index, index)
+            self.fetchMore(index)
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    # ---- 过滤 ----
+
+    def directory_of(self, index: QModelIndex) -> QModelIndex:
+        """index为目录时返回自身，为文件时返回其所在目录，无效时返回起始目录"""
+        if not index.isValid():
+            return self.index(0, 0)
+        if index.internalPointer().kind == KIND_FILE:
+            return index.parent()
+        return index
+
+    def filter_text(self, index: QModelIndex) -> str:
+        """目录当前的过滤条件"""
+        return self._node(index).filter_text
+
+    def set_filter(self, index: QModelIndex, text: str):
+        """
+        按名称（不区分大小写的子串）过滤目录的子项；新条件包含旧条件时只在当前可见的记录中筛选。
+        可见行重新分批交给视图，已创建的子节点（及其已列出的内容）保留
+        """
+        node = self._node(index)
+        text = text.strip().lower()
+        if text == node.filter_text:
+            return
+        if not node.listed:
+            node.filter_text = text
+            return
+        candidates = node.visible if node.filter_text and node.filter_text in text else range(len(node.names))
+        visible = self._matching(node, candidates, text)
+        if node.fetched:
+            self.beginRemoveRows(index, 0, node.fetched - 1)
+            node.fetched = 0
+            node.visible = []
+            self.endRemoveRows()
+        node.filter_text = text
+        node.visible = visible
+        self.fetchMore(index)
+
+    @staticmethod
+    def _matching(node: RemoteNode, records, text: str) -> List[int]:
+        """筛选名称包含text的记录序号"""
+        if not text:
+            return list(records)
+        names = node.names
+        return [record for record in records if text in names[record].lower()]
+
+    # ---- 内部 ----
+
+    def _node(self, index: QModelIndex) -> RemoteNode:
+        return index.internalPointer() if index.isValid() else self._top
+
+    def _index_of(self, node: RemoteNode) -> QModelIndex:
+        if node is self._top:
+            return QModelIndex()
+        return self.createIndex(node.row, 0, node)
+
+    def _stall(self, node: Optional[RemoteNode], reason: str):
+        if node is None:
+            return
+        node.loading = False
+        node.stalled = reason
+        index = self._index_of(node)
+        self.dataChanged.emit(index, index)
@@ -0,0 +1,201 @@
+import ftplib
+import hashlib
+import re
+import weakref
+import zlib
+from typing import Optional, Tuple
+
+from capabilities import ServerCapabilities
+
+# HASH命令的算法优先级（越靠前越好）
+HASH_PREFERENCE = ['SHA-256', 'SHA-512', 'SHA-1', 'MD5', 'CRC32']
+# 旧式扩展命令及其对应算法，按优先级排列
+X_COMMANDS = [('XSHA256', 'SHA-256'), ('XSHA1', 'SHA-1'), ('XMD5', 'MD5'), ('XCRC', 'CRC32')]
+# 各算法十六进制摘要长度，用于从不规范的响应中提取摘要
+DIGEST_LENGTHS = {'SHA-256': 64, 'SHA-512': 128, 'SHA-1': 40, 'MD5': 32, 'CRC32': 8}
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class _Crc32:
+    """与hashlib接口一致的CRC32"""
+    def __init__(self):
+        self.value = 0
+
+    def update(self, data):
+        self.value = zlib.crc32(data, self.value)
+
+    def hexdigest(self) -> str:
+        return f"{self.value & 0xffffffff:08x}"
+
+
+def new_hasher(algorithm: str):
+    """按FTP算法名创建本地哈希对象"""
+    if algorithm == 'CRC32':
+        return _Crc32()
+    return hashlib.new(algorithm.replace('-', '').lower())
+
+
+def local_digest(local_path: str, algorithm: str, start: int = 0, end: Optional[int] = None) -> str:
+    """计算本地文件 [start, end) 区间的摘要，end为None表示到文件末尾"""
+    hasher = new_hasher(algorithm)
+    with open(local_path, 'rb') as f:
+        f.seek(start)
+        remaining = None if end is None else end - start
+        while remaining is None or remaining > 0:
+            size = READ_CHUNK_SIZE if remaining is None else min(READ_CHUNK_SIZE, remaining)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            hasher.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return hasher.hexdigest()
+
+
+class RemoteVerifier:
+    """
+    远程文件校验：优先使用服务器端的HASH / XSHA* / XMD5 / XCRC命令（只需一次往返），
+    服务器不支持时退回到读取指定字节数后即中止的区间下载
+    """
+    def __init__(self, capabilities: ServerCapabilities):
+        self.capabilities = capabilities
+        self.hash_algorithm = None
+        self.x_command = None
+        self.x_algorithm = None
+        # 服务器是否支持区间摘要（HASH配合RANG，或X*命令带起止位置），首次尝试后确定
+        self.range_supported = None
+
+        available = capabilities.hash_algorithms()
+        for algo in HASH_PREFERENCE:
+            if algo in available:
+                self.hash_algorithm = algo
+                break
+        for command, algo in X_COMMANDS:
+            if capabilities.supports(command):
+                self.x_command, self.x_algorithm = command, algo
+                break
+        # 首选算法不是服务器默认算法时，每条连接需先用OPTS HASH选择一次
+        self._needs_opts = self.hash_algorithm is not None and available[0] != self.hash_algorithm
+        self._selected_on = weakref.WeakSet()
+
+    @property
+    def can_hash(self) -> bool:
+        """服务器是否提供任何摘要命令"""
+        return bool(self.hash_algorithm or self.x_command)
+
+    def remote_digest(self, ftp: ftplib.FTP, remote_path: str, start: Optional[int] = None,
+                      end: Optional[int] = None) -> Optional[Tuple[str, str]]:
+        """
+        获取远程文件（或 [start, end) 区间）的摘要，返回 (算法, 十六进制摘要)，
+        服务器不支持时返回None
+        """
+        ranged = start is not None
+        if ranged and self.range_supported is False:
+            return None
+        if self.hash_algorithm:
+            result = self._hash_command(ftp, remote_path, start, end)
+            if result or not self.x_command:
+                return result
+        if self.x_command:
+            return self._x_command(ftp, remote_path, start, end)
+        return None
+
+    def _hash_command(self, ftp: ftplib.FTP, remote_path: str, start: Optional[int],
+                      end: Optional[int]) -> Optional[Tuple[str, str]]:
+        """使用HASH命令（区间摘要需要RANG）"""
+        try:
+            if self._needs_opts and ftp not in self._selected_on:
+                ftp.sendcmd(f"OPTS HASH {self.hash_algorithm}")
+                self._selected_on.add(ftp)
+            if start is not None:
+                if not self.capabilities.supports('RANG'):
+                    self.range_supported = False
+                    return None
+                # RANG的结束位置包含在区间内
+                ftp.sendcmd(f"RANG {start} {end - 1}")
+            resp = ftp.sendcmd(f"HASH {remote_path}")
+        except ftplib.error_perm:
+            if start is not None:
+                self.range_supported = False
+            return None
+        # 213 SHA-256 0-49 <摘要> <文件名>
+        parts = resp.split(None, 4)
+        if len(parts) >= 4:
+            if start is not None:
+                self.range_supported = True
+            return parts[1].upper(), parts[3].lower()
+        return None
+
+    def _x_command(self, ftp: ftplib.FTP, remote_path: str, start: Optional[int],
+                   end: Optional[int]) -> Optional[Tuple[str, str]]:
+        """使用XSHA*/XMD5/XCRC命令（部分服务器支持在路径后附加起止位置）"""
+        cmd = f"{self.x_command} {remote_path}"
+        if start is not None:
+            cmd += f" {start} {end}"
+        try:
+            resp = ftp.sendcmd(cmd)
+        except ftplib.error_perm:
+            if start is not None:
+                self.range_supported = False
+            return None
+        digest = self._extract_digest(resp, self.x_algorithm)
+        if digest and start is not None:
+            self.range_supported = True
+        return (self.x_algorithm, digest) if digest else None
+
+    @staticmethod
+    def _extract_digest(resp: str, algorithm: str) -> Optional[str]:
+        """从响应中找出长度符合算法的十六进制串"""
+        length = DIGEST_LENGTHS[algorithm]
+        for token in reversed(resp.split()[1:]):
+            if len(token) == length and re.fullmatch(r'[0-9a-fA-F]+', token):
+                return token.lower()
+        return None
+
+    def read_range(self, ftp: ftplib.FTP, remote_path: str, offset: int, length: int) -> bytes:
+        """从指定位置读取远程文件的length个字节，读够后立即关闭数据连接，不下载剩余部分"""
+        chunks = []
+        received = 0
+        ftp.voidcmd('TYPE I')
+        conn = ftp.transfercmd(f"RETR {remote_path}", rest=offset)
+        try:
+            while received < length:
+                data = conn.recv(min(65536, length - received))
+                if not data:
+                    break
+                chunks.append(data)
+                received += len(data)
+        finally:
+            conn.close()
+        try:
+            ftp.voidresp()
+        except (ftplib.error_temp, ftplib.error_reply):
+            # 提前关闭数据连接时服务器通常回复426
+            pass
+        return b''.join(chunks)
+
+    def verify_file(self, ftp: ftplib.FTP, local_path: str, remote_path: str) -> Optional[bool]:
+        """用服务器摘要校验整个文件，无法校验时返回None"""
+        result = self.remote_digest(ftp, remote_path)
+        if not result:
+            return None
+        algorithm, digest = result
+        return local_digest(local_path, algorithm) == digest
+
+    def verify_range(self, ftp: ftplib.FTP, local_path: str, remote_path: str,
+                     start: int, end: int, sample_size: int = 64 * 1024) -> bool:
+        """
+        校验远程文件 [start, end) 区间与本地一致：优先使用区间摘要，
+        否则读取区间末尾的sample_size字节与本地比对
+        """
+        result = self.remote_digest(ftp, remote_path, start, end)
+        if result:
+            algorithm, digest = result
+            return local_digest(local_path, algorithm, start, end) == digest
+        sample_start = max(start, end - sample_size)
+        remote_bytes = self.read_range(ftp, remote_path, sample_start, end - sample_start)
+        with open(local_path, 'rb') as f:
+            f.seek(sample_start)
+            local_bytes = f.read(end - sample_start)
+        return remote_bytes == local_bytes
@@ -0,0 +1,97 @@
+from typing import Dict, List, Tuple
+
+from scanner import LocalEntry
+from state import parent_of
+
+# 目录整体改名至少要解释原目录中（未移往别处的）这一比例的文件，否则逐个文件改名
+DIR_MATCH_RATIO = 0.5
+
+
+def is_within(rel_path: str, root: str) -> bool:
+    """rel_path是否为root本身或位于root之下"""
+    return rel_path == root or rel_path.startswith(root + '/')
+
+
+def match_files(deleted: Dict[str, dict], added: Dict[str, LocalEntry], fingerprints) -> Dict[str, str]:
+    """
+    按大小和内容指纹把本地新增的文件与远程将被删除的文件一一配对，返回 {新相对路径: 原相对路径}。
+    只为大小与某个被删除文件相同的新文件计算指纹；记录中还没有指纹的（完整模式下传输后留待下次扫描补算），
+    与判断文件未变时一样按大小和修改时间配对。空文件重新上传的代价不高于改名，不参与配对
+    :param deleted: 将被删除的条目在状态库中的记录 {相对路径: 记录}
+    :param added: 本地新增的文件 {相对路径: 本地条目}
+    """
+    by_size, by_time = set(), set()
+    pools: Dict[Tuple[int, object], List[str]] = {}
+    for rel, record in sorted(deleted.items()):
+        if record['type'] != 'file' or not record['size']:
+            continue
+        if fingerprints.is_comparable(record['fingerprint']):
+            by_size.add(record['size'])
+            pools.setdefault((record['size'], record['fingerprint']), []).append(rel)
+        elif not record['fingerprint']:
+            by_time.add(record['size'])
+            pools.setdefault((record['size'], record['mtime_ns']), []).append(rel)
+    candidates = sorted((rel, entry) for rel, entry in added.items()
+                        if entry.size in by_size or entry.size in by_time)
+    if not candidates:
+        return {}
+    digests = fingerprints.fingerprint_many(entry for _, entry in candidates if entry.size in by_size)
+    matches = {}
+    for rel, entry in candidates:
+        sources = pools.get((entry.size, digests.get(entry.path))) or pools.get((entry.size, entry.mtime_ns))
+        if not sources:
+            continue
+        # 内容相同的多个原文件中优先选同名的（移动），其次按路径顺序
+        name = rel.rsplit('/', 1)[-1]
+        source = next((old for old in sources if old.rsplit('/', 1)[-1] == name), sources[0])
+        sources.remove(source)
+        matches[rel] = source
+    return matches
+
+
+def choose_dir_renames(matches: Dict[str, str], new_dirs: set, deleted: Dict[str, dict]) -> List[Tuple[str, str]]:
+    """
+    由文件配对推断整个目录的改名：配对的两个文件去掉相同的尾部路径后，
+    新旧两侧分别是本地新建的目录和将被删除的目录时，为该目录对计一票。
+    按票数从多到少选取，新目录之间不嵌套，原目录不重复；返回 [(新目录, 原目录)]，按原目录从深到浅排列（执行顺序）
+    """
+    votes: Dict[Tuple[str, str], int] = {}
+    for new, old in matches.items():
+        new_dir, old_dir = parent_of(new), parent_of(old)
+        while new_dir and old_dir:
+            if new_dir in new_dirs and deleted.get(old_dir, {}).get('type') == 'dir':
+                votes[(new_dir, old_dir)] = votes.get((new_dir, old_dir), 0) + 1
+            if new_dir.rsplit('/', 1)[-1] != old_dir.rsplit('/', 1)[-1]:
+                break
+            new_dir, old_dir = parent_of(new_dir), parent_of(old_dir)
+    if not votes:
+        return []
+
+    # 各原目录子树中的文件数
+    file_counts: Dict[str, int] = {}
+    for rel, record in deleted.items():
+        if record['type'] != 'file':
+            continue
+        ancestor = parent_of(rel)
+        while ancestor:
+            file_counts[ancestor] = file_counts.get(ancestor, 0) + 1
+            ancestor = parent_of(ancestor)
+
+    chosen = []
+    for (new_dir, old_dir), count in sorted(votes.items(), key=lambda item: (-item[1], item[0][0].count('/'))):
+        if any(is_within(new_dir, n) or is_within(n, new_dir) or old == old_dir for n, old in chosen):
+            continue
+        # 原目录中已配对到新目录之外的文件是单独移走的，不计入基数
+        moved_away = sum(1 for new, old in matches.items()
+                         if is_within(old, old_dir) and not is_within(new, new_dir))
+        if count >= DIR_MATCH_RATIO * (file_counts.get(old_dir, 0) - moved_away):
+            chosen.append((new_dir, old_dir))
+    return sorted(chosen, key=lambda pair: -pair[1].count('/'))
+
+
+def relocate(rel_path: str, dir_renames: List[Tuple[str, str]]) -> str:
+    """原相对路径在目录改名执行后的位置（由包含它的最深的改名目录决定）"""
+    for new_dir, old_dir in dir_renames:
+        if is_within(rel_path, old_dir):
+            return new_dir + rel_path[len(old_dir):]
+    return rel_path
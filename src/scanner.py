@@ -0,0 +1,161 @@
+import logging
+import os
+from array import array
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from ignore import IgnoreMatcher
+
+logger = logging.getLogger(__name__)
+
+
+class LocalEntry:
+    """本地目录项（只保存比对所需的字段）"""
+    __slots__ = ('name', 'path', 'is_dir', 'size', 'mtime', 'mtime_ns', 'dev', 'ino')
+
+    def __init__(self, name: str, path: str, is_dir: bool, size: int = 0,
+                 mtime: float = 0, mtime_ns: int = 0, dev: int = 0, ino: int = 0):
+        self.name = name
+        self.path = path
+        self.is_dir = is_dir
+        self.size = size
+        self.mtime = mtime
+        self.mtime_ns = mtime_ns
+        self.dev = dev
+        self.ino = ino
+
+    @property
+    def type(self) -> str:
+        return 'dir' if self.is_dir else 'file'
+
+
+class LocalListing:
+    """
+    单个本地目录的紧凑列表：按名称排序的名称列表和等长的类型、大小、修改时间、设备号和inode数组，
+    不为每个条目保存对象和完整路径，按名称顺序遍历时才逐个生成LocalEntry（供归并比对）
+    """
+    __slots__ = ('path', 'names', 'dirs', 'sizes', 'mtimes', 'mtimes_ns', 'devs', 'inos')
+
+    def __init__(self, path: str):
+        self.path = path
+        self.names: List[str] = []
+        self.dirs = bytearray()
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.mtimes_ns = array('q')
+        self.devs = array('Q')
+        self.inos = array('Q')
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __iter__(self) -> Iterator[LocalEntry]:
+        path = self.path
+        for i, name in enumerate(self.names):
+            if self.dirs[i]:
+                yield LocalEntry(name, os.path.join(path, name), True)
+            else:
+                yield LocalEntry(name, os.path.join(path, name), False, self.sizes[i],
+                                 self.mtimes[i], self.mtimes_ns[i], self.devs[i], self.inos[i])
+
+    def seal(self) -> 'LocalListing':
+        """全部加入后按名称排序各数组，返回自身"""
+        names = self.names
+        order = sorted(range(len(names)), key=names.__getitem__)
+        self.names = [names[i] for i in order]
+        self.dirs = bytearray(self.dirs[i] for i in order)
+        for field in ('sizes', 'mtimes', 'mtimes_ns', 'devs', 'inos'):
+            values = getattr(self, field)
+            setattr(self, field, array(values.typecode, (values[i] for i in order)))
+        return self
+
+
+def list_local_dir(path: str, skip: Optional[Callable[[str, bool], bool]] = None) -> LocalListing:
+    """
+    列出单个目录为按名称排序的紧凑列表，类型和元数据取自DirEntry缓存：
+    目录项不做stat，文件项最多一次stat（Windows上无需额外系统调用）。
+    无法访问的条目（如失效的符号链接）会被跳过
+    :param skip: 按 (名称, 是否目录) 判断是否忽略的函数，被忽略的条目在stat之前跳过
+    """
+    listing = LocalListing(path)
+    with os.scandir(path) as it:
+        for entry in it:
+            try:
+                is_dir = entry.is_dir()
+                if skip is not None and skip(entry.name, is_dir):
+                    continue
+                st = None if is_dir else entry.stat()
+            except OSError as e:
+                logger.warning(f"跳过无法访问的本地条目 {entry.path}: {str(e)}")
+                continue
+            listing.names.append(entry.name)
+            listing.dirs.append(st is None)
+            listing.sizes.append(st.st_size if st else 0)
+            listing.mtimes.append(st.st_mtime if st else 0)
+            listing.mtimes_ns.append(st.st_mtime_ns if st else 0)
+            listing.devs.append(st.st_dev if st else 0)
+            listing.inos.append(st.st_ino if st else 0)
+    return listing.seal()
+
+
+def has_files(root: str, ignore: Optional[IgnoreMatcher] = None) -> bool:
+    """目录树中是否有（未被忽略的）文件，找到第一个即返回，无需遍历整个目录树"""
+    stack = [('', root)]
+    while stack:
+        rel_dir, abs_dir = stack.pop()
+        skip = ignore.for_dir(rel_dir) if ignore else None
+        with os.scandir(abs_dir) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                    if skip is not None and skip(entry.name, is_dir):
+                        continue
+                    if is_dir:
+                        stack.append((f"{rel_dir}/{entry.name}" if rel_dir else entry.name, entry.path))
+                        continue
+                    entry.stat()
+                except OSError:
+                    continue
+                return True
+    return False
+
+
+def stat_entry(path: str) -> LocalEntry:
+    """获取单个路径的目录项（监视模式下处理单个变化的文件时使用）"""
+    st = os.stat(path)
+    name = os.path.basename(path)
+    if os.path.isdir(path):
+        return LocalEntry(name, path, True)
+    return LocalEntry(name, path, False, st.st_size, st.st_mtime, st.st_mtime_ns, st.st_dev, st.st_ino)
+
+
+class LocalScanner:
+    """基于os.scandir的单次遍历本地目录树扫描器"""
+    def __init__(self, root: str, rel_root: str = '', ignore: Optional[IgnoreMatcher] = None):
+        """
+        :param root: 开始扫描的本地目录
+        :param rel_root: root对应的相对路径，只扫描子树时作为产出路径的前缀
+        :param ignore: 忽略规则（相对路径从同步根目录算起），被忽略的目录不再进入
+        """
+        self.root = root
+        self.rel_root = rel_root
+        self.ignore = ignore
+        self.file_count = 0
+        self.dir_count = 0
+
+    def walk(self) -> Iterator[Tuple[str, LocalListing]]:
+        """
+        自顶向下惰性遍历，每个目录产出一次 (相对路径, 紧凑列表)，遍历列表时才逐个生成LocalEntry；
+        相对路径使用'/'分隔，根目录为空字符串。遍历过程中累计文件数和目录数
+        """
+        stack = [(self.rel_root, self.root)]
+        while stack:
+            rel_dir, abs_dir = stack.pop()
+            listing = list_local_dir(abs_dir, self.ignore.for_dir(rel_dir) if self.ignore else None)
+            for name, is_dir in zip(listing.names, listing.dirs):
+                if is_dir:
+                    self.dir_count += 1
+                    rel = f"{rel_dir}/{name}" if rel_dir else name
+                    stack.append((rel, os.path.join(abs_dir, name)))
+                else:
+                    self.file_count += 1
+            yield rel_dir, listing
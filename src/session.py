@@ -0,0 +1,184 @@
+import errno
+import ftplib
+import logging
+import random
+import socket
+import ssl
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# 控制连接和数据连接的超时（秒），配置项ftp.timeout
+DEFAULT_TIMEOUT = 60
+# 连接中断后重新连接并重试同一操作的次数，配置项ftp.retries
+DEFAULT_RETRIES = 8
+# 连接空闲超过该秒数时发送NOOP，避免被服务器或中间的NAT/VPN断开，配置项ftp.keepalive（0表示不发送）
+KEEPALIVE_INTERVAL = 60
+# 重新连接的等待时间从BACKOFF_BASE秒开始逐次翻倍，最长BACKOFF_MAX秒
+BACKOFF_BASE = 1.0
+BACKOFF_MAX = 60.0
+
+# 表示网络或连接本身出错的errno（本地文件的错误如ENOENT、ENOSPC不在其中）
+_NETWORK_ERRNOS = {
+    errno.ECONNABORTED, errno.ECONNRESET, errno.ECONNREFUSED, errno.EPIPE, errno.ENOTCONN,
+    errno.ETIMEDOUT, errno.ENETDOWN, errno.ENETUNREACH, errno.ENETRESET, errno.EHOSTUNREACH,
+}
+
+
+def is_connection_error(e: BaseException) -> bool:
+    """
+    是否为连接层面的错误：连接断开或超时、服务器关闭连接（421）或数据连接失败（425/426）、
+    控制连接的应答错位（超时后残留的应答）。这类错误重新连接后可以重试，文件本身的错误（550等）不算
+    """
+    if isinstance(e, (EOFError, ConnectionError, socket.timeout, socket.gaierror, ssl.SSLError,
+                      ftplib.error_reply, ftplib.error_proto)):
+        return True
+    if isinstance(e, ftplib.error_temp):
+        return str(e)[:3] in ('421', '425', '426')
+    if isinstance(e, OSError):
+        return e.errno in _NETWORK_ERRNOS
+    return False
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, maximum: float = BACKOFF_MAX) -> float:
+    """第attempt次（从0开始）重新连接前等待的秒数：指数增长并加随机抖动，多条连接不会同时重连"""
+    return min(maximum, base * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+
+class ResilientSession:
+    """
+    可自愈的FTP连接：操作因连接中断或超时失败时，按指数退避重新连接并登录，
+    恢复工作目录和二进制模式后重试整个操作（操作本身需可重复执行，如续传上传、列目录）；
+    空闲时定期发送NOOP保持连接。各操作在锁内串行执行
+    """
+    def __init__(self, connection_factory=None, ftp: Optional[ftplib.FTP] = None,
+                 retries: int = DEFAULT_RETRIES, keepalive: float = KEEPALIVE_INTERVAL, sleep=time.sleep):
+        """
+        :param connection_factory: 无参函数，返回已登录的ftplib.FTP；未提供时不能重新连接，错误直接抛出
+        :param ftp: 已建立的连接，未提供时在首次操作时建立
+        :param retries: 每个操作最多重试的次数
+        :param keepalive: 空闲多少秒后发送NOOP，0表示不发送（见start_keepalive）
+        """
+        self.connection_factory = connection_factory
+        self.retries = max(0, int(retries))
+        self.keepalive = keepalive
+        # 因连接错误重新连接的次数
+        self.reconnects = 0
+        self._sleep = sleep
+        self._ftp = ftp
+        self._cwd = None
+        self._lock = threading.RLock()
+        self._last_used = time.monotonic()
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+    @property
+    def ftp(self) -> Optional[ftplib.FTP]:
+        """当前连接（已断开且尚未重新连接时为None）"""
+        return self._ftp
+
+    def run(self, func, *args):
+        """
+        以 func(ftp, *args) 执行一个操作并返回其结果；连接错误时重新连接后重试，
+        重试次数用尽或其他错误时抛出
+        """
+        with self._lock:
+            attempt = 0
+            while True:
+                try:
+                    return func(self._connection(), *args)
+                except Exception as e:
+                    if not (self.connection_factory and is_connection_error(e)) or attempt >= self.retries:
+                        raise
+                    self._drop()
+                    self.reconnects += 1
+                    delay = backoff_delay(attempt)
+                    attempt += 1
+                    logger.warning(f"FTP连接中断（{str(e) or type(e).__name__}），{delay:.1f}秒后第{attempt}次重新连接")
+                    self._sleep(delay)
+                finally:
+                    self._last_used = time.monotonic()
+
+    def remember_cwd(self):
+        """记下当前工作目录，重新连接后恢复"""
+        self._cwd = self.run(ftplib.FTP.pwd)
+
+    def noop(self):
+        """连接空闲时发送NOOP，失败时丢弃连接（下次操作时重新连接）"""
+        with self._lock:
+            self._noop()
+
+    def start_keepalive(self):
+        """启动后台线程，连接空闲超过keepalive秒时发送NOOP（不打断正在执行的操作）"""
+        if not self.keepalive or self._keepalive_thread is not None:
+            return
+        self._stop.clear()
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop, daemon=True)
+        self._keepalive_thread.start()
+
+    def stop_keepalive(self):
+        """停止发送NOOP的后台线程"""
+        if self._keepalive_thread is None:
+            return
+        self._stop.set()
+        self._keepalive_thread.join()
+        self._keepalive_thread = None
+
+    def close(self):
+        """停止保活并退出当前连接"""
+        self.stop_keepalive()
+        with self._lock:
+            ftp, self._ftp = self._ftp, None
+        if ftp is not None:
+            try:
+                ftp.quit()
+            except Exception:
+                ftp.close()
+
+    def _connection(self) -> ftplib.FTP:
+        """返回当前连接，已断开时重新连接并登录，恢复工作目录和二进制模式"""
+        if self._ftp is None:
+            ftp = self.connection_factory()
+            try:
+                if self._cwd:
+                    ftp.cwd(self._cwd)
+                ftp.voidcmd('TYPE I')
+            except Exception:
+                ftp.close()
+                raise
+            self._ftp = ftp
+        return self._ftp
+
+    def _drop(self):
+        """丢弃已中断的连接（只关闭套接字，不再等待服务器应答）"""
+        ftp, self._ftp = self._ftp, None
+        if ftp is not None:
+            try:
+                ftp.close()
+            except Exception:
+                pass
+
+    def _noop(self):
+        if self._ftp is None:
+            return
+        try:
+            self._ftp.voidcmd('NOOP')
+        except Exception:
+            # 无法重新连接时保留原连接，由下次操作报告错误
+            if self.connection_factory:
+                self._drop()
+        self._last_used = time.monotonic()
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.keepalive / 2):
+            if time.monotonic() - self._last_used < self.keepalive:
+                continue
+            # 正在执行操作时连接并不空闲，跳过本次
+            if not self._lock.acquire(blocking=False):
+                continue
+            try:
+                self._noop()
+            finally:
+                self._lock.release()
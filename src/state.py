@@ -0,0 +1,245 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+
+def parent_of(path: str) -> str:
+    """相对路径的父路径（根目录为空字符串）"""
+    return path.rsplit('/', 1)[0] if '/' in path else ''
+
+
+class SyncStateDB:
+    """
+    同步状态库（SQLite），记录每个路径最近一次成功同步时的本地大小、修改时间和指纹，
+    以及当时远程文件的修改时间（双向同步据此判断哪一端发生了变化）
+    """
+
+    # 累积多少次写入后提交一次事务
+    COMMIT_INTERVAL = 500
+    # 按名称顺序分批读取目录子项时每批的条数
+    CHILDREN_BATCH = 1000
+
+    def __init__(self, db_path: str, full_verify_days: float = 7):
+        """
+        :param db_path: 数据库文件路径
+        :param full_verify_days: 完整校验（重新列出远程目录）的周期，单位天，0表示每次都完整校验
+        """
+        self.db_path = db_path
+        self.full_verify_days = full_verify_days
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        """创建数据表"""
+        with self._lock:
+            self._conn.executescript('''
+                CREATE TABLE IF NOT EXISTS entries (
+                    profile TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    parent TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    size INTEGER,
+                    mtime_ns INTEGER,
+                    fingerprint TEXT,
+                    synced_at REAL,
+                    PRIMARY KEY (profile, path)
+                );
+                CREATE INDEX IF NOT EXISTS entries_children ON entries (profile, parent, path);
+                DROP INDEX IF EXISTS entries_parent;
+                CREATE TABLE IF NOT EXISTS runs (
+                    profile TEXT PRIMARY KEY,
+                    last_success REAL,
+                    last_full_verify REAL
+                );
+            ''')
+            # 旧版本数据库补充新增的列
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}
+            if 'upload_rate' not in columns:
+                self._conn.execute("ALTER TABLE runs ADD COLUMN upload_rate REAL")
+            columns = {row[1] for row in self._conn.execute("PRAGMA table_info(entries)")}
+            if 'remote_mtime' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN remote_mtime REAL")
+            self._conn.commit()
+
+    def has_dir(self, profile: str, path: str) -> bool:
+        """目录是否曾经同步过"""
+        if path == '':
+            return self.last_success(profile) is not None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE profile=? AND path=? AND type='dir'",
+                (profile, path)
+            ).fetchone()
+        return row is not None
+
+    def iter_children(self, profile: str, path: str) -> Iterator[Tuple[str, dict]]:
+        """
+        按名称顺序产出目录下已同步的条目 (名称, 记录)：按路径分批查询，
+        每批单独加锁，内存占用与目录大小无关（同一父目录下按路径排序即按名称排序）
+        """
+        after = ''
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT path, type, size, mtime_ns, fingerprint, remote_mtime FROM entries "
+                    "WHERE profile=? AND parent=? AND path > ? ORDER BY path LIMIT ?",
+                    (profile, path, after, self.CHILDREN_BATCH)
+                ).fetchall()
+            for row in rows:
+                yield row[0].rsplit('/', 1)[-1], self._record(row[1:])
+            if len(rows) < self.CHILDREN_BATCH:
+                return
+            after = rows[-1][0]
+
+    def has_children(self, profile: str, path: str) -> bool:
+        """目录下是否有已同步的条目"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM entries WHERE profile=? AND parent=? AND path != '' LIMIT 1",
+                (profile, path)
+            ).fetchone()
+        return row is not None
+
+    def entries(self, profile: str) -> Dict[str, dict]:
+        """获取同步任务的全部条目记录，键为相对路径（双向同步比对时使用）"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, type, size, mtime_ns, fingerprint, remote_mtime FROM entries "
+                "WHERE profile=? AND path != ''",
+                (profile,)
+            ).fetchall()
+        return {row[0]: self._record(row[1:]) for row in rows}
+
+    def subtree(self, profile: str, path: str) -> Dict[str, dict]:
+        """获取条目及其子树（目录时）的记录，键为相对路径"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path, type, size, mtime_ns, fingerprint, remote_mtime FROM entries "
+                "WHERE profile=? AND (path=? OR path LIKE ? ESCAPE '\\')",
+                (profile, path, self._subtree_pattern(path))
+            ).fetchall()
+        return {row[0]: self._record(row[1:]) for row in rows}
+
+    def get(self, profile: str, path: str) -> Optional[dict]:
+        """获取单个条目记录"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT type, size, mtime_ns, fingerprint, remote_mtime FROM entries WHERE profile=? AND path=?",
+                (profile, path)
+            ).fetchone()
+        if row is None:
+            return None
+        return self._record(row)
+
+    @staticmethod
+    def _record(row: tuple) -> dict:
+        """(type, size, mtime_ns, fingerprint, remote_mtime) 转为记录字典"""
+        return {'type': row[0], 'size': row[1], 'mtime_ns': row[2], 'fingerprint': row[3],
+                'remote_mtime': row[4]}
+
+    def record_file(self, profile: str, path: str, size: int, mtime_ns: int, fingerprint: Optional[str],
+                    remote_mtime: Optional[float] = None):
+        """
+        记录文件已同步
+        :param remote_mtime: 同步后远程文件的修改时间，未知时为None
+        """
+        self._write(
+            "INSERT OR REPLACE INTO entries "
+            "(profile, path, parent, type, size, mtime_ns, fingerprint, synced_at, remote_mtime) "
+            "VALUES (?, ?, ?, 'file', ?, ?, ?, ?, ?)",
+            (profile, path, parent_of(path), size, mtime_ns, fingerprint, time.time(), remote_mtime)
+        )
+
+    def record_dir(self, profile: str, path: str):
+        """记录目录已同步"""
+        self._write(
+            "INSERT OR REPLACE INTO entries (profile, path, parent, type, synced_at) VALUES (?, ?, ?, 'dir', ?)",
+            (profile, path, parent_of(path), time.time())
+        )
+
+    def remove(self, profile: str, path: str):
+        """删除条目记录（目录会连同其子树一起删除）"""
+        self._write(
+            "DELETE FROM entries WHERE profile=? AND (path=? OR path LIKE ? ESCAPE '\\')",
+            (profile, path, self._subtree_pattern(path))
+        )
+
+    @staticmethod
+    def _subtree_pattern(path: str) -> str:
+        """匹配目录下全部子孙路径的LIKE模式"""
+        return path.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+
+    def last_success(self, profile: str) -> Optional[float]:
+        """最近一次成功同步的时间"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_success FROM runs WHERE profile=?", (profile,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def full_verify_due(self, profile: str) -> bool:
+        """是否需要进行完整校验"""
+        if self.full_verify_days <= 0:
+            return True
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_full_verify FROM runs WHERE profile=?", (profile,)
+            ).fetchone()
+        if not row or row[0] is None:
+            return True
+        return time.time() - row[0] >= self.full_verify_days * 86400
+
+    def upload_rate(self, profile: str) -> Optional[float]:
+        """最近一次记录的上传速率（字节/秒），用于预估同步耗时"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT upload_rate FROM runs WHERE profile=?", (profile,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def mark_success(self, profile: str, full_verify: bool, upload_rate: Optional[float] = None):
+        """
+        标记一次成功的同步
+        :param upload_rate: 本次测得的上传速率（字节/秒），None表示保留上次的记录
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO runs (profile) VALUES (?)", (profile,)
+            )
+            self._conn.execute(
+                "UPDATE runs SET last_success=? WHERE profile=?", (now, profile)
+            )
+            if full_verify:
+                self._conn.execute(
+                    "UPDATE runs SET last_full_verify=? WHERE profile=?", (now, profile)
+                )
+            if upload_rate:
+                self._conn.execute(
+                    "UPDATE runs SET upload_rate=? WHERE profile=?", (upload_rate, profile)
+                )
+            self._conn.commit()
+            self._pending = 0
+
+    def commit(self):
+        """提交未完成的写入"""
+        with self._lock:
+            self._conn.commit()
+            self._pending = 0
+
+    def close(self):
+        """提交并关闭数据库"""
+        self.commit()
+        self._conn.close()
+
+    def _write(self, sql: str, params: tuple):
+        """执行写操作，定期提交"""
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._pending += 1
+            if self._pending >= self.COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending = 0
@@ -0,0 +1,1679 @@
+import bisect
+import ftplib
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import config
+from capabilities import ServerCapabilities, ServerProfileStore
+from fingerprint import MODE_FAST, MODE_FULL, FingerprintEngine
+from ignore import IgnoreMatcher
+from manifest import RemoteManifest, list_remote_dir, remote_file_size, remote_is_dir
+from mtime import MTIME_TOLERANCE, RemoteMtime
+from namespace import RemoteNamespace
+from plan import (ACTION_CONFLICT, ACTION_DELETE, ACTION_DOWNLOAD, ACTION_LOCAL_DELETE, ACTION_LOCAL_MKDIR,
+                  ACTION_MKDIR, ACTION_RENAME, ACTION_SKIP, ACTION_UPLOAD, SyncAction, SyncPlan)
+from pool import FTPWorkerPool
+from progress import ProgressTracker
+from journal import DIRECTION_DOWNLOAD, TransferJournal
+from listing import DirListing, merge_by_name
+from remote_verify import RemoteVerifier, local_digest, new_hasher
+from renames import choose_dir_renames, is_within, match_files, relocate
+from session import DEFAULT_RETRIES, DEFAULT_TIMEOUT, KEEPALIVE_INTERVAL, ResilientSession, is_connection_error
+from scanner import LocalEntry, LocalScanner, has_files, list_local_dir, stat_entry
+from state import SyncStateDB, parent_of
+from transfer import can_sendfile, preallocate, receive_file, send_file
+
+logger = logging.getLogger(__name__)
+
+# 大小相同的文件超过该大小时，先用服务器端摘要校验再决定是否上传
+VERIFY_MIN_SIZE = 1024 * 1024
+# 上传量达到该字节数时才记录本次的上传速率（用于预估下次同步耗时）
+RATE_MIN_BYTES = 16 * 1024 * 1024
+# 达到该大小的文件才续传（上传时写传输日志），以及写日志的间隔字节数
+RESUME_MIN_SIZE = 8 * 1024 * 1024
+JOURNAL_INTERVAL = 64 * 1024 * 1024
+# 下载时先写入的临时文件后缀（完成后改名为目标文件，比对时忽略）
+PART_SUFFIX = '.nodcat-part'
+
+# 同步方向（配置项sync.direction）
+SYNC_PUSH = 'push'
+SYNC_PULL = 'pull'
+SYNC_BOTH = 'both'
+SYNC_DIRECTIONS = (SYNC_PUSH, SYNC_PULL, SYNC_BOTH)
+
+
+class FTPSynchronizer:
+    """FTP文件同步器（按一端的目录结构完全同步到另一端，或按上次同步的状态双向同步）"""
+    def __init__(self, ftp: ftplib.FTP, connection_factory=None, max_connections: int = 1,
+                 state: Optional[SyncStateDB] = None, fingerprints: Optional[FingerprintEngine] = None,
+                 journal: Optional[TransferJournal] = None, capabilities: Optional[ServerCapabilities] = None,
+                 ignore_patterns: Iterable[str] = (), retries: int = DEFAULT_RETRIES,
+                 keepalive: float = KEEPALIVE_INTERVAL):
+        """
+        :param ftp: 主连接（用于列目录和创建目录）
+        :param connection_factory: 创建新登录连接的函数，提供时上传、下载和删除分发到多连接并行执行
+        :param max_connections: 并行传输连接数
+        :param state: 同步状态库，提供时未变化的目录不再列出远程、未变化的文件不再比对
+        :param fingerprints: 文件指纹引擎，默认为不带缓存的快速模式
+        :param journal: 传输日志，提供时中断的大文件上传和下载可在下次同步时续传
+        :param capabilities: 已协商（并应用到ftp）的服务器能力，未提供时在首次同步前协商一次
+        :param ignore_patterns: 忽略规则（语法同.gitignore），与本地目录中的.nodcatignore一起生效，
+                                被忽略的条目不上传、不下载，远程对应的条目也不删除
+        :param retries: 连接中断时重新连接并重试当前操作的次数（需要connection_factory）
+        :param keepalive: 连接空闲多少秒后发送NOOP，0表示不发送
+        """
+        # 主连接：中断后用connection_factory重新连接，从中断的操作继续
+        self._session = ResilientSession(connection_factory, ftp, retries, keepalive)
+        self.connection_factory = connection_factory
+        self.max_connections = max(1, max_connections)
+        self.retries = retries
+        self.keepalive = keepalive
+        self.state = state
+        self.fingerprints = fingerprints or FingerprintEngine()
+        self.journal = journal
+        self.ignore_patterns = list(ignore_patterns)
+        # 本次同步的忽略规则（每次同步时重新读取.nodcatignore）
+        self._ignore = IgnoreMatcher()
+        self._host = getattr(ftp, 'host', '')
+        self._progress = ProgressTracker()
+        self.plan_callback = None
+        self._pool = None
+        self._manifest = None
+        # 本次会话已知的远程路径及类型，存在性判断无需往返
+        self._namespace = RemoteNamespace()
+        self._profile = None
+        self._full_verify = True
+        self.capabilities = capabilities
+        self._mtime = None
+        self._mtime_probed = False
+        self.verifier = None
+        self._local_tree = {}
+        # 保护并行删除时的失败记录和传输失败的重试队列
+        self._progress_lock = threading.Lock()
+        # 本次执行中失败（非连接错误）的传输 [(任务, 动作)]，其他传输完成后再重试一次
+        self._retry_queue = []
+        self._upload_rate = None
+        # 双向同步时上传后记录远程修改时间（服务器不能保留修改时间时用MDTM查询）
+        self._bidirectional = False
+        
+    @property
+    def ftp(self) -> Optional[ftplib.FTP]:
+        """主连接（重新连接后为新的连接）"""
+        return self._session.ftp
+
+    def set_progress_callback(self, callback):
+        """设置进度回调函数，以ProgressSnapshot调用，最多每PROGRESS_INTERVAL秒一次"""
+        self._progress.callback = callback
+
+    def set_plan_callback(self, callback):
+        """设置计划回调函数，比对完成、开始执行前以SyncPlan调用"""
+        self.plan_callback = callback
+        
+    def sync_local_to_remote(self, local_path: str, remote_path: str, full_verify: Optional[bool] = None,
+                             dry_run: bool = False) -> Optional[SyncPlan]:
+        """
+        完全按照本地目录同步到远程（删除远程多余文件）
+        :param local_path: 本地目录路径
+        :param remote_path: 远程FTP目录路径
+        :param full_verify: 是否重新列出全部远程目录进行完整校验，None表示按状态库的校验周期决定
+        :param dry_run: 只比对并返回计划，不修改远程和状态库
+        :return: 同步计划，本地没有文件时返回None
+        """
+        if not os.path.isdir(local_path):
+            raise ValueError(f"本地路径不是目录: {local_path}")
+        self._ignore = IgnoreMatcher(local_path, self.ignore_patterns)
+        # 确保远程目录存在
+        if not dry_run:
+            self._ensure_remote_directory(remote_path)
+        # 本地没有任何文件时不同步（避免本地目录未挂载时清空远程），找到第一个文件即可确认
+        if not has_files(local_path, self._ignore):
+            self._progress.finish("没有文件需要同步")
+            return None
+
+        # 先生成完整计划（包含清理远程多余文件），再按计划执行
+        def work():
+            plan = SyncPlan()
+            self._plan_tree(plan, local_path, remote_path, '')
+            self._plan_renames(plan, remote_path)
+            return self._finish_plan(plan, dry_run)
+        return self._run_session(local_path, remote_path, full_verify, work,
+                                 mark_success=not dry_run, prefetch_root=remote_path, dry_run=dry_run)
+
+    def sync_paths(self, local_path: str, remote_path: str, rel_paths: Iterable[str]) -> SyncPlan:
+        """
+        只同步指定的相对路径（监视模式使用）：仍存在的文件按需上传，目录递归同步，
+        本地已不存在的删除远程对应条目
+        :param rel_paths: 相对local_path、以'/'分隔的路径
+        """
+        if not os.path.isdir(local_path):
+            raise ValueError(f"本地路径不是目录: {local_path}")
+        self._ignore = IgnoreMatcher(local_path, self.ignore_patterns)
+        files, dirs, missing = [], [], []
+        for rel in self._collapse_paths(rel_paths):
+            local_item = os.path.join(local_path, *rel.split('/'))
+            # 已不存在的路径类型未知，按文件或目录任一方式被忽略都不处理（不删除远程）
+            is_dir = os.path.isdir(local_item)
+            if self._ignore.ignores_path(rel, is_dir) or (
+                    not os.path.lexists(local_item) and self._ignore.ignores_path(rel, not is_dir)):
+                continue
+            if is_dir:
+                dirs.append(rel)
+            elif os.path.isfile(local_item):
+                files.append(rel)
+            else:
+                missing.append(rel)
+
+        def work():
+            plan = SyncPlan()
+            self._plan_changed(plan, local_path, remote_path, files, dirs, missing)
+            self._plan_renames(plan, remote_path)
+            return self._finish_plan(plan, False)
+        return self._run_session(local_path, remote_path, False, work, mark_success=False)
+
+    def sync_remote_to_local(self, local_path: str, remote_path: str, dry_run: bool = False) -> Optional[SyncPlan]:
+        """
+        完全按照远程目录同步到本地（删除本地多余文件），sync_local_to_remote的反方向：
+        并行预取远程目录清单与本地目录树比对，大小或修改时间不同的文件用多连接并行下载
+        :param dry_run: 只比对并返回计划，不修改本地和状态库
+        :return: 同步计划，远程没有文件而本地有文件时不同步，返回None
+        """
+        if os.path.exists(local_path) and not os.path.isdir(local_path):
+            raise ValueError(f"本地路径不是目录: {local_path}")
+        if not dry_run:
+            os.makedirs(local_path, exist_ok=True)
+        self._ignore = IgnoreMatcher(local_path, self.ignore_patterns)
+        self._local_tree = dict(LocalScanner(local_path, ignore=self._ignore).walk()) \
+            if os.path.isdir(local_path) else {}
+
+        def work():
+            plan = SyncPlan()
+            if not self._plan_pull(plan, local_path, remote_path):
+                return None
+            return self._finish_plan(plan, dry_run)
+        # 本地修改时间直接取自远程，无需测量服务器时钟偏差
+        return self._run_session(local_path, remote_path, True, work, mark_success=not dry_run,
+                                 prefetch_root=remote_path, dry_run=dry_run, probe_clock=False)
+
+    def sync_bidirectional(self, local_path: str, remote_path: str, dry_run: bool = False) -> Optional[SyncPlan]:
+        """
+        双向同步：按状态库中上次同步时的记录分别判断本地和远程的变化，只有一端变化的条目同步到另一端；
+        两端都变化的文件视为冲突，修改时间较新的版本胜出，另一版本改名保留在本地（下次同步时上传）
+        :param dry_run: 只比对并返回计划，不修改两端和状态库
+        :return: 同步计划，远程没有文件而本地有上次同步过的文件时不同步，返回None
+        """
+        if not self.state:
+            raise ValueError("双向同步需要启用同步状态库（sync.state_db）")
+        if not os.path.isdir(local_path):
+            raise ValueError(f"本地路径不是目录: {local_path}")
+        if not dry_run:
+            self._ensure_remote_directory(remote_path)
+        self._ignore = IgnoreMatcher(local_path, self.ignore_patterns)
+        self._local_tree = dict(LocalScanner(local_path, ignore=self._ignore).walk())
+
+        def work():
+            plan = SyncPlan()
+            if not self._plan_bidirectional(plan, local_path, remote_path):
+                return None
+            return self._finish_plan(plan, dry_run)
+        self._bidirectional = True
+        try:
+            return self._run_session(local_path, remote_path, True, work, mark_success=not dry_run,
+                                     prefetch_root=remote_path, dry_run=dry_run)
+        finally:
+            self._bidirectional = False
+
+    @staticmethod
+    def _collapse_paths(rel_paths: Iterable[str]) -> List[str]:
+        """去掉祖先目录也在集合中的路径（祖先目录同步时已经包含）"""
+        result = []
+        for rel in sorted(set(p.strip('/') for p in rel_paths if p.strip('/'))):
+            if result and (rel + '/').startswith(result[-1] + '/'):
+                continue
+            result.append(rel)
+        return result
+
+    def _run_session(self, local_path: str, remote_path: str, full_verify: Optional[bool], work,
+                     mark_success: bool, prefetch_root: Optional[str] = None, dry_run: bool = False,
+                     probe_clock: bool = True):
+        """
+        建立一次同步会话（服务器能力、状态库、连接池），执行work后等待所有传输完成
+        :param prefetch_root: 需要完整比对时从该远程目录开始并行预取目录清单
+        :param dry_run: 预演时不上传时钟探测文件（档案中已有的偏差照常使用）
+        :param probe_clock: 是否需要测量服务器时钟偏差（比对本地与远程修改时间时需要）
+        :return: work的返回值
+        """
+        self._progress.start(0, 0)
+        self._upload_rate = None
+        self._retry_queue = []
+        if self._session.connection_factory:
+            # 重新连接后恢复当前工作目录
+            self._session.remember_cwd()
+        if self.capabilities is None:
+            self.capabilities = self._session.run(ServerCapabilities.negotiate)
+        self._mtime = RemoteMtime(self.capabilities)
+        self._mtime_probed = dry_run or not probe_clock
+        self.verifier = RemoteVerifier(self.capabilities)
+        if self.state:
+            self._profile = self._state_profile(local_path, remote_path)
+            if full_verify is None:
+                full_verify = self.state.full_verify_due(self._profile)
+        self._full_verify = True if not self.state else bool(full_verify)
+        if self.connection_factory and self.max_connections > 1:
+            self._pool = FTPWorkerPool(self.connection_factory, self.max_connections, self.retries, self.keepalive)
+            if prefetch_root is not None and self._full_verify:
+                # 预取前先测量时钟偏差，避免探测文件出现在清单中
+                if not self._mtime_probed:
+                    self._session.run(self._mtime.probe_session, prefetch_root)
+                    self._mtime_probed = True
+                self._manifest = RemoteManifest(self.connection_factory, self.max_connections,
+                                                self.capabilities.use_mlsd, self.capabilities.list_command,
+                                                ignore=self._ignore, retries=self.retries)
+                self._manifest.start(prefetch_root)
+        # 执行期间传输都在连接池上，主连接可能长时间空闲，定期发送NOOP
+        self._session.start_keepalive()
+        try:
+            result = work()
+            if self._pool:
+                self._pool.wait()
+            if self.state and mark_success:
+                self.state.mark_success(self._profile, self._full_verify, self._upload_rate)
+            return result
+        finally:
+            self._session.stop_keepalive()
+            self._local_tree = {}
+            # 会话结束后远程可能被其他程序修改，下次会话重新获取
+            self._namespace = RemoteNamespace()
+            if self._pool:
+                self._pool.close()
+                self._pool = None
+            if self._manifest:
+                self._manifest.close()
+                self._manifest = None
+            if self.state:
+                self.state.commit()
+
+    def _finish_plan(self, plan: SyncPlan, dry_run: bool) -> SyncPlan:
+        """通知计划回调，非预演时执行计划"""
+        if self.state:
+            plan.upload_rate = self.state.upload_rate(self._profile)
+        if self.plan_callback:
+            self.plan_callback(plan)
+        if not dry_run:
+            self._execute_plan(plan)
+        return plan
+
+    def _execute_plan(self, plan: SyncPlan):
+        """
+        执行同步计划：先在本地处理冲突文件、删除和建目录，再执行远程改名，自底向上并行删除远程条目，
+        在主连接上按父目录在前的顺序建远程目录，然后把上传和下载分发到连接池，全部完成后更新状态库
+        """
+        # 进度按字节计算，每个动作额外计1，保证空文件和删除也能推进进度
+        self._progress.start(plan.upload_bytes + plan.download_bytes,
+                             len(plan.uploads) + len(plan.downloads) + len(plan.deletes)
+                             + len(plan.local_deletes) + len(plan.renames))
+        started = time.monotonic()
+
+        # 本地动作直接在当前线程执行；冲突文件先改名保留，之后才能写入另一端的版本
+        for action in plan.conflicts:
+            if action.local_entry is not None:
+                os.replace(action.local_entry.path, action.target_path)
+        for action in plan.local_deletes:
+            self._delete_local_item(action, plan.failures)
+        for action in plan.local_mkdirs:
+            os.makedirs(action.local_entry.path, exist_ok=True)
+        # 本地版本胜出的冲突：远程版本下载为副本后才能上传覆盖
+        copies = [action for action in plan.downloads if action.target_path]
+        for action in copies:
+            self._dispatch(self._download_task, action)
+        if copies and self._pool:
+            self._pool.wait()
+
+        # 改名在删除之前：被移走的条目可能位于将被删除的目录中
+        self._rename_remote(plan)
+        # 先删除再建目录，远程条目被本地同名的其他类型条目替换时不会冲突
+        self._delete_remote(plan)
+        for action in plan.mkdirs:
+            self._make_remote_directory(action.remote_path)
+        uploads = plan.uploads
+        downloads = [action for action in plan.downloads if not action.target_path]
+        if self._pool:
+            # 多连接时大文件优先，避免最后只剩一条连接在传大文件
+            uploads = sorted(uploads, key=lambda action: action.size, reverse=True)
+            downloads = sorted(downloads, key=lambda action: action.size, reverse=True)
+        for action in uploads:
+            self._dispatch(self._transfer_task, self._upload_task, action)
+        for action in downloads:
+            self._dispatch(self._transfer_task, self._download_task, action)
+        if self._pool:
+            self._pool.wait()
+        self._retry_failed(plan)
+
+        if self.state:
+            # 计划中没有指纹的记录（含完整模式下传输后未计算的）在这里补算
+            digests = self.fingerprints.fingerprint_many(
+                action.local_entry for action in plan.skips
+                if action.local_entry is not None and not action.fingerprint)
+            for action in plan.skips:
+                if action.local_entry is not None:
+                    self._record_file(action.rel_path, action.local_entry,
+                                      action.fingerprint or digests.get(action.local_entry.path), action.remote_mtime)
+            # 根目录由成功同步记录表示，不作为条目保存
+            for rel_path in plan.visited_dirs:
+                if rel_path:
+                    self.state.record_dir(self._profile, rel_path)
+            for rel_path in plan.forgotten:
+                self.state.remove(self._profile, rel_path)
+
+        elapsed = time.monotonic() - started
+        if plan.upload_bytes >= RATE_MIN_BYTES and not plan.downloads and elapsed > 0:
+            self._upload_rate = plan.upload_bytes / elapsed
+        self._progress.finish("同步完成")
+
+    def _plan_changed(self, plan: SyncPlan, local_path: str, remote_path: str, files: List[str],
+                      dirs: List[str], missing: List[str]):
+        """为监视到的变化生成计划：删除本地已不存在的条目，目录递归比对，单个文件按需上传"""
+        for rel in missing:
+            remote_item = self._remote_join(remote_path, rel)
+            record = self.state.get(self._profile, rel) if self.state else None
+            if record:
+                item_type = record['type']
+            else:
+                item_type = 'dir' if self._is_remote_dir(remote_item) else 'file'
+            plan.add(SyncAction(ACTION_DELETE, rel, remote_item, item_type=item_type))
+
+        for rel in dirs:
+            remote_item = self._remote_join(remote_path, rel)
+            exists = (self.state and self.state.has_dir(self._profile, rel)) or self._is_remote_dir(remote_item)
+            if not exists:
+                self._plan_mkdirs(plan, remote_path, rel)
+            self._plan_tree(plan, os.path.join(local_path, *rel.split('/')), remote_item, rel,
+                            remote_empty=not exists)
+
+        for rel in files:
+            parent = parent_of(rel)
+            if not (self.state and self.state.has_dir(self._profile, parent)):
+                if not self._is_remote_dir(self._remote_join(remote_path, parent)):
+                    self._plan_mkdirs(plan, remote_path, parent)
+            try:
+                local_entry = stat_entry(os.path.join(local_path, *rel.split('/')))
+            except OSError:
+                # 事件合并期间文件又被删除，留给下一次变化或完整核对处理
+                continue
+            name = local_entry.name
+            record = self.state.get(self._profile, rel) if self.state else None
+            unchanged = self._matches_state(local_entry, record) or \
+                name in self._unchanged_by_content({name: local_entry}, {name: record})
+            if unchanged:
+                plan.unchanged += 1
+            else:
+                appended = self._appended_files({name: local_entry}, {name: record})
+                plan.add(SyncAction(ACTION_UPLOAD, rel, self._remote_join(remote_path, rel), local_entry,
+                                    append_from=appended.get(name)))
+
+    def _plan_mkdirs(self, plan: SyncPlan, remote_path: str, rel_path: str):
+        """计划创建相对路径上尚不存在的各级目录（执行时已存在的目录会被跳过）"""
+        planned = {action.rel_path for action in plan.mkdirs}
+        parts = rel_path.split('/')
+        for i in range(1, len(parts) + 1):
+            rel = '/'.join(parts[:i])
+            if rel not in planned:
+                plan.add(SyncAction(ACTION_MKDIR, rel, self._remote_join(remote_path, rel), item_type='dir'))
+
+    def _plan_renames(self, plan: SyncPlan, remote_path: str):
+        """
+        识别本地的改名和移动：将被删除的远程条目（按状态库记录）与本地新增的文件按大小和内容指纹配对，
+        整个目录被改名时改名目录，其余配对的文件单独改名，都用RNFR/RNTO代替删除后重新上传。
+        快速指纹只取样头尾，配对还需修改时间与记录一致（改名和移动不改变修改时间），
+        或由服务器摘要确认内容相同，都无法确认的照常上传。
+        目录改名后其中与本地不一致的文件照常上传，本地已不存在的条目删除
+        """
+        if not (self.state and plan.deletes and plan.uploads):
+            return
+        deleted = {}
+        for action in plan.deletes:
+            deleted.update(self.state.subtree(self._profile, action.rel_path))
+        added = {action.rel_path: action for action in plan.uploads
+                 if not action.append_from and (action.remote_size == 0 or (
+                     action.remote_size is None and self.state.get(self._profile, action.rel_path) is None))}
+        matches = match_files(deleted, {rel: action.local_entry for rel, action in added.items()}, self.fingerprints)
+        if matches and self.fingerprints.mode != MODE_FULL:
+            matches = {new: old for new, old in matches.items()
+                       if added[new].local_entry.mtime_ns == deleted[old]['mtime_ns'] or
+                       self._session.run(self.verifier.verify_file, added[new].local_entry.path,
+                                         self._remote_join(remote_path, old))}
+        if not matches:
+            return
+
+        mkdirs = {action.rel_path: action for action in plan.mkdirs}
+        dir_renames = choose_dir_renames(matches, set(mkdirs), deleted)
+        deletes = {action.rel_path: action for action in plan.deletes}
+        # 目录改名后原条目所在的位置 {新位置: 原相对路径}
+        moved = {}
+        for rel in deleted:
+            location = relocate(rel, dir_renames)
+            if location != rel:
+                moved[location] = rel
+        # 单独改名的文件：目录改名已经把原文件带到目标位置的不算，目标位置被目录改名带来的其他条目占用时仍上传
+        file_renames = {new: old for new, old in matches.items() if relocate(old, dir_renames) != new}
+        file_renames = {new: old for new, old in file_renames.items() if new not in moved}
+        sources = set(file_renames.values())
+
+        for new_dir, old_dir in dir_renames:
+            adds, cancels = [], []
+            for rel in sorted(mkdirs):
+                location_rel = moved.get(rel)
+                if is_within(rel, new_dir) and location_rel and deleted[location_rel]['type'] == 'dir':
+                    # 目录随改名一起到位，无需再建
+                    adds.append(mkdirs[rel])
+                    plan.mkdirs.remove(mkdirs[rel])
+            for rel, action in added.items():
+                old = moved.get(rel)
+                if is_within(rel, new_dir) and old and matches.get(rel) == old:
+                    # 内容与随目录到位的文件一致，只需更新状态库
+                    skip = SyncAction(ACTION_SKIP, rel, action.remote_path, action.local_entry,
+                                      fingerprint=deleted[old]['fingerprint'])
+                    plan.uploads.remove(action)
+                    plan.skips.append(skip)
+                    adds.append(action)
+                    cancels.append(skip)
+            # 随目录到位、但本地已不存在（或类型不同）的条目，只删除最上层的
+            leftovers = []
+            for location in sorted(moved):
+                old = moved[location]
+                if not is_within(location, new_dir) or old in sources:
+                    continue
+                if any(is_within(location, top) for top in leftovers):
+                    continue
+                # 新目录中的本地条目都在计划的建目录和上传中
+                local_type = 'dir' if location in mkdirs else 'file' if location in added else None
+                if local_type != deleted[old]['type']:
+                    leftovers.append(location)
+                    delete = SyncAction(ACTION_DELETE, location, self._remote_join(remote_path, location),
+                                        item_type=deleted[old]['type'])
+                    plan.deletes.append(delete)
+                    cancels.append(delete)
+            if old_dir in deletes:
+                adds.append(deletes[old_dir])
+                plan.deletes.remove(deletes[old_dir])
+            plan.add(SyncAction(ACTION_RENAME, new_dir, self._remote_join(remote_path, new_dir), item_type='dir',
+                                source_rel=old_dir, source_path=self._remote_join(remote_path, old_dir)))
+            plan.rename_fallbacks[new_dir] = (adds, cancels)
+
+        for new, old in sorted(file_renames.items()):
+            action = added[new]
+            skip = SyncAction(ACTION_SKIP, new, action.remote_path, action.local_entry,
+                              fingerprint=deleted[old]['fingerprint'])
+            plan.uploads.remove(action)
+            plan.skips.append(skip)
+            adds = [action]
+            if old in deletes:
+                adds.append(deletes[old])
+                plan.deletes.remove(deletes[old])
+            source = relocate(old, dir_renames)
+            plan.add(SyncAction(ACTION_RENAME, new, action.remote_path, source_rel=old,
+                                source_path=self._remote_join(remote_path, source)))
+            plan.rename_fallbacks[new] = (adds, [skip])
+
+    @staticmethod
+    def _remote_join(remote_path: str, rel_path: str) -> str:
+        """拼接远程路径"""
+        if not rel_path:
+            return remote_path
+        return f"{remote_path.rstrip('/')}/{rel_path}"
+
+    def _state_profile(self, local_path: str, remote_path: str) -> str:
+        """状态库中区分同步任务的标识（服务器+远程目录+本地目录）"""
+        return f"{self._host}:{remote_path.rstrip('/') or '/'}|{os.path.abspath(local_path)}"
+
+    def _make_remote_directory(self, path: str):
+        """创建计划中的远程目录（父目录已存在时只需一次MKD）"""
+        try:
+            self._session.run(ftplib.FTP.mkd, path)
+            self._namespace.add(path, 'dir')
+            if self._manifest:
+                self._manifest.add_dir(path)
+        except ftplib.error_perm:
+            # 目录已存在或父目录缺失
+            self._ensure_remote_directory(path)
+
+    def _ensure_remote_directory(self, path: str):
+        """确保远程目录存在：已知的目录无需往返，逐级创建时只对状态未知的上级目录CWD试探"""
+        if self._namespace.is_dir(path):
+            return
+        if self._manifest:
+            exists = self._manifest.is_dir(path)
+            if exists:
+                self._namespace.add(path, 'dir')
+                return
+            if exists is False:
+                try:
+                    self._session.run(ftplib.FTP.mkd, path)
+                    self._manifest.add_dir(path)
+                    self._namespace.add(path, 'dir')
+                    return
+                except ftplib.error_perm:
+                    pass
+        if self._namespace.lookup(path) is None:
+            try:
+                self._session.run(ftplib.FTP.cwd, path)
+                self._namespace.add(path, 'dir')
+                return
+            except ftplib.error_perm:
+                pass
+        current = ""
+        for part in [p for p in path.split('/') if p]:
+            current += f"/{part}"
+            known = self._namespace.lookup(current)
+            if known == 'dir':
+                continue
+            if known is None:
+                try:
+                    self._session.run(ftplib.FTP.cwd, current)
+                    self._namespace.add(current, 'dir')
+                    continue
+                except ftplib.error_perm:
+                    pass
+            self._session.run(ftplib.FTP.mkd, current)
+            self._namespace.add(current, 'dir')
+            if self._manifest:
+                self._manifest.add_dir(current)
+
+    def _dispatch(self, func, *args):
+        """将任务交给连接池并行执行；未启用连接池时在主连接上直接执行"""
+        if self._pool:
+            self._pool.submit(func, *args)
+        else:
+            self._session.run(func, *args)
+
+    def _report_progress(self, message: str, bytes_count: int = 0, items: int = 0):
+        """累计已传输的字节和完成的动作（线程安全，回调按固定间隔合并）"""
+        self._progress.advance(message, bytes_count, items)
+    
+    def _plan_tree(self, plan: SyncPlan, local_path: str, remote_path: str, rel_path: str,
+                   remote_empty: bool = False):
+        """
+        比对目录树并生成计划（智能比对文件差异），此阶段只读取远程，不做任何修改。
+        本地列表和远程列表（增量模式下为状态库记录）都按名称排序，归并后逐项处理，
+        不为整个目录建立逐项的字典，内存只随紧凑列表增长；需要按内容指纹判断的少数文件在本层比对完后批量计算
+        :param rel_path: 相对同步根目录的路径（状态库的键）
+        :param remote_empty: 远程目录尚不存在（将在执行时创建），无需列出
+        """
+        # 增量模式下，已同步过的目录以状态库记录代替远程列表
+        incremental = not remote_empty and (not self._full_verify) and self.state.has_dir(self._profile, rel_path)
+        if remote_empty:
+            remote_items = ()
+        elif incremental:
+            remote_items = self.state.iter_children(self._profile, rel_path)
+        else:
+            # 首次需要比对远程修改时间前测量一次服务器时钟偏差
+            if not self._mtime_probed:
+                self._session.run(self._mtime.probe_session, remote_path)
+                self._mtime_probed = True
+            # 获取带元数据的文件列表
+            remote_items = self._get_remote_items_with_meta(remote_path).items()
+        # 被忽略的条目两端都跳过：本地的不上传（也不stat），远程的不删除、不列出
+        skip = self._ignore.for_dir(rel_path)
+        if skip is not None:
+            remote_items = ((name, meta) for name, meta in remote_items if not skip(name, meta['type'] == 'dir'))
+        # 下载中断留下的临时文件不上传
+        local_items = (entry for entry in list_local_dir(local_path, skip)
+                       if entry.is_dir or not entry.name.endswith(PART_SUFFIX))
+        plan.visited_dirs.append(rel_path)
+        # 大小未变而修改时间变化、或长度增加的文件 {名称: (本地条目, 远程元数据, 状态库记录)}
+        deferred = {}
+
+        for name, local_entry, remote_meta in merge_by_name(local_items, remote_items):
+            remote_item = f"{remote_path.rstrip('/')}/{name}"
+            item_rel = self._join_rel(rel_path, name)
+            if local_entry is None:
+                # 本地不存在的远程条目
+                plan.add(SyncAction(ACTION_DELETE, item_rel, remote_item, item_type=remote_meta['type']))
+            elif local_entry.is_dir:
+                # 处理目录：远程不存在的计划创建，其内容无需再列出
+                exists = bool(remote_meta) and remote_meta['type'] == 'dir'
+                if not exists:
+                    plan.add(SyncAction(ACTION_MKDIR, item_rel, remote_item, item_type='dir'))
+                # 增量模式下未记录的目录多为新目录，但状态库中有其子项时（上次中断）仍需列出
+                sub_empty = not exists and (not incremental or not self.state.has_children(self._profile, item_rel))
+                self._plan_tree(plan, local_entry.path, remote_item, item_rel, remote_empty=sub_empty)
+            else:
+                record = None
+                if self.state:
+                    record = remote_meta if incremental else self.state.get(self._profile, item_rel)
+                if self._needs_content_check(local_entry, record):
+                    deferred[name] = (local_entry, remote_meta, record)
+                else:
+                    self._plan_file(plan, item_rel, remote_item, local_entry, remote_meta, record, incremental)
+
+        if not deferred:
+            return
+        local_entries = {name: entry for name, (entry, _, _) in deferred.items()}
+        records = {name: record for name, (_, _, record) in deferred.items()}
+        # 大小相同但修改时间变化的文件，按内容指纹判断是否真的改变（如从备份恢复的文件）
+        same_content = self._unchanged_by_content(local_entries, records)
+        # 只在末尾追加了内容的文件（如日志），执行时只上传新增部分
+        remote_metas = None if incremental else {name: meta for name, (_, meta, _) in deferred.items() if meta}
+        appended = self._appended_files(local_entries, records, remote_metas)
+        for name, (local_entry, remote_meta, record) in deferred.items():
+            self._plan_file(plan, self._join_rel(rel_path, name), f"{remote_path.rstrip('/')}/{name}",
+                            local_entry, remote_meta, record, incremental,
+                            same_content=name in same_content, append_from=appended.get(name))
+
+    def _needs_content_check(self, local_entry: LocalEntry, record: Optional[dict]) -> bool:
+        """
+        文件是否需要按内容指纹判断：与上次上传时相比大小未变而修改时间变化（可能内容未变），
+        或长度增加（可能只追加了内容）
+        """
+        return bool(record) and record['type'] == 'file' \
+            and not self._matches_state(local_entry, record) \
+            and record['size'] <= local_entry.size \
+            and self.fingerprints.is_comparable(record['fingerprint'])
+
+    def _plan_file(self, plan: SyncPlan, item_rel: str, remote_item: str, local_entry: LocalEntry,
+                   remote_meta: Optional[dict], record: Optional[dict], incremental: bool,
+                   same_content: bool = False, append_from: Optional[int] = None):
+        """
+        为单个本地文件生成上传或跳过动作；无需任何处理的文件只计数
+        :param remote_meta: 远程元数据（增量模式下为状态库记录）
+        :param same_content: 内容指纹与上次上传时一致
+        :param append_from: 只在末尾追加了内容时为上次上传的长度
+        """
+        unchanged = self._matches_state(local_entry, record) or same_content
+        if incremental:
+            needs_sync = not unchanged
+        else:
+            needs_sync = self._needs_sync(local_entry, remote_meta) and not (
+                remote_meta and remote_meta['size'] == local_entry.size and unchanged
+            )
+        if needs_sync:
+            # 有远程列表时记下远程大小，续传时无需再查询
+            if incremental:
+                remote_size = None
+            else:
+                remote_size = remote_meta['size'] if remote_meta and remote_meta['type'] == 'file' else 0
+            plan.add(SyncAction(ACTION_UPLOAD, item_rel, remote_item, local_entry,
+                                verify_first=self._should_verify_remote(local_entry, remote_meta),
+                                remote_size=remote_size, append_from=append_from))
+        elif self.state and not self._matches_state(local_entry, record):
+            # 内容未变但状态库记录过期，执行时更新记录
+            fingerprint = record['fingerprint'] if same_content else None
+            remote_mtime = (remote_meta['mtime'] or None) if remote_meta and not incremental else None
+            plan.add(SyncAction(ACTION_SKIP, item_rel, remote_item, local_entry, fingerprint=fingerprint,
+                                remote_mtime=remote_mtime))
+        elif self.state and not record['fingerprint']:
+            # 传输后未计算指纹的文件（完整模式），执行时补算并更新记录
+            plan.add(SyncAction(ACTION_SKIP, item_rel, remote_item, local_entry, remote_mtime=record['remote_mtime']))
+        else:
+            plan.unchanged += 1
+
+    def _local_index(self) -> Dict[str, LocalEntry]:
+        """把本次扫描的本地目录树展开为 {相对路径: 条目}（忽略下载中断留下的临时文件）"""
+        index = {}
+        for rel_dir, entries in self._local_tree.items():
+            for entry in entries:
+                if entry.is_dir or not entry.name.endswith(PART_SUFFIX):
+                    index[self._join_rel(rel_dir, entry.name)] = entry
+        return index
+
+    def _remote_index(self, remote_path: str) -> Dict[str, dict]:
+        """把整个远程目录树展开为 {相对路径: 元数据}，各目录列表优先从预取的清单读取"""
+        index = {}
+        pending = ['']
+        while pending:
+            rel_dir = pending.pop()
+            skip = self._ignore.for_dir(rel_dir)
+            for name, meta in self._get_remote_items_with_meta(self._remote_join(remote_path, rel_dir)).items():
+                if skip is not None and skip(name, meta['type'] == 'dir'):
+                    continue
+                rel = self._join_rel(rel_dir, name)
+                index[rel] = meta
+                if meta['type'] == 'dir':
+                    pending.append(rel)
+        return index
+
+    @staticmethod
+    def _has_ancestor(rel_path: str, paths: set) -> bool:
+        """相对路径的某一级上级目录是否在集合中"""
+        while '/' in rel_path:
+            rel_path = rel_path.rsplit('/', 1)[0]
+            if rel_path in paths:
+                return True
+        return False
+
+    @staticmethod
+    def _download_action(rel_path: str, remote_item: str, local_item: str, remote_meta: dict,
+                         conflict_copy: bool = False) -> SyncAction:
+        """生成下载动作：local_item为写入的本地路径，conflict_copy表示下载为冲突副本"""
+        local_entry = LocalEntry(os.path.basename(local_item), local_item, False, remote_meta['size'])
+        return SyncAction(ACTION_DOWNLOAD, rel_path, remote_item, local_entry, remote_size=remote_meta['size'],
+                          remote_mtime=remote_meta['mtime'] or None,
+                          target_path=local_item if conflict_copy else None)
+
+    def _plan_pull(self, plan: SyncPlan, local_path: str, remote_path: str) -> bool:
+        """
+        比对整个远程目录树与本地目录树，生成远程到本地的计划：
+        本地多余或类型不同的条目删除，缺少的目录创建，大小或修改时间与远程不同的文件下载
+        :return: 远程没有任何文件而本地有文件时返回False，不生成计划
+        """
+        local_items = self._local_index()
+        remote_items = self._remote_index(remote_path)
+        # 远程没有任何文件时不同步（避免远程目录被误清空或挂载失败时清空本地），与推送时的has_files对应
+        if not self._has_remote_file(remote_items) and any(not entry.is_dir for entry in local_items.values()):
+            self._progress.finish("远程没有文件，不清空本地")
+            return False
+        records = self.state.entries(self._profile) if self.state else {}
+
+        # 1. 本地多余的条目（父目录在前，已删除目录的子项跳过）
+        removed = set()
+        for rel in sorted(local_items):
+            entry = local_items[rel]
+            if self._has_ancestor(rel, removed):
+                continue
+            remote_meta = remote_items.get(rel)
+            if remote_meta is None or remote_meta['type'] != entry.type:
+                plan.add(SyncAction(ACTION_LOCAL_DELETE, rel, self._remote_join(remote_path, rel), entry,
+                                    item_type=entry.type))
+                removed.add(rel)
+
+        # 2. 按远程目录树建目录、下载文件
+        for rel in sorted(remote_items):
+            remote_meta = remote_items[rel]
+            remote_item = self._remote_join(remote_path, rel)
+            local_item = os.path.join(local_path, *rel.split('/'))
+            entry = None if rel in removed or self._has_ancestor(rel, removed) else local_items.get(rel)
+            if remote_meta['type'] == 'dir':
+                if entry is None:
+                    plan.add(SyncAction(ACTION_LOCAL_MKDIR, rel, remote_item,
+                                        LocalEntry(os.path.basename(local_item), local_item, True), item_type='dir'))
+                plan.visited_dirs.append(rel)
+            elif entry is not None and self._same_as_remote(entry, remote_meta):
+                if self.state and not self._matches_state(entry, records.get(rel)):
+                    plan.add(SyncAction(ACTION_SKIP, rel, remote_item, entry,
+                                        remote_mtime=remote_meta['mtime'] or None))
+                else:
+                    plan.unchanged += 1
+            else:
+                plan.add(self._download_action(rel, remote_item, local_item, remote_meta))
+        return True
+
+    @staticmethod
+    def _has_remote_file(remote_items: Dict[str, dict]) -> bool:
+        """远程目录树中是否有文件"""
+        return any(meta['type'] == 'file' for meta in remote_items.values())
+
+    @staticmethod
+    def _same_as_remote(local_entry: LocalEntry, remote_meta: dict) -> bool:
+        """
+        本地文件是否与远程一致：大小相同且修改时间相同（下载时本地修改时间设为远程修改时间），
+        远程修改时间未知时只比较大小
+        """
+        if local_entry.size != remote_meta['size']:
+            return False
+        return not remote_meta['mtime'] or abs(local_entry.mtime - remote_meta['mtime']) <= MTIME_TOLERANCE
+
+    def _plan_bidirectional(self, plan: SyncPlan, local_path: str, remote_path: str) -> bool:
+        """
+        三方比对本地目录树、远程目录树和状态库中上次同步的记录，生成双向同步计划：
+        一端新增或修改的条目同步到另一端，一端删除且另一端未修改的条目在另一端删除，
+        两端都修改的文件按冲突处理
+        :return: 远程没有任何文件而本地有上次同步过的文件时返回False，不生成计划
+        """
+        if not self._mtime_probed:
+            self._session.run(self._mtime.probe_session, remote_path)
+            self._mtime_probed = True
+        local_items = self._local_index()
+        remote_items = self._remote_index(remote_path)
+        records = self.state.entries(self._profile)
+        # 远程整个被清空（或挂载失败）时不把"远程删除"传播到本地
+        if not self._has_remote_file(remote_items) and any(
+                not entry.is_dir and rel in records for rel, entry in local_items.items()):
+            self._progress.finish("远程没有文件，不删除本地已同步的文件")
+            return False
+        local_keys = sorted(local_items)
+        remote_keys = sorted(remote_items)
+        # 整体删除的目录及类型冲突（一端是文件、一端是目录）的路径，其子项不再处理
+        excluded = set()
+
+        # 1. 目录（父目录在前）
+        dirs = {rel for rel, entry in local_items.items() if entry.is_dir}
+        dirs.update(rel for rel, meta in remote_items.items() if meta['type'] == 'dir')
+        for rel in sorted(dirs):
+            if self._has_ancestor(rel, excluded):
+                continue
+            entry = local_items.get(rel)
+            remote_meta = remote_items.get(rel)
+            remote_item = self._remote_join(remote_path, rel)
+            local_item = os.path.join(local_path, *rel.split('/'))
+            if entry is not None and remote_meta is not None:
+                if entry.type != remote_meta['type']:
+                    plan.failures[remote_item] = "本地与远程类型不同，跳过"
+                    excluded.add(rel)
+                else:
+                    plan.visited_dirs.append(rel)
+                continue
+            record = records.get(rel)
+            synced = bool(record) and record['type'] == 'dir'
+            if entry is not None:
+                # 远程没有该目录：上次同步过且本地子树未变化说明是远程删除的，否则是本地新建的
+                if synced and not self._local_subtree_changed(rel, local_keys, local_items, records):
+                    plan.add(SyncAction(ACTION_LOCAL_DELETE, rel, remote_item, entry, item_type='dir'))
+                    excluded.add(rel)
+                else:
+                    plan.add(SyncAction(ACTION_MKDIR, rel, remote_item, item_type='dir'))
+                    plan.visited_dirs.append(rel)
+            else:
+                if synced and not self._remote_subtree_changed(rel, remote_keys, remote_items, records):
+                    plan.add(SyncAction(ACTION_DELETE, rel, remote_item, item_type='dir'))
+                    excluded.add(rel)
+                else:
+                    plan.add(SyncAction(ACTION_LOCAL_MKDIR, rel, remote_item,
+                                        LocalEntry(os.path.basename(local_item), local_item, True), item_type='dir'))
+                    plan.visited_dirs.append(rel)
+
+        # 2. 文件
+        files = {rel for rel, entry in local_items.items() if not entry.is_dir}
+        files.update(rel for rel, meta in remote_items.items() if meta['type'] == 'file')
+        files.update(rel for rel, record in records.items() if record['type'] == 'file')
+        files = sorted(rel for rel in files if rel not in excluded and not self._has_ancestor(rel, excluded))
+        # 大小相同、仅修改时间变化的本地文件按指纹判断内容是否真的改变
+        candidates = {rel: local_items[rel] for rel in files
+                      if rel in local_items and not local_items[rel].is_dir and rel in records}
+        same_content = self._unchanged_by_content(candidates, {rel: records[rel] for rel in candidates})
+
+        for rel in files:
+            entry = local_items.get(rel)
+            remote_meta = remote_items.get(rel)
+            if (entry is not None and entry.is_dir) or (remote_meta is not None and remote_meta['type'] == 'dir'):
+                # 上次同步的文件在一端变成了目录，已在比对目录时处理
+                continue
+            record = records.get(rel)
+            if record is not None and record['type'] != 'file':
+                record = None
+            remote_item = self._remote_join(remote_path, rel)
+            local_item = os.path.join(local_path, *rel.split('/'))
+            local_changed = entry is not None and not (self._matches_state(entry, record) or rel in same_content)
+            remote_changed = remote_meta is not None and self._remote_changed(remote_meta, record)
+
+            if entry is not None and remote_meta is not None:
+                if not local_changed and not remote_changed:
+                    if rel in same_content or not record['fingerprint']:
+                        # 内容未变但状态库记录过期，或传输后未计算指纹（完整模式），执行时更新记录
+                        plan.add(SyncAction(ACTION_SKIP, rel, remote_item, entry, fingerprint=record['fingerprint'],
+                                            remote_mtime=record['remote_mtime']))
+                    else:
+                        plan.unchanged += 1
+                elif not remote_changed:
+                    plan.add(SyncAction(ACTION_UPLOAD, rel, remote_item, entry, remote_size=remote_meta['size']))
+                elif not local_changed:
+                    plan.add(self._download_action(rel, remote_item, local_item, remote_meta))
+                elif self._same_file(entry, remote_meta):
+                    # 两端的变化相同（或首次同步时两端已一致）
+                    plan.add(SyncAction(ACTION_SKIP, rel, remote_item, entry,
+                                        remote_mtime=remote_meta['mtime'] or None))
+                else:
+                    self._plan_conflict(plan, rel, entry, remote_meta, remote_item, local_item)
+            elif entry is not None:
+                if record is None or local_changed:
+                    plan.add(SyncAction(ACTION_UPLOAD, rel, remote_item, entry, remote_size=0))
+                else:
+                    plan.add(SyncAction(ACTION_LOCAL_DELETE, rel, remote_item, entry))
+            elif remote_meta is not None:
+                if record is None or remote_changed:
+                    plan.add(self._download_action(rel, remote_item, local_item, remote_meta))
+                else:
+                    plan.add(SyncAction(ACTION_DELETE, rel, remote_item))
+            else:
+                plan.forgotten.append(rel)
+        # 两端都已删除的目录
+        plan.forgotten.extend(rel for rel, record in records.items()
+                              if record['type'] == 'dir' and rel not in dirs)
+        return True
+
+    def _plan_conflict(self, plan: SyncPlan, rel_path: str, local_entry: LocalEntry, remote_meta: dict,
+                       remote_item: str, local_item: str):
+        """两端都修改过的文件：修改时间较新的版本胜出，另一版本以冲突副本的形式保留在本地"""
+        copy_path = self._conflict_path(local_item)
+        remote_newer = bool(remote_meta['mtime']) and remote_meta['mtime'] - self._mtime.skew > local_entry.mtime
+        if remote_newer:
+            # 本地版本改名保留，再下载远程版本
+            plan.add(SyncAction(ACTION_CONFLICT, rel_path, remote_item, local_entry, target_path=copy_path))
+            plan.add(self._download_action(rel_path, remote_item, local_item, remote_meta))
+        else:
+            # 远程版本下载为副本，再上传本地版本
+            plan.add(SyncAction(ACTION_CONFLICT, rel_path, remote_item, target_path=copy_path))
+            plan.add(self._download_action(rel_path, remote_item, copy_path, remote_meta, conflict_copy=True))
+            plan.add(SyncAction(ACTION_UPLOAD, rel_path, remote_item, local_entry, remote_size=remote_meta['size']))
+
+    @staticmethod
+    def _conflict_path(local_item: str) -> str:
+        """冲突副本的路径：原文件名加上冲突时间，已存在时再加序号"""
+        root, ext = os.path.splitext(local_item)
+        base = f"{root}.conflict-{time.strftime('%Y%m%d-%H%M%S')}"
+        candidate = base + ext
+        n = 1
+        while os.path.lexists(candidate):
+            candidate = f"{base}-{n}{ext}"
+            n += 1
+        return candidate
+
+    @staticmethod
+    def _remote_changed(remote_meta: dict, record: Optional[dict]) -> bool:
+        """远程文件自上次同步后是否变化（上次的远程修改时间未知时只比较大小）"""
+        if not record or record['type'] != 'file':
+            return True
+        if remote_meta['size'] != record['size']:
+            return True
+        if remote_meta['mtime'] and record['remote_mtime']:
+            return abs(remote_meta['mtime'] - record['remote_mtime']) > MTIME_TOLERANCE
+        return False
+
+    def _same_file(self, local_entry: LocalEntry, remote_meta: dict) -> bool:
+        """没有可用的同步记录时，按大小和修改时间（扣除服务器时钟偏差）判断两端文件是否一致"""
+        return local_entry.size == remote_meta['size'] and bool(remote_meta['mtime']) \
+            and abs(remote_meta['mtime'] - self._mtime.skew - local_entry.mtime) <= MTIME_TOLERANCE
+
+    @staticmethod
+    def _subtree(keys: List[str], rel_path: str) -> List[str]:
+        """在已排序的相对路径中取出目录rel_path下的全部子项"""
+        return keys[bisect.bisect_left(keys, rel_path + '/'):bisect.bisect_left(keys, rel_path + '0')]
+
+    def _local_subtree_changed(self, rel_path: str, keys: List[str], local_items: Dict[str, LocalEntry],
+                               records: Dict[str, dict]) -> bool:
+        """本地目录下是否有上次同步后新增或修改的条目"""
+        for rel in self._subtree(keys, rel_path):
+            entry = local_items[rel]
+            record = records.get(rel)
+            if entry.is_dir:
+                if not record or record['type'] != 'dir':
+                    return True
+            elif not self._matches_state(entry, record):
+                return True
+        return False
+
+    def _remote_subtree_changed(self, rel_path: str, keys: List[str], remote_items: Dict[str, dict],
+                                records: Dict[str, dict]) -> bool:
+        """远程目录下是否有上次同步后新增或修改的条目"""
+        for rel in self._subtree(keys, rel_path):
+            meta = remote_items[rel]
+            record = records.get(rel)
+            if meta['type'] == 'dir':
+                if not record or record['type'] != 'dir':
+                    return True
+            elif self._remote_changed(meta, record):
+                return True
+        return False
+
+    @staticmethod
+    def _join_rel(rel_path: str, name: str) -> str:
+        """拼接状态库相对路径"""
+        return f"{rel_path}/{name}" if rel_path else name
+
+    def _unchanged_by_content(self, local_items: Dict[str, LocalEntry], records: Dict[str, Optional[dict]]) -> set:
+        """找出大小未变、仅修改时间变化且内容指纹与上次上传一致的文件，返回其名称集合"""
+        candidates = {}
+        for name, record in records.items():
+            entry = local_items[name]
+            if record and record['type'] == 'file' and record['size'] == entry.size \
+                    and record['mtime_ns'] != entry.mtime_ns \
+                    and self.fingerprints.is_comparable(record['fingerprint']):
+                candidates[name] = entry
+        if not candidates:
+            return set()
+        digests = self.fingerprints.fingerprint_many(candidates.values())
+        return {name for name, entry in candidates.items()
+                if digests[entry.path] == records[name]['fingerprint']}
+
+    def _appended_files(self, local_items: Dict[str, LocalEntry], records: Dict[str, Optional[dict]],
+                        remote_items: Optional[Dict[str, dict]] = None) -> Dict[str, int]:
+        """
+        找出只在末尾追加了内容的文件：上次上传的长度内指纹未变，且远程仍是上次上传的长度，
+        返回 {名称: 上次上传的长度}；快速指纹只是初筛，执行时还要由服务器区间摘要确认（见_smart_upload）
+        :param remote_items: 远程列表，None表示没有列表（增量模式，执行时再确认远程长度）
+        """
+        candidates = {}
+        for name, record in records.items():
+            entry = local_items[name]
+            if not (record and record['type'] == 'file'
+                    and RESUME_MIN_SIZE <= record['size'] < entry.size
+                    and self.fingerprints.is_comparable(record['fingerprint'])):
+                continue
+            if remote_items is not None:
+                remote_meta = remote_items.get(name)
+                if not remote_meta or remote_meta['size'] != record['size']:
+                    continue
+            candidates[name] = (entry, record['size'])
+        if not candidates:
+            return {}
+        digests = self.fingerprints.fingerprint_prefixes(candidates.values())
+        return {name: length for name, (entry, length) in candidates.items()
+                if digests[entry.path] == records[name]['fingerprint']}
+
+    def _matches_state(self, local_entry: LocalEntry, record: Optional[dict]) -> bool:
+        """本地文件自上次成功上传后是否未变化"""
+        return bool(record) and record['type'] == 'file' \
+            and record['size'] == local_entry.size \
+            and record['mtime_ns'] == local_entry.mtime_ns
+
+    def _record_file(self, rel_path: str, local_entry: LocalEntry, fingerprint: Optional[str] = None,
+                     remote_mtime: Optional[float] = None):
+        """在状态库中记录文件已同步"""
+        if self.state:
+            self.state.record_file(self._profile, rel_path, local_entry.size,
+                                   local_entry.mtime_ns, fingerprint, remote_mtime)
+
+    def _should_verify_remote(self, local_entry: LocalEntry, remote_meta: Optional[dict]) -> bool:
+        """大小相同的大文件先用服务器端摘要校验，内容一致时无需重新上传"""
+        return bool(remote_meta) and remote_meta['type'] == 'file' \
+            and remote_meta['size'] == local_entry.size \
+            and local_entry.size >= VERIFY_MIN_SIZE and self.verifier.can_hash
+
+    def _upload_task(self, ftp: ftplib.FTP, action: SyncAction):
+        """上传任务（在工作连接上执行）"""
+        local_entry = action.local_entry
+        message = f"同步中: {action.name}"
+        sent = 0
+
+        def on_sent(n):
+            nonlocal sent
+            sent += n
+            self._report_progress(message, n)
+
+        try:
+            if action.verify_first and self.verifier.verify_file(ftp, local_entry.path, action.remote_path):
+                # 内容一致，只需补齐远程修改时间
+                self._mtime.set_remote_mtime(ftp, action.remote_path, local_entry.mtime)
+                message = f"跳过[校验一致]: {action.name}"
+            else:
+                self._smart_upload(ftp, local_entry.path, action.remote_path, local_entry, on_sent,
+                                   action.remote_size, action.append_from)
+        except Exception:
+            # 重试时撤销已计入的字节，并重新查询远程已有的长度（从中断处续传）
+            self._report_progress(message, -sent)
+            action.remote_size = None
+            raise
+        # 指纹和远程修改时间只在需要写入状态库时获取
+        if self.state:
+            self._record_file(action.rel_path, local_entry, self.fingerprints.known_fingerprint(local_entry),
+                              self._uploaded_mtime(ftp, action.remote_path, local_entry))
+        # 补齐未经回调计入的字节（续传跳过的部分、校验一致的文件），并计入完成的动作
+        self._report_progress(message, action.size - sent, 1)
+
+    def _transfer_task(self, ftp: ftplib.FTP, task, action: SyncAction):
+        """
+        执行单个上传或下载任务：连接错误照常抛出，由所在连接重新连接后重试；
+        其他错误（本地文件被删除或占用、远程权限不足等）不中断整个同步，记入重试队列
+        """
+        try:
+            task(ftp, action)
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            logger.info(f"传输失败，稍后重试 {action.remote_path}: {str(e)}")
+            with self._progress_lock:
+                self._retry_queue.append((task, action))
+
+    def _retry_failed(self, plan: SyncPlan):
+        """
+        其他传输都完成后再重试一次失败的传输（文件占用等暂时性问题可能已消失），
+        仍失败的记入plan.failures，不写状态库，下次同步时重新处理
+        """
+        failed, self._retry_queue = self._retry_queue, []
+        for task, action in failed:
+            self._dispatch(self._retry_task, task, action, plan.failures)
+        if failed and self._pool:
+            self._pool.wait()
+
+    def _retry_task(self, ftp: ftplib.FTP, task, action: SyncAction, failures: Dict[str, str]):
+        """重试一个失败的传输，仍失败时记入failures"""
+        try:
+            task(ftp, action)
+        except Exception as e:
+            if is_connection_error(e):
+                raise
+            with self._progress_lock:
+                failures[action.remote_path] = str(e)
+            # 计入完成的动作，进度仍能到达终点
+            self._report_progress(f"传输失败: {action.name}", items=1)
+
+    def _uploaded_mtime(self, ftp: ftplib.FTP, remote_path: str, local_entry: LocalEntry) -> Optional[float]:
+        """上传后远程文件的修改时间：能保留修改时间时即本地修改时间（整秒），双向同步时查询，否则为None"""
+        if self._mtime.preserves_mtime:
+            return float(int(local_entry.mtime))
+        if self._bidirectional:
+            return self._mtime.query_remote_mtime(ftp, remote_path) or None
+        return None
+
+    def _download_task(self, ftp: ftplib.FTP, action: SyncAction):
+        """下载任务（在工作连接上执行），冲突副本不记入状态库"""
+        message = f"下载中: {action.name}"
+        received = 0
+
+        def on_received(n):
+            nonlocal received
+            received += n
+            self._report_progress(message, n)
+
+        try:
+            self._retrieve(ftp, action.remote_path, action.local_entry.path, action.remote_size,
+                           action.remote_mtime, on_received)
+        except Exception:
+            # 重试时撤销已计入的字节（续传跳过的部分在重试完成时补齐）
+            self._report_progress(message, -received)
+            raise
+        if self.state and not action.target_path:
+            local_entry = stat_entry(action.local_entry.path)
+            self._record_file(action.rel_path, local_entry, self.fingerprints.known_fingerprint(local_entry),
+                              action.remote_mtime)
+        self._report_progress(message, action.size - received, 1)
+
+    def _retrieve(self, ftp: ftplib.FTP, remote_path: str, local_path: str, size: int,
+                  remote_mtime: Optional[float], callback=None) -> int:
+        """
+        下载远程文件：写入同目录下预分配空间的临时文件，完成后设置修改时间并原子替换目标文件，
+        中断时目标文件保持原样。大文件边下载边写传输日志，下次从日志中已落盘的位置用REST续传
+        :param size: 比对阶段得到的远程大小，实际下载长度不同时（远程文件正在变化）报错
+        :param callback: 每写入一段后以字节数调用
+        :return: 本次实际接收的字节数（不含续传跳过的部分）
+        """
+        part_path = local_path + PART_SUFFIX
+        mtime_ns = int((remote_mtime or 0) * 1e9)
+        # 服务器不支持REST时无法续传，不记日志
+        journal = self.journal if size >= RESUME_MIN_SIZE and self.capabilities.rest_stream else None
+        offset = 0
+        if journal:
+            record = journal.get(self._host, remote_path, size, mtime_ns, DIRECTION_DOWNLOAD)
+            if record and os.path.isfile(part_path) and os.path.getsize(part_path) >= record['offset']:
+                offset = record['offset']
+
+        with open(part_path, 'r+b' if offset else 'wb') as f:
+            if not offset:
+                preallocate(f, size)
+            f.seek(offset)
+            written = offset
+            checkpointed = offset
+
+            def on_received(n):
+                nonlocal written, checkpointed
+                written += n
+                if journal and written - checkpointed >= JOURNAL_INTERVAL:
+                    # 先落盘再写日志，断电后日志位置之前的数据也一定有效
+                    f.flush()
+                    os.fsync(f.fileno())
+                    checkpointed = written
+                    journal.checkpoint(self._host, remote_path, size, mtime_ns, written,
+                                       direction=DIRECTION_DOWNLOAD)
+                if callback:
+                    callback(n)
+
+            if journal:
+                journal.checkpoint(self._host, remote_path, size, mtime_ns, offset, direction=DIRECTION_DOWNLOAD)
+            ftp.voidcmd('TYPE I')
+            with ftp.transfercmd(f"RETR {remote_path}", offset or None) as conn:
+                receive_file(conn, f, on_received)
+                # 与retrbinary一致：加密连接先关闭TLS层
+                if hasattr(conn, 'unwrap'):
+                    conn.unwrap()
+            ftp.voidresp()
+            # 去掉预分配但未写入的部分
+            f.truncate(written)
+        if written != size:
+            raise IOError(f"下载长度 {written} 与远程列表中的大小 {size} 不一致: {remote_path}")
+
+        if remote_mtime:
+            os.utime(part_path, (remote_mtime, remote_mtime))
+        os.replace(part_path, local_path)
+        if journal:
+            journal.finish(self._host, remote_path, DIRECTION_DOWNLOAD)
+        return written - offset
+
+    def _delete_local_item(self, action: SyncAction, failures: Dict[str, str]):
+        """删除本地文件或目录（目录连同其内容），失败时以本地路径记入failures"""
+        path = action.local_entry.path
+        try:
+            if action.item_type == 'dir':
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+            if self.state:
+                self.state.remove(self._profile, action.rel_path)
+        except OSError as e:
+            failures[path] = str(e)
+        self._report_progress(f"清理本地: {action.name}", items=1)
+
+    def _rename_remote(self, plan: SyncPlan):
+        """
+        在主连接上依次执行计划中的远程改名（目录在前，目标的上级目录不存在时先创建）；
+        改名失败时改为计划中的替代方案：重新上传并删除原条目
+        """
+        for action in plan.renames:
+            try:
+                self._ensure_remote_directory(action.remote_path.rsplit('/', 1)[0] or '/')
+                self._session.run(ftplib.FTP.rename, action.source_path, action.remote_path)
+            except ftplib.all_errors as e:
+                logger.warning(f"改名失败，改为重新上传 {action.source_path} -> {action.remote_path}: {str(e)}")
+                self._rename_fallback(plan, action)
+                self._report_progress(f"改名失败: {action.name}", items=1)
+                continue
+            self._namespace.remove(action.source_path)
+            self._namespace.add(action.remote_path, action.item_type)
+            if self._manifest:
+                self._manifest.remove(action.source_path)
+            if self.state:
+                # 新位置的记录在执行完成后由跳过动作和已比对的目录写入
+                self.state.remove(self._profile, action.source_rel)
+            self._report_progress(f"改名: {action.name}", items=1)
+
+    def _rename_fallback(self, plan: SyncPlan, action: SyncAction):
+        """改名失败：撤销依赖改名的动作，恢复原有的建目录、上传和删除"""
+        adds, cancels = plan.rename_fallbacks.get(action.rel_path, ([], []))
+        for cancelled in cancels:
+            actions = plan.skips if cancelled.kind == ACTION_SKIP else plan.deletes
+            if cancelled in actions:
+                actions.remove(cancelled)
+                if cancelled.kind == ACTION_DELETE:
+                    self._progress.expand(items=-1)
+        for added in adds:
+            plan.add(added)
+            self._progress.expand(added.size, 0 if added.kind == ACTION_MKDIR else 1)
+
+    def _delete_remote(self, plan: SyncPlan):
+        """
+        执行计划中的远程删除：目录子树取自本次会话已有的列表（未列出的目录按层用连接池并行列出），
+        先并行删除全部文件，再按深度从深到浅逐层并行删除目录。
+        失败的条目记入plan.failures，含有失败条目的目录不再尝试删除，其状态库记录保留到下次同步重试
+        """
+        if not plan.deletes:
+            return
+        items = []
+        dir_roots = []
+        for action in plan.deletes:
+            items.append((action.remote_path, action.item_type))
+            if action.item_type == 'dir':
+                dir_roots.append(action.remote_path)
+        items.extend(self._remote_subtrees(dir_roots))
+        # 每个删除动作在计划时计1，这里补上子树中的条目数
+        self._progress.expand(items=len(items) - len(plan.deletes))
+
+        files = [path for path, item_type in items if item_type != 'dir']
+        for path in files:
+            self._dispatch(self._remove_task, path, 'file', plan.failures)
+        if self._pool:
+            self._pool.wait()
+        levels = {}
+        for path, item_type in items:
+            if item_type == 'dir':
+                levels.setdefault(path.count('/'), []).append(path)
+        for depth in sorted(levels, reverse=True):
+            for path in levels[depth]:
+                if self._failed_within(path, plan.failures):
+                    plan.failures[path] = "目录中有未能删除的条目"
+                    self._report_progress(f"清理远程: {path.rsplit('/', 1)[-1]}", items=1)
+                else:
+                    self._dispatch(self._remove_task, path, 'dir', plan.failures)
+            if self._pool:
+                self._pool.wait()
+
+        for action in plan.deletes:
+            if self.state and action.remote_path not in plan.failures:
+                self.state.remove(self._profile, action.rel_path)
+
+    def _remote_subtrees(self, roots: List[str]) -> List[tuple]:
+        """
+        返回各远程目录下的全部子项 [(路径, 类型)]：优先使用本次会话已有的列表或预取清单，
+        其余目录按层分发到连接池并行列出（MLSD，不逐项试探）
+        """
+        items = []
+        frontier = list(roots)
+        while frontier:
+            unknown = []
+            for path in frontier:
+                if self._namespace.children(path) is None:
+                    listing = self._manifest.listing(path) if self._manifest else None
+                    if listing is not None:
+                        self._namespace.add_listing(path, listing)
+                    else:
+                        unknown.append(path)
+            for path in unknown:
+                self._dispatch(self._list_task, path)
+            if unknown and self._pool:
+                self._pool.wait()
+            next_frontier = []
+            for path in frontier:
+                for name, item_type in self._namespace.children(path) or ():
+                    child = f"{path.rstrip('/')}/{name}"
+                    items.append((child, item_type))
+                    if item_type == 'dir':
+                        next_frontier.append(child)
+            frontier = next_frontier
+        return items
+
+    @staticmethod
+    def _failed_within(path: str, failures: Dict[str, str]) -> bool:
+        """目录下是否有删除失败的条目"""
+        prefix = path.rstrip('/') + '/'
+        return any(failed.startswith(prefix) for failed in failures)
+
+    def _list_task(self, ftp: ftplib.FTP, path: str):
+        """列目录任务（在工作连接上执行），结果记入会话的远程路径记录"""
+        self._namespace.add_listing(path, self._list_remote_dir(ftp, path))
+
+    def _remove_task(self, ftp: ftplib.FTP, path: str, item_type: str, failures: Dict[str, str]):
+        """删除单个远程文件（DELE）或空目录（RMD）的任务，失败时记入failures"""
+        try:
+            if item_type == 'dir':
+                ftp.rmd(path)
+            else:
+                ftp.delete(path)
+            self._namespace.remove(path)
+            if self._manifest:
+                self._manifest.remove(path)
+        except ftplib.all_errors as e:
+            if is_connection_error(e):
+                raise
+            with self._progress_lock:
+                failures[path] = str(e)
+        self._report_progress(f"清理远程: {path.rsplit('/', 1)[-1]}", items=1)
+
+    def _needs_sync(self, local_entry: LocalEntry, remote_meta: Optional[dict]) -> bool:
+        """判断文件是否需要同步"""
+        if not remote_meta:
+            return True  # 远程不存在
+        
+        # 1. 大小不同肯定需要同步
+        if local_entry.size != remote_meta['size']:
+            return True
+        
+        # 2. 修改时间（UTC、整秒精度，并考虑服务器时钟偏差）
+        if not self._mtime.is_current(local_entry.mtime, remote_meta['mtime']):
+            return True
+        
+        return False
+    def _smart_upload(self, ftp: ftplib.FTP, local_path: str, remote_path: str, local_entry: LocalEntry,
+                      callback=None, remote_size: Optional[int] = None, append_from: Optional[int] = None):
+        """
+        带校验的断点续传上传（完成后将远程修改时间设为本地修改时间）：
+        远程已有部分经服务器摘要或区间比对确认与本地一致后才追加，否则完整上传；
+        大文件上传过程中定期写传输日志，进程中断后下次同步从日志位置续传
+        :param callback: 每发送一段数据后以字节数调用，用于统计字节进度
+        :param remote_size: 比对阶段得到的远程文件大小（0表示不存在），None表示未知
+        :param append_from: 比对阶段确认本地只在该长度之后追加了内容，远程仍为该长度时只上传新增部分
+        """
+        # 1. 确定续传位置：追加写入的文件其前缀已由指纹确认，否则校验远程已有部分
+        if append_from and remote_size is None:
+            remote_size = remote_file_size(ftp, remote_path)
+        if append_from and remote_size == append_from:
+            # 快速指纹只取样头尾，中间被改写后又增长的文件也会被当作追加，由服务器区间摘要确认远程已有部分
+            confirmed = self.fingerprints.mode == MODE_FULL or \
+                self._remote_prefix_matches(ftp, local_path, remote_path, append_from)
+            offset = append_from if confirmed else 0
+        else:
+            offset = self._resume_offset(ftp, local_path, remote_path, local_entry, remote_size)
+
+        # 2. 追加或完整上传
+        if offset:
+            try:
+                self._store(ftp, 'APPE', local_path, remote_path, local_entry, offset, callback)
+            except ftplib.error_perm as e:
+                # 服务器不支持APPE时尝试REST+STOR（服务器支持REST时），仍失败则完整上传
+                try:
+                    if not self.capabilities.rest_stream:
+                        raise
+                    self._store(ftp, 'STOR', local_path, remote_path, local_entry, offset, callback, rest=True)
+                except ftplib.error_perm:
+                    logger.warning(f"续传失败，重新上传 {remote_path}: {str(e)}")
+                    offset = 0
+        if not offset:
+            self._store(ftp, 'STOR', local_path, remote_path, local_entry, 0, callback)
+        self._namespace.add(remote_path, 'file')
+        if self.journal and local_entry.size >= RESUME_MIN_SIZE:
+            self.journal.finish(self._host, remote_path)
+
+        # 3. 保留修改时间，下次比对时无需重新上传
+        if self._mtime:
+            self._mtime.set_remote_mtime(ftp, remote_path, local_entry.mtime)
+
+    def _store(self, ftp: ftplib.FTP, command: str, local_path: str, remote_path: str,
+               local_entry: LocalEntry, offset: int, callback=None, rest: bool = False):
+        """
+        从offset开始发送本地文件（STOR或APPE），大文件边发送边写传输日志；
+        只发送到扫描时的长度，文件在上传过程中继续增长的部分留到下次同步。
+        自行建立数据连接，普通连接用sendfile零拷贝发送，加密连接用复用缓冲区发送
+        :param callback: 每发送一段后以字节数调用
+        :param rest: 用REST指定远程写入位置（STOR续传）
+        """
+        journal = self.journal if local_entry.size >= RESUME_MIN_SIZE else None
+        if journal and offset and journal.get(self._host, remote_path, local_entry.size, local_entry.mtime_ns):
+            # 续传时保留日志中原有的位置和摘要：摘要只覆盖该位置之前的部分，不能随发送位置前移
+            journal = None
+        ftp.voidcmd('TYPE I')
+        with open(local_path, 'rb') as f, \
+                ftp.transfercmd(f"{command} {remote_path}", offset if rest else None) as conn:
+            # 从头上传且数据经过用户态（加密连接）时顺带计算已发送部分的摘要（与服务器摘要算法一致），
+            # 零拷贝发送和续传时只记录位置
+            algorithm = None
+            if journal and not offset and not can_sendfile(conn):
+                algorithm = self.verifier.hash_algorithm or self.verifier.x_algorithm
+            hasher = new_hasher(algorithm) if algorithm else None
+            sent = offset
+            checkpointed = offset
+
+            def on_sent(n, data):
+                nonlocal sent, checkpointed
+                sent += n
+                if hasher:
+                    hasher.update(data)
+                if journal and sent - checkpointed >= JOURNAL_INTERVAL:
+                    checkpointed = sent
+                    journal.checkpoint(self._host, remote_path, local_entry.size, local_entry.mtime_ns, sent,
+                                       algorithm, hasher.hexdigest() if hasher else None)
+                if callback:
+                    callback(n)
+
+            if journal:
+                journal.checkpoint(self._host, remote_path, local_entry.size, local_entry.mtime_ns, offset)
+            send_file(conn, f, offset, local_entry.size - offset, on_sent)
+            # 与storbinary一致：加密连接先关闭TLS层
+            if hasattr(conn, 'unwrap'):
+                conn.unwrap()
+        ftp.voidresp()
+
+    def _resume_offset(self, ftp: ftplib.FTP, local_path: str, remote_path: str, local_entry: LocalEntry,
+                       remote_size: Optional[int]) -> int:
+        """
+        确定续传位置：远程文件比本地短且已有部分与本地一致时返回其大小，否则返回0。
+        传输日志中有该文件的记录时，日志位置之前的部分用服务器摘要与日志中的摘要比对（无需重读本地），
+        其余部分用服务器区间摘要或区间下载与本地比对；没有日志记录时只接受服务器区间摘要
+        """
+        if local_entry.size < RESUME_MIN_SIZE:
+            # 小文件重新上传比校验已有部分更快
+            return 0
+        record = None
+        if self.journal:
+            record = self.journal.get(self._host, remote_path, local_entry.size, local_entry.mtime_ns)
+        if remote_size is None and record:
+            # 增量模式下没有远程列表，只为日志中记录过的中断上传查询大小
+            remote_size = remote_file_size(ftp, remote_path)
+        if not remote_size or remote_size >= local_entry.size:
+            return 0
+
+        try:
+            verified = 0
+            if record and record['digest'] and 0 < record['offset'] <= remote_size:
+                result = self.verifier.remote_digest(ftp, remote_path, 0, record['offset'])
+                if result and result[0] == record['algorithm']:
+                    if result[1] != record['digest']:
+                        return 0
+                    verified = record['offset']
+            if verified < remote_size:
+                if record:
+                    # 日志证明远程已有部分来自本地当前版本的中断上传，区间抽样比对即可
+                    matched = self.verifier.verify_range(ftp, local_path, remote_path, verified, remote_size)
+                else:
+                    # 来源不明的远程文件必须由服务器区间摘要确认
+                    matched = self._remote_prefix_matches(ftp, local_path, remote_path, remote_size)
+                if not matched:
+                    return 0
+        except (ftplib.error_perm, ftplib.error_temp) as e:
+            if is_connection_error(e):
+                raise
+            logger.warning(f"无法校验远程已有部分，重新上传 {remote_path}: {str(e)}")
+            return 0
+        return remote_size
+
+    def _remote_prefix_matches(self, ftp: ftplib.FTP, local_path: str, remote_path: str, length: int) -> bool:
+        """用服务器区间摘要确认远程文件的前length字节与本地一致，服务器不支持区间摘要或无法校验时返回False"""
+        try:
+            result = self.verifier.remote_digest(ftp, remote_path, 0, length)
+        except (ftplib.error_perm, ftplib.error_temp) as e:
+            if is_connection_error(e):
+                raise
+            logger.warning(f"无法校验远程已有部分，重新上传 {remote_path}: {str(e)}")
+            return False
+        return bool(result) and local_digest(local_path, result[0], 0, length) == result[1]
+
+    def _get_remote_items_with_meta(self, path: str) -> DirListing:
+        """获取远程文件列表（按名称排序的紧凑列表），优先从预取的目录清单读取"""
+        items = self._manifest.listing(path) if self._manifest else None
+        if items is None:
+            items = self._session.run(self._list_remote_dir, path)
+        self._namespace.add_listing(path, items)
+        return items
+
+    def _list_remote_dir(self, ftp: ftplib.FTP, path: str) -> DirListing:
+        """按服务器能力档案选用的命令列出远程目录"""
+        return list_remote_dir(ftp, path, self.capabilities.use_mlsd, self.capabilities.list_command)
+
+    def _is_remote_dir(self, path: str) -> bool:
+        """检查是否为远程目录（本次会话已知的路径直接按记录判断，未知时CWD试探后记下结果）"""
+        known = self._namespace.is_dir(path)
+        if known is not None:
+            return known
+        if self._session.run(remote_is_dir, path):
+            self._namespace.add(path, 'dir')
+            return True
+        return False
+
+
+def connect_ftp(ftp_config: dict, capabilities: Optional[ServerCapabilities] = None) -> ftplib.FTP:
+    """
+    按配置创建一条已登录的FTP连接
+    :param capabilities: 已协商的服务器能力，提供时按其设置编码（及OPTS UTF8），否则使用UTF-8
+    """
+    ftp = ftplib.FTP(
+        ftp_config['host'],
+        ftp_config['username'],
+        ftp_config['password'],
+        timeout=ftp_config.get('timeout', DEFAULT_TIMEOUT)
+    )
+    if capabilities is not None:
+        capabilities.apply(ftp)
+    else:
+        ftp.encoding = 'utf-8'
+    return ftp
+
+
+def connect_negotiated(ftp_config: dict):
+    """
+    创建一条已登录的FTP连接并取得服务器能力：能力档案库中有该主机未过期的档案时直接应用，
+    否则协商一次并保存
+    :return: (连接, 服务器能力)
+    """
+    ftp = connect_ftp(ftp_config)
+    profiles = ServerProfileStore(config.server_profiles_path())
+    try:
+        return ftp, profiles.load(ftp)
+    except Exception:
+        ftp.close()
+        raise
+    finally:
+        profiles.close()
+
+
+def save_server_profile(host: str, capabilities: ServerCapabilities):
+    """把会话中补充的服务器能力（如时钟偏差）写回能力档案库"""
+    profiles = ServerProfileStore(config.server_profiles_path())
+    try:
+        profiles.save(host, capabilities)
+    finally:
+        profiles.close()
+
+
+def run_sync(ftp_config: dict, sync_config: dict, local_path: str, remote_path: str,
+             progress_callback=None, full_verify: Optional[bool] = None,
+             paths: Optional[Iterable[str]] = None, dry_run: bool = False,
+             plan_callback=None, direction: Optional[str] = None) -> Optional[SyncPlan]:
+    """
+    按配置执行一次同步（图形界面和命令行共用）
+    :param ftp_config: 配置文件中的ftp部分
+    :param sync_config: 配置文件中的sync部分
+    :param progress_callback: 以ProgressSnapshot调用的进度回调（已按固定间隔合并）
+    :param paths: 只同步这些相对路径（监视模式），None表示同步整个目录树；只支持本地到远程的同步
+    :param dry_run: 只生成同步计划，不修改远程和本地
+    :param plan_callback: 比对完成、开始执行前以同步计划调用
+    :param direction: 同步方向（push/pull/both），None表示取sync.direction配置
+    :return: 同步计划
+    """
+    direction = direction or sync_config.get('direction', SYNC_PUSH)
+    if direction not in SYNC_DIRECTIONS:
+        raise ValueError(f"未知的同步方向: {direction}（可选 {'/'.join(SYNC_DIRECTIONS)}）")
+    if paths is not None and direction != SYNC_PUSH:
+        # 拉取和双向同步总是比对整个目录树，按本地变化触发时会删除刚在本地新建的文件
+        raise ValueError(f"只同步指定路径（监视模式）只支持push方向，当前为{direction}")
+    state = None
+    fingerprints = None
+    journal = None
+    try:
+        if sync_config.get('state_db', True):
+            state = SyncStateDB(
+                config.state_db_path(),
+                full_verify_days=sync_config.get('full_verify_days', 7)
+            )
+        fingerprints = FingerprintEngine(
+            sync_config.get('fingerprint', MODE_FAST),
+            cache_path=config.fingerprint_cache_path()
+        )
+        journal = TransferJournal(config.transfer_journal_path())
+        ftp, capabilities = connect_negotiated(ftp_config)
+        connect = lambda: connect_ftp(ftp_config, capabilities)
+        with ftp:
+            ftp.cwd(remote_path)
+
+            synchronizer = FTPSynchronizer(
+                ftp,
+                connection_factory=connect,
+                max_connections=ftp_config.get('connections', 1),
+                state=state,
+                fingerprints=fingerprints,
+                journal=journal,
+                capabilities=capabilities,
+                ignore_patterns=sync_config.get('ignore', ()),
+                retries=ftp_config.get('retries', DEFAULT_RETRIES),
+                keepalive=ftp_config.get('keepalive', KEEPALIVE_INTERVAL)
+            )
+            synchronizer.set_progress_callback(progress_callback)
+            synchronizer.set_plan_callback(plan_callback)
+            skew_known = capabilities.clock_skew is not None
+            try:
+                if direction == SYNC_PULL:
+                    return synchronizer.sync_remote_to_local(local_path, remote_path, dry_run=dry_run)
+                if direction == SYNC_BOTH:
+                    return synchronizer.sync_bidirectional(local_path, remote_path, dry_run=dry_run)
+                if paths is None:
+                    return synchronizer.sync_local_to_remote(local_path, remote_path, full_verify=full_verify,
+                                                             dry_run=dry_run)
+                return synchronizer.sync_paths(local_path, remote_path, paths)
+            finally:
+                if not skew_known and capabilities.clock_skew is not None:
+                    # 本次测得的时钟偏差写回能力档案，之后的会话不再上传探测文件
+                    save_server_profile(ftp.host, capabilities)
+    finally:
+        if state:
+            state.close()
+        if fingerprints:
+            fingerprints.close()
+        if journal:
+            journal.close()
@@ -0,0 +1,142 @@
+import errno
+import os
+import queue
+import socket
+import threading
+from typing import Callable, Optional
+
+try:
+    import ssl
+except ImportError:
+    ssl = None
+
+# 零拷贝发送时每次调用sendfile的字节数（同时决定进度回调的粒度）
+SENDFILE_CHUNK = 8 * 1024 * 1024
+# 加密连接发送及下载接收时复用的缓冲区大小
+BUFFER_SIZE = 1024 * 1024
+
+
+def can_sendfile(conn: socket.socket) -> bool:
+    """数据连接能否零拷贝发送（TLS加密的连接必须经过用户态加密，不能使用sendfile）"""
+    if ssl is not None and isinstance(conn, ssl.SSLSocket):
+        return False
+    return hasattr(os, 'sendfile')
+
+
+def _advise_sequential(f, offset: int, count: int):
+    """提示内核按顺序预读文件"""
+    if hasattr(os, 'posix_fadvise'):
+        try:
+            os.posix_fadvise(f.fileno(), offset, count, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+
+def send_file(conn: socket.socket, f, offset: int, count: int,
+              on_sent: Optional[Callable[[int, Optional[memoryview]], None]] = None) -> int:
+    """
+    从文件offset处发送count个字节到数据连接，返回实际发送的字节数（文件变短时可能少于count）。
+    普通连接使用sendfile由内核直接发送；加密连接由后台线程预读到两块复用的缓冲区，读盘与发送重叠
+    :param on_sent: 每发送一段后以 (字节数, 数据) 调用，零拷贝发送时数据为None
+    """
+    _advise_sequential(f, offset, count)
+    if can_sendfile(conn):
+        return _send_zero_copy(conn, f, offset, count, on_sent)
+    return _send_buffered(conn, f, offset, count, on_sent)
+
+
+def _send_zero_copy(conn: socket.socket, f, offset: int, count: int, on_sent) -> int:
+    """分段调用socket.sendfile，数据不经过Python对象"""
+    total = 0
+    while total < count:
+        sent = conn.sendfile(f, offset + total, min(SENDFILE_CHUNK, count - total))
+        if not sent:
+            break
+        total += sent
+        if on_sent:
+            on_sent(sent, None)
+    return total
+
+
+def _send_buffered(conn: socket.socket, f, offset: int, count: int, on_sent) -> int:
+    """双缓冲发送：后台线程readinto空闲缓冲区，主线程发送已填满的缓冲区"""
+    free = queue.Queue()
+    filled = queue.Queue()
+    for _ in range(2):
+        free.put(bytearray(BUFFER_SIZE))
+
+    def reader():
+        remaining = count
+        try:
+            f.seek(offset)
+            while remaining > 0:
+                buf = free.get()
+                if buf is None:
+                    return
+                n = f.readinto(memoryview(buf)[:min(BUFFER_SIZE, remaining)])
+                if not n:
+                    break
+                remaining -= n
+                filled.put((buf, n))
+        except Exception as e:
+            filled.put(e)
+            return
+        filled.put(None)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    total = 0
+    try:
+        while True:
+            item = filled.get()
+            if item is None:
+                break
+            if isinstance(item, Exception):
+                raise item
+            buf, n = item
+            view = memoryview(buf)[:n]
+            conn.sendall(view)
+            total += n
+            if on_sent:
+                on_sent(n, view)
+            view.release()
+            free.put(buf)
+    finally:
+        # 发送出错时让预读线程退出
+        free.put(None)
+        thread.join()
+    return total
+
+
+def preallocate(f, size: int):
+    """为下载的文件预先分配磁盘空间（减少碎片，空间不足时尽早失败），不支持时忽略"""
+    if size > 0 and hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(f.fileno(), 0, size)
+        except OSError as e:
+            # 文件系统不支持预分配时照常写入；空间不足直接报错
+            if e.errno == errno.ENOSPC:
+                raise
+
+
+def receive_file(conn: socket.socket, f, on_received: Optional[Callable[[int], None]] = None) -> int:
+    """
+    从数据连接接收到文件当前位置，直到服务器关闭连接，返回接收的字节数。
+    数据用recv_into读入一块复用的缓冲区后直接写入文件，不为每段数据创建新对象
+    :param on_received: 每写入一段后以字节数调用
+    """
+    buf = bytearray(BUFFER_SIZE)
+    view = memoryview(buf)
+    total = 0
+    try:
+        while True:
+            n = conn.recv_into(view)
+            if not n:
+                break
+            f.write(view[:n])
+            total += n
+            if on_received:
+                on_received(n)
+    finally:
+        view.release()
+    return total
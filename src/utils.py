@@ -1,10 +1,14 @@
 import os
 import sys
+import time
 
 APP_ICON_LINUX = "./img/icon.png"
 APP_ICON_WINDOWS = "./img/icon.ico"
 APP_ICON_MAC = "./img/icon.icns"
 
+# 定时同步频率对应的天数（每月简化按30天计算）
+SCHEDULE_DAYS = {'每天': 1, '每周': 7, '每月': 30}
+
 def resource_path(relative_path):
     """获取打包后的资源绝对路径"""
     if hasattr(sys, '_MEIPASS'):
@@ -38,4 +42,20 @@ def get_icon_path():
         else:
             return resource_path(APP_ICON_LINUX)
     
-    return icon_path
\ No newline at end of file
+    return icon_path
+
+def schedule_interval_seconds(frequency):
+    """定时同步间隔（秒），未知频率按每天处理，最小间隔为1小时（防止意外设置）"""
+    days = SCHEDULE_DAYS.get(frequency, 1)
+    return max(days * 24 * 60 * 60, 3600)
+
+def seconds_until(time_str, now=None):
+    """距离下一次到达HH:mm的秒数（今天已过则为明天同一时间）"""
+    now = time.localtime(now)
+    hour, minute = (int(part) for part in time_str.split(':')[:2])
+    target = hour * 3600 + minute * 60
+    current = now.tm_hour * 3600 + now.tm_min * 60 + now.tm_sec
+    delay = target - current
+    if delay <= 0:
+        delay += 24 * 60 * 60
+    return delay
\ No newline at end of file
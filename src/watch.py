@@ -0,0 +1,264 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import struct
+import sys
+import time
+from typing import Callable, Dict, Optional, Set
+
+from ignore import IGNORE_FILE, IgnoreMatcher
+from scanner import LocalScanner
+from session import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+# inotify事件掩码（见 <sys/inotify.h>）
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """基于inotify的本地目录树监视（仅Linux），通过ctypes调用libc，无需额外依赖"""
+    def __init__(self, root: str, ignore: Optional[IgnoreMatcher] = None):
+        """
+        :param ignore: 忽略规则，被忽略的目录不添加监视，被忽略的路径不报告变化
+        """
+        self.root = root
+        self.ignore = ignore
+        libc_name = ctypes.util.find_library('c')
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self._wd_paths = {}
+        self._add_tree('')
+
+    def _add_tree(self, rel_dir: str):
+        """为目录及其全部子目录添加监视"""
+        abs_dir = os.path.join(self.root, *rel_dir.split('/')) if rel_dir else self.root
+        for sub_rel, entries in LocalScanner(abs_dir, rel_dir, self.ignore).walk():
+            self._add_watch(sub_rel)
+
+    def _add_watch(self, rel_dir: str):
+        """为单个目录添加监视"""
+        abs_dir = os.path.join(self.root, *rel_dir.split('/')) if rel_dir else self.root
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(abs_dir), WATCH_MASK | IN_ONLYDIR)
+        if wd < 0:
+            # 目录可能已被删除，或达到max_user_watches上限
+            logger.warning(f"无法监视目录 {abs_dir}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._wd_paths[wd] = rel_dir
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """
+        等待最多timeout秒，返回发生变化的相对路径集合；
+        事件队列溢出或根目录被移走时返回None，表示需要完整同步
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        try:
+            data = os.read(self._fd, 256 * 1024)
+        except BlockingIOError:
+            return set()
+
+        changed = set()
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + name_len].rstrip(b'\0'))
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                return None
+            if mask & IN_IGNORED:
+                self._wd_paths.pop(wd, None)
+                continue
+            rel_dir = self._wd_paths.get(wd)
+            if rel_dir is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if rel_dir == '':
+                    return None
+                continue
+            rel = f"{rel_dir}/{name}" if rel_dir and name else (name or rel_dir)
+            if self.ignore:
+                if name == IGNORE_FILE:
+                    # 规则变化：重新读取规则，补充监视此前被忽略的目录，并完整同步一次
+                    self.ignore.invalidate()
+                    self._add_tree(rel_dir)
+                    return None
+                if self.ignore.ignores_path(rel, bool(mask & IN_ISDIR)):
+                    continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                # 新目录（包括移入的整个子树）需要补充监视
+                self._add_tree(rel)
+            changed.add(rel)
+        return changed
+
+    def close(self):
+        """关闭inotify文件描述符"""
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+class PollingWatcher:
+    """轮询方式的目录树监视（inotify不可用时的后备方案，只扫描本地，不访问服务器）"""
+    def __init__(self, root: str, interval: float = 10.0, ignore: Optional[IgnoreMatcher] = None):
+        """
+        :param ignore: 忽略规则，被忽略的目录不扫描
+        """
+        self.root = root
+        self.interval = interval
+        self.ignore = ignore
+        self._snapshot = self._scan()
+        self._next_poll = time.monotonic() + interval
+
+    def _scan(self) -> Dict[str, tuple]:
+        """记录每个条目的类型、大小和修改时间"""
+        snapshot = {}
+        for rel_dir, entries in LocalScanner(self.root, ignore=self.ignore).walk():
+            for entry in entries:
+                rel = f"{rel_dir}/{entry.name}" if rel_dir else entry.name
+                snapshot[rel] = (entry.is_dir, entry.size, entry.mtime_ns)
+        return snapshot
+
+    def read(self, timeout: float) -> Optional[Set[str]]:
+        """到达轮询时间时重新扫描并返回变化的相对路径集合，否则等待后返回空集合"""
+        wait = self._next_poll - time.monotonic()
+        if wait > 0:
+            time.sleep(min(wait, timeout))
+            if time.monotonic() < self._next_poll:
+                return set()
+        self._next_poll = time.monotonic() + self.interval
+        current = self._scan()
+        old, self._snapshot = self._snapshot, current
+        changed = {rel for rel in current.keys() ^ old.keys()}
+        for rel, meta in current.items():
+            previous = old.get(rel)
+            # 目录只关心增删，其修改时间随子项变化而变化
+            if previous is not None and previous != meta and not (meta[0] and previous[0]):
+                changed.add(rel)
+        if self.ignore and any(rel.rpartition('/')[2] == IGNORE_FILE for rel in changed):
+            # 规则变化：按新规则重新扫描，并完整同步一次
+            self.ignore.invalidate()
+            self._snapshot = self._scan()
+            return None
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(root: str, poll_interval: float = 10.0, ignore: Optional[IgnoreMatcher] = None):
+    """优先使用inotify，不可用（非Linux或初始化失败）时退回轮询"""
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(root, ignore)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"inotify不可用，改用轮询: {str(e)}")
+    return PollingWatcher(root, poll_interval, ignore)
+
+
+class ChangeDebouncer:
+    """合并变更事件：最后一次变化后安静debounce秒（最长max_delay秒）再一次性交出脏路径集合"""
+    def __init__(self, debounce: float = 2.0, max_delay: float = 30.0):
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.full_requested = False
+        self._paths = set()
+        self._first = None
+        self._last = None
+
+    def add(self, paths: Set[str], now: float):
+        """记录变化的路径"""
+        if not paths:
+            return
+        self._paths.update(paths)
+        if self._first is None:
+            self._first = now
+        self._last = now
+
+    def request_full(self, now: float):
+        """记录需要完整同步（事件丢失时）"""
+        self.full_requested = True
+        if self._first is None:
+            self._first = now
+        self._last = now
+
+    def ready(self, now: float) -> bool:
+        """是否到了提交的时间"""
+        if self._last is None:
+            return False
+        return now - self._last >= self.debounce or now - self._first >= self.max_delay
+
+    def take(self) -> Set[str]:
+        """取出并清空脏路径集合"""
+        paths, self._paths = self._paths, set()
+        self.full_requested = False
+        self._first = self._last = None
+        return paths
+
+
+def run_watch_loop(watcher, sync_paths: Callable[[Set[str]], bool], full_sync: Callable[[], bool],
+                   should_stop: Callable[[], bool], debounce: float = 2.0,
+                   full_interval: float = 24 * 3600):
+    """
+    监视主循环：变化的路径经合并去抖后交给sync_paths增量推送，
+    事件丢失或到达full_interval时执行full_sync完整核对。
+    回调返回False表示同步失败，对应路径按指数退避（同ResilientSession）稍后重试，同步成功后恢复
+    """
+    debouncer = ChangeDebouncer(debounce)
+    next_full = time.monotonic() + full_interval
+    # 连续失败的次数及下次允许重试的时间（服务器不可用时不在每个去抖周期都重新登录）
+    failures = 0
+    retry_at = 0.0
+    while not should_stop():
+        changes = watcher.read(timeout=0.5)
+        now = time.monotonic()
+        if changes is None:
+            debouncer.request_full(now)
+        else:
+            debouncer.add(changes, now)
+        if now < retry_at:
+            continue
+
+        if now >= next_full or (debouncer.full_requested and debouncer.ready(now)):
+            debouncer.take()
+            succeeded = full_sync()
+            if not succeeded:
+                debouncer.request_full(now)
+            next_full = now + full_interval
+        elif debouncer.ready(now):
+            paths = debouncer.take()
+            succeeded = sync_paths(paths)
+            if not succeeded:
+                debouncer.add(paths, now)
+        else:
+            continue
+        if succeeded:
+            failures = 0
+            retry_at = 0.0
+        else:
+            retry_at = time.monotonic() + backoff_delay(failures)
+            failures += 1